@@ -1,2 +1,2 @@
 # Importa o agente principal para exposição ao ADK
-from .agent import planner_agent
+from . import agent
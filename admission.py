@@ -0,0 +1,179 @@
+"""Controle de admissão das execuções do agente.
+
+Limita quantas execuções do ``runner.run_async`` rodam ao mesmo tempo no
+processo. As excedentes aguardam numa fila com escalonamento justo por
+``userId`` (round-robin entre usuários, FIFO dentro de cada usuário); quando a
+fila está cheia a requisição é recusada na hora, com uma estimativa de
+``Retry-After``, em vez de deixar todas as execuções ficarem lentas juntas.
+
+Deve ser usado a partir de um único event loop (sem locks).
+"""
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+# Configurações
+ADMISSION_MAX_CONCURRENT = int(os.getenv("ADMISSION_MAX_CONCURRENT", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "64"))
+ADMISSION_MAX_QUEUE_PER_USER = int(os.getenv("ADMISSION_MAX_QUEUE_PER_USER", "4"))
+ADMISSION_QUEUE_TIMEOUT = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))
+# Intervalo entre eventos de posição na fila enviados ao cliente SSE (segundos)
+ADMISSION_POSITION_INTERVAL = float(os.getenv("ADMISSION_POSITION_INTERVAL", "1"))
+# Duração inicial estimada de uma execução (segundos), usada no Retry-After
+ADMISSION_RUN_ESTIMATE = 10.0
+
+
+class AdmissionRejected(Exception):
+    """Fila cheia: a requisição deve ser recusada com 429"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """Vaga (ou lugar na fila) de uma requisição. Sempre chamar ``release()``."""
+
+    def __init__(self, controller: "AdmissionController", user_id: str):
+        self.controller = controller
+        self.user_id = user_id
+        self.enqueued_at = time.monotonic()
+        self.granted_at: Optional[float] = None
+        self.released = False
+        self._granted = asyncio.get_running_loop().create_future()
+
+    @property
+    def granted(self) -> bool:
+        return self._granted.done()
+
+    def position(self) -> int:
+        """Posição estimada na fila (0 quando já admitido)"""
+        return 0 if self.granted else self.controller.position(self)
+
+    async def wait(self, timeout: Optional[float] = None) -> bool:
+        """Aguarda a vaga por até ``timeout`` segundos; retorna se foi admitido"""
+        if not self.granted:
+            try:
+                await asyncio.wait_for(asyncio.shield(self._granted), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+        return self.granted
+
+    def release(self):
+        """Libera a vaga, ou sai da fila se ainda não foi admitido"""
+        if not self.released:
+            self.released = True
+            self.controller._release(self)
+
+    def _grant(self):
+        self.granted_at = time.monotonic()
+        self._granted.set_result(True)
+
+
+class AdmissionController:
+    """Semáforo global com fila justa por usuário."""
+
+    def __init__(self, max_concurrent: int = ADMISSION_MAX_CONCURRENT, max_queue: int = ADMISSION_MAX_QUEUE,
+                 max_queue_per_user: int = ADMISSION_MAX_QUEUE_PER_USER):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.in_flight = 0
+        self.queued = 0
+        # Ordem de atendimento: o primeiro usuário é o próximo a ser servido
+        self._queues: "OrderedDict[str, Deque[AdmissionTicket]]" = OrderedDict()
+        self._run_estimate = ADMISSION_RUN_ESTIMATE
+        self.admitted = 0
+        self.rejected = 0
+        self.abandoned = 0
+        self.total_wait = 0.0
+
+    def acquire(self, user_id: str) -> AdmissionTicket:
+        """Admite na hora, coloca na fila ou levanta ``AdmissionRejected``"""
+        if self.in_flight < self.max_concurrent and not self.queued:
+            ticket = AdmissionTicket(self, user_id)
+            self._admit(ticket)
+            return ticket
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise AdmissionRejected("Servidor sobrecarregado", self.retry_after())
+        user_queue = self._queues.get(user_id)
+        if user_queue is not None and len(user_queue) >= self.max_queue_per_user:
+            self.rejected += 1
+            raise AdmissionRejected("Muitas requisições em espera para este usuário", self.retry_after(len(user_queue)))
+        ticket = AdmissionTicket(self, user_id)
+        self._queues.setdefault(user_id, deque()).append(ticket)
+        self.queued += 1
+        return ticket
+
+    def position(self, ticket: AdmissionTicket) -> int:
+        """Quantas admissões acontecem antes deste ticket no round-robin, mais um"""
+        user_queue = self._queues.get(ticket.user_id)
+        if not user_queue or ticket not in user_queue:
+            return 0
+        index = user_queue.index(ticket)
+        ahead = index
+        before = True
+        for user_id, queue in self._queues.items():
+            if user_id == ticket.user_id:
+                before = False
+                continue
+            ahead += min(len(queue), index + (1 if before else 0))
+        return ahead + 1
+
+    def retry_after(self, waiting: Optional[int] = None) -> int:
+        """Segundos estimados até a fila andar ``waiting`` posições"""
+        waiting = self.queued if waiting is None else waiting
+        rounds = (waiting + 1) / max(1, self.max_concurrent)
+        return max(1, math.ceil(rounds * self._run_estimate))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "maxConcurrent": self.max_concurrent,
+            "maxQueue": self.max_queue,
+            "inFlight": self.in_flight,
+            "queued": self.queued,
+            "queuedUsers": len(self._queues),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "abandoned": self.abandoned,
+            "avgWaitMs": round(self.total_wait / self.admitted * 1000, 1) if self.admitted else 0.0,
+            "runEstimateSeconds": round(self._run_estimate, 2),
+        }
+
+    def _admit(self, ticket: AdmissionTicket):
+        self.in_flight += 1
+        self.admitted += 1
+        ticket._grant()
+        self.total_wait += ticket.granted_at - ticket.enqueued_at
+
+    def _release(self, ticket: AdmissionTicket):
+        if ticket.granted:
+            self.in_flight -= 1
+            # Média móvel da duração das execuções (estimativa do Retry-After)
+            duration = time.monotonic() - ticket.granted_at
+            self._run_estimate = 0.8 * self._run_estimate + 0.2 * duration
+        else:
+            user_queue = self._queues.get(ticket.user_id)
+            if user_queue is not None and ticket in user_queue:
+                user_queue.remove(ticket)
+                self.queued -= 1
+                self.abandoned += 1
+                if not user_queue:
+                    del self._queues[ticket.user_id]
+        self._dispatch()
+
+    def _dispatch(self):
+        while self.in_flight < self.max_concurrent and self._queues:
+            user_id, user_queue = next(iter(self._queues.items()))
+            ticket = user_queue.popleft()
+            self.queued -= 1
+            # Próximo usuário na vez; quem ainda tem pedidos vai para o fim
+            del self._queues[user_id]
+            if user_queue:
+                self._queues[user_id] = user_queue
+            self._admit(ticket)
@@ -8,7 +8,7 @@ import uuid
 # Third-party imports
 from dotenv import load_dotenv
 from google.adk.agents import LoopAgent
-from google.adk.agents import Agent, LlmAgent, SequentialAgent
+from google.adk.agents import Agent, LlmAgent, ParallelAgent, SequentialAgent
 from google.adk.artifacts import InMemoryArtifactService
 from google.adk.runners import Runner
 from google.adk.sessions import InMemorySessionService
@@ -16,6 +16,33 @@ from google.adk.tools import google_search
 
 load_dotenv() # Moved load_dotenv() to be earlier
 
+# 1. Backend de modelo: "gemini" (padrão) ou "fake" (fake_llm.FakeLlm, sem rede nem credenciais)
+AGENT_MODEL_BACKEND = os.getenv("AGENT_MODEL_BACKEND", "gemini").lower()
+GEMINI_MODEL = "gemini-2.5-flash"
+SPECIALIST_NAMES = ("research_specialist", "content_analyst", "creative_writer", "technical_expert", "content_refiner")
+# Especialistas executados em paralelo no modo "parallel" (agentMode do /run_sse)
+PARALLEL_SPECIALISTS = tuple(
+    name.strip() for name in os.getenv("PARALLEL_SPECIALISTS", "research_specialist,technical_expert").split(",")
+    if name.strip() in SPECIALIST_NAMES
+) or ("research_specialist", "technical_expert")
+
+def agent_model(agent_name: str):
+    """Modelo do agente: o Gemini ou o modelo falso com a mesma topologia de transferências.
+
+    Os dois registram o uso de tokens de cada chamada em nome do agente.
+    """
+    if AGENT_MODEL_BACKEND == "fake":
+        from fake_llm import FakeLlm
+        return FakeLlm(model="fake-llm", agent_name=agent_name, transfer_targets=list(SPECIALIST_NAMES))
+    from gemini_llm import UsageGemini
+    return UsageGemini(model=GEMINI_MODEL, agent_name=agent_name)
+
+if AGENT_MODEL_BACKEND == "fake":
+    # google_search é executado dentro do Gemini; o backend falso usa uma busca local determinística
+    from fake_llm import fake_search as search_tool
+else:
+    search_tool = google_search
+
 
 
 
@@ -27,7 +54,7 @@ load_dotenv() # Moved load_dotenv() to be earlier
 
 research_specialist = LlmAgent(
     name="research_specialist",
-    model="gemini-2.5-flash",
+    model=agent_model("research_specialist"),
     instruction="""You are a research specialist. Your role is to:
     1. Analyze the user's query to understand what information is needed
     2. Use Google search to find relevant, up-to-date information
@@ -35,13 +62,13 @@ research_specialist = LlmAgent(
     4. Provide sources and verify information accuracy
     
     Use the ReACT framework: Reason about what to search, Act by searching, Observe results, and iterate as needed.""",
-    tools=[google_search],
+    tools=[search_tool],
     description="Specializes in researching topics, finding current information, and fact-checking using web search"
 )
 
 content_analyst = LlmAgent(
     name="content_analyst",
-    model="gemini-2.5-flash",
+    model=agent_model("content_analyst"),
     instruction="""You are a content analyst. Your role is to:
     1. Analyze existing content for structure, clarity, and completeness
     2. Identify gaps, inconsistencies, or areas for improvement
@@ -54,7 +81,7 @@ content_analyst = LlmAgent(
 
 creative_writer = LlmAgent(
     name="creative_writer",
-    model="gemini-2.5-flash",
+    model=agent_model("creative_writer"),
     instruction="""You are a creative writer. Your role is to:
     1. Create engaging, well-structured content from scratch
     2. Adapt writing style to match the intended audience and purpose
@@ -67,7 +94,7 @@ creative_writer = LlmAgent(
 
 technical_expert = LlmAgent(
     name="technical_expert",
-    model="gemini-2.5-flash",
+    model=agent_model("technical_expert"),
     instruction="""You are a technical expert. Your role is to:
     1. Provide detailed technical explanations and solutions
     2. Break down complex concepts into understandable parts
@@ -80,7 +107,7 @@ technical_expert = LlmAgent(
 
 content_refiner = LlmAgent(
     name="content_refiner",
-    model="gemini-2.5-flash",
+    model=agent_model("content_refiner"),
     instruction="""You are a content refiner. Your role is to:
     1. Take existing content and improve it based on feedback
     2. Enhance clarity, flow, and readability
@@ -94,7 +121,7 @@ content_refiner = LlmAgent(
 # 3. Crie o agente coordenador com roteamento dinâmico
 root_agent = LlmAgent(
     name="intelligent_coordinator",
-    model="gemini-2.5-flash",
+    model=agent_model("intelligent_coordinator"),
     sub_agents=[research_specialist, content_analyst, creative_writer, technical_expert, content_refiner],
     instruction="""You are an intelligent coordinator that routes user requests to the most appropriate specialist agent.
 
@@ -120,3 +147,52 @@ Use transfer_to_agent() to route to the appropriate specialist. If the request i
 If you're unsure which agent to use, default to research_specialist for information gathering or creative_writer for content creation.""",
     description="Intelligently routes user requests to the most appropriate specialist agent based on the nature of the query"
 )
+
+# 4. Modo paralelo: especialistas independentes executam ao mesmo tempo e um agente consolida as respostas
+def parallel_branch(specialist: LlmAgent) -> LlmAgent:
+    """Cópia de um especialista para um ramo do ``ParallelAgent``.
+
+    Um agente do ADK só tem um pai, então o ramo é um novo ``LlmAgent`` com a
+    mesma configuração. A resposta fica no estado da sessão (``<nome>_output``)
+    para a consolidação e o ramo não transfere para outros agentes.
+    """
+    return LlmAgent(
+        name=specialist.name,
+        model=agent_model(specialist.name),
+        instruction=specialist.instruction,
+        description=specialist.description,
+        tools=list(specialist.tools),
+        output_key=f"{specialist.name}_output",
+        disallow_transfer_to_parent=True,
+        disallow_transfer_to_peers=True,
+    )
+
+_specialists = {agent.name: agent for agent in root_agent.sub_agents}
+
+parallel_specialists = ParallelAgent(
+    name="parallel_specialists",
+    sub_agents=[parallel_branch(_specialists[name]) for name in PARALLEL_SPECIALISTS],
+    description="Runs independent specialists concurrently on the same request"
+)
+
+response_merger = LlmAgent(
+    name="response_merger",
+    model=agent_model("response_merger"),
+    instruction="""You are a response merger. Several specialists worked on the user's request in parallel:
+
+""" + "\n\n".join(f"**{name}**:\n{{{name}_output?}}" for name in PARALLEL_SPECIALISTS) + """
+
+Combine their outputs into a single, coherent answer to the user's request:
+1. Keep every relevant fact, source, and technical detail
+2. Remove repetition and resolve contradictions, preferring verified information
+3. Organize the answer so that it addresses every part of the request""",
+    description="Combines the outputs of the parallel specialists into a single answer",
+    disallow_transfer_to_parent=True,
+    disallow_transfer_to_peers=True
+)
+
+parallel_root_agent = SequentialAgent(
+    name="parallel_coordinator",
+    sub_agents=[parallel_specialists, response_merger],
+    description="Runs independent specialists in parallel and merges their outputs, for compound requests"
+)
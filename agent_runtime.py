@@ -0,0 +1,427 @@
+"""Runtime compartilhado do ADK.
+
+Mantém um único ``Runner`` e um único ``DatabaseSessionService`` (e, portanto,
+um único engine SQLAlchemy com seu pool de conexões) durante toda a vida do
+processo, em vez de reconstruí-los a cada mensagem.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+from typing import Dict, List, Optional
+
+import metrics
+import tracing
+
+logger = logging.getLogger("practia.runtime")
+
+# Configurações
+ADK_DB_URL = os.getenv("ADK_DB_URL", "sqlite:///./multi_agent_data.db")
+# Espera máxima (segundos) pelo lock de escrita do SQLite do ADK, compartilhado entre workers
+ADK_DB_BUSY_TIMEOUT = float(os.getenv("ADK_DB_BUSY_TIMEOUT", "10"))
+ADK_APP_NAME = os.getenv("ADK_APP_NAME", "Luminus")
+# "sse" ativa respostas parciais do modelo no caminho de streaming
+ADK_STREAMING_MODE = os.getenv("ADK_STREAMING_MODE", "none").lower()
+# Modo de execução: "route" (coordenador transfere para um especialista) ou
+# "parallel" (especialistas em paralelo + consolidação); escolhido por requisição
+AGENT_MODES = ("route", "parallel")
+AGENT_DEFAULT_MODE = os.getenv("AGENT_DEFAULT_MODE", "route").lower()
+
+
+class _ParallelSpanFilter(logging.Filter):
+    """O ``ParallelAgent`` do ADK avança cada ramo numa task própria, e os spans
+    do OpenTelemetry abertos num ramo são fechados em outro contexto: o
+    ``detach`` falha sem efeito no trace, mas registra um erro por evento."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        return record.getMessage() != "Failed to detach context"
+
+
+logging.getLogger("opentelemetry.context").addFilter(_ParallelSpanFilter())
+
+
+def resolve_agent_mode(mode: Optional[str]) -> str:
+    """Modo efetivo (``AGENT_DEFAULT_MODE`` quando não informado; ``route`` se desconhecido)"""
+    mode = (mode or AGENT_DEFAULT_MODE).lower()
+    return mode if mode in AGENT_MODES else "route"
+
+
+def agent_fingerprint(agent) -> str:
+    """Hash estável da topologia de agentes (nomes, modelos, instruções, ferramentas)"""
+    digest = hashlib.sha256()
+
+    def visit(node):
+        tools = [getattr(t, "name", None) or getattr(t, "__name__", None) or str(t) for t in getattr(node, "tools", None) or []]
+        for value in (
+            getattr(node, "name", ""),
+            type(node).__name__,
+            str(getattr(node, "model", "")),
+            str(getattr(node, "instruction", "")),
+            str(getattr(node, "description", "")),
+            ",".join(sorted(tools)),
+        ):
+            digest.update(value.encode("utf-8"))
+            digest.update(b"\0")
+        for child in getattr(node, "sub_agents", None) or []:
+            visit(child)
+        digest.update(b"\1")
+
+    visit(agent)
+    return digest.hexdigest()
+
+
+def enable_sqlite_wal(engine):
+    """WAL e busy timeout em todas as conexões do engine SQLite do ADK.
+
+    Com vários workers no mesmo arquivo, leituras não bloqueiam escritas e um
+    escritor espera o lock em vez de falhar com ``database is locked``.
+    """
+    from sqlalchemy import event
+
+    def configure(dbapi_connection, _record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute(f"PRAGMA busy_timeout={int(ADK_DB_BUSY_TIMEOUT * 1000)}")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+    event.listen(engine, "connect", configure)
+    # Conexões abertas pelo create_all do ADK ainda não têm os pragmas
+    engine.dispose()
+
+
+class AgentRuntime:
+    """Agrupa os Runners (um por modo), o serviço de sessões e o de artefatos do ADK.
+
+    Os modos compartilham o serviço de sessões: uma conversa pode alternar entre eles.
+    """
+
+    def __init__(self, db_url: str = ADK_DB_URL, app_name: str = ADK_APP_NAME, agent=None, parallel_agent=None):
+        from google.adk.artifacts import InMemoryArtifactService
+        from google.adk.runners import Runner
+        from google.adk.sessions import DatabaseSessionService
+        from google.genai import types
+
+        if agent is None:
+            from agent import parallel_root_agent, root_agent
+            agent, parallel_agent = root_agent, parallel_root_agent
+
+        self.app_name = app_name
+        self.agent = agent
+        self.agents = {"route": agent}
+        if parallel_agent is not None:
+            self.agents["parallel"] = parallel_agent
+        self.types = types
+        self.fingerprints = {mode: agent_fingerprint(mode_agent) for mode, mode_agent in self.agents.items()}
+        self.fingerprint = self.fingerprints["route"]
+        self.session_service = DatabaseSessionService(db_url=db_url)
+        if db_url.startswith("sqlite"):
+            enable_sqlite_wal(self.session_service.db_engine)
+        self.artifact_service = InMemoryArtifactService()
+        self.runners = {
+            mode: Runner(
+                app_name=app_name,
+                agent=mode_agent,
+                session_service=self.session_service,
+                artifact_service=self.artifact_service,
+            )
+            for mode, mode_agent in self.agents.items()
+        }
+        self.runner = self.runners["route"]
+        logger.info(f"[runtime] ADK runtime criado app={app_name} db={db_url} modos={list(self.agents)}")
+
+    def agent_for(self, mode: Optional[str] = None):
+        """Agente raiz do modo (o de ``route`` se o modo não está disponível)"""
+        return self.agents.get(resolve_agent_mode(mode), self.agent)
+
+    def fingerprint_for(self, mode: Optional[str] = None) -> str:
+        return self.fingerprints.get(resolve_agent_mode(mode), self.fingerprint)
+
+    def ensure_session(self, user_id: str, session_id: str):
+        """Obtém a sessão do ADK ou cria uma nova se não existir"""
+        current_session = None
+        try:
+            current_session = self.session_service.get_session(
+                app_name=self.app_name, user_id=user_id, session_id=session_id
+            )
+        except Exception:
+            current_session = None
+        if current_session is None:
+            try:
+                current_session = self.session_service.create_session(
+                    app_name=self.app_name, user_id=user_id, session_id=session_id
+                )
+            except Exception:
+                # Outro worker criou a mesma sessão entre a leitura e a criação
+                current_session = self.session_service.get_session(
+                    app_name=self.app_name, user_id=user_id, session_id=session_id
+                )
+                if current_session is None:
+                    raise
+        return current_session
+
+    def build_message(self, text: str):
+        """Formata o texto do usuário como ``types.Content``"""
+        return self.types.Content(role="user", parts=[self.types.Part.from_text(text=text)])
+
+    def run(self, message: str, user_id: str, session_id: str, run_config=None, mode: Optional[str] = None):
+        """Inicia ``runner.run_async`` do modo e retorna o gerador assíncrono de eventos"""
+        with tracing.span("adk.ensure_session", {"luminus.session_id": session_id}):
+            self.ensure_session(user_id, session_id)
+        kwargs = {"run_config": run_config} if run_config is not None else {}
+        runner = self.runners.get(resolve_agent_mode(mode), self.runner)
+        return runner.run_async(
+            user_id=user_id,
+            session_id=session_id,
+            new_message=self.build_message(message),
+            **kwargs,
+        )
+
+    def stream_run_config(self):
+        """RunConfig do caminho de streaming (``None`` usa o padrão do ADK)"""
+        if ADK_STREAMING_MODE != "sse":
+            return None
+        from google.adk.agents.run_config import RunConfig, StreamingMode
+        return RunConfig(streaming_mode=StreamingMode.SSE)
+
+    def close(self):
+        """Libera o pool de conexões do engine"""
+        try:
+            self.session_service.db_engine.dispose()
+        except Exception as e:
+            logger.warning(f"[runtime] Falha ao liberar engine: {e}")
+
+
+USAGE_FIELDS = ("promptTokenCount", "candidatesTokenCount", "totalTokenCount")
+
+
+def add_usage(total: Optional[Dict[str, int]], usage: Optional[Dict[str, int]]) -> Optional[Dict[str, int]]:
+    """Soma duas contagens de tokens (``None`` quando nada foi informado)"""
+    if not usage:
+        return total
+    if not total:
+        return {key: usage.get(key, 0) for key in USAGE_FIELDS}
+    return {key: total.get(key, 0) + usage.get(key, 0) for key in USAGE_FIELDS}
+
+
+def turn_usage(runs: List[Dict]) -> Optional[Dict]:
+    """Uso de tokens de um turno, total e por agente, a partir de ``AgentProgressTracker.summary()``.
+
+    Retorna ``None`` se o modelo não informou o uso em nenhuma chamada.
+    """
+    total = None
+    by_agent: Dict[str, Dict[str, int]] = {}
+    for run in runs:
+        if run.get("usage"):
+            by_agent[run["agent"]] = add_usage(by_agent.get(run["agent"]), run["usage"])
+            total = add_usage(total, run["usage"])
+    if total is None:
+        return None
+    return {**total, "byAgent": by_agent}
+
+
+def merge_turn_usage(total: Optional[Dict], usage: Optional[Dict]) -> Optional[Dict]:
+    """Acumula o uso de um turno (com ``byAgent``) sobre um total anterior"""
+    if not usage:
+        return total
+    by_agent = dict((total or {}).get("byAgent") or {})
+    for agent, agent_usage in (usage.get("byAgent") or {}).items():
+        by_agent[agent] = add_usage(by_agent.get(agent), agent_usage)
+    return {**add_usage(total, usage), "byAgent": by_agent}
+
+
+def usage_from_metadata(usage) -> Optional[Dict[str, int]]:
+    """Contagem de tokens de um ``usage_metadata`` do google-genai (``None`` se ausente)"""
+    if usage is None:
+        return None
+    return {
+        "promptTokenCount": getattr(usage, "prompt_token_count", None) or 0,
+        "candidatesTokenCount": getattr(usage, "candidates_token_count", None) or 0,
+        "totalTokenCount": getattr(usage, "total_token_count", None) or 0,
+    }
+
+
+def event_usage(event) -> Optional[Dict[str, int]]:
+    """Contagem de tokens de um evento do ADK, quando o evento a carrega"""
+    return usage_from_metadata(getattr(event, "usage_metadata", None))
+
+
+class ModelUsageSink:
+    """Uso de tokens registrado pelos modelos durante um turno, por agente.
+
+    O google-adk 0.1.0 descarta o ``usage_metadata`` da ``GenerateContentResponse``
+    (nem ``LlmResponse`` nem ``Event`` têm o campo): os modelos dos agentes
+    (``gemini_llm.UsageGemini`` e ``fake_llm.FakeLlm``) registram o uso de cada
+    chamada aqui, e o ``AgentProgressTracker`` o atribui à execução do agente.
+    """
+
+    def __init__(self):
+        self._pending: Dict[str, Dict[str, int]] = {}
+
+    def record(self, agent_name: str, usage: Optional[Dict[str, int]]):
+        if usage:
+            self._pending[agent_name] = add_usage(self._pending.get(agent_name), usage)
+
+    def take(self, agent_name: str) -> Optional[Dict[str, int]]:
+        """Uso registrado para o agente desde a última leitura"""
+        return self._pending.pop(agent_name, None)
+
+
+# Coletor do turno em execução. As tasks dos ramos de um ParallelAgent copiam o
+# contexto de quem itera o runner e registram no mesmo coletor.
+_model_usage: ContextVar[Optional[ModelUsageSink]] = ContextVar("luminus_model_usage", default=None)
+
+
+def record_model_usage(agent_name: str, usage: Optional[Dict[str, int]]):
+    """Registra o uso de uma chamada ao modelo no turno corrente (ignorado fora de um turno)"""
+    sink = _model_usage.get()
+    if sink is not None:
+        sink.record(agent_name, usage)
+
+
+class AgentProgressTracker:
+    """Converte os eventos do ``runner.run_async`` em eventos de status por agente.
+
+    Os agentes executam em sequência: cada um começa no último evento do agente
+    anterior (ou no início da execução) e termina no seu próprio último evento,
+    de modo que o tempo das chamadas ao modelo fica com quem as fez.
+    Transferências (``actions.transfer_to_agent``) viram eventos ``transfer``.
+
+    Eventos de ramos de um ``ParallelAgent`` (``event.branch``) intercalam
+    autores: cada autor do grupo tem a sua execução aberta, todas começando
+    junto com o grupo, até o próximo agente fora dos ramos.
+    """
+
+    def __init__(self, root_name: str):
+        self.root_name = root_name
+        self.current: Optional[Dict] = None
+        # Execuções abertas dos ramos paralelos, por autor, e o último evento de cada uma
+        self.parallel: Dict[str, Dict] = {}
+        self._last_seen: Dict[str, float] = {}
+        self.runs: List[Dict] = []
+        self._mark = time.time()
+        self._group_start = self._mark
+        # Uso de tokens informado pelos modelos durante a execução
+        self.model_usage = ModelUsageSink()
+        self._usage_token = None
+
+    def start(self) -> List[Dict]:
+        self._mark = time.time()
+        # Chamadas ao modelo feitas a partir deste contexto registram o uso neste turno
+        self._usage_token = _model_usage.set(self.model_usage)
+        return [{"type": "status", "agent": self.root_name, "state": "thinking", "timestamp": self._mark}]
+
+    def observe(self, event) -> List[Dict]:
+        updates = []
+        author = getattr(event, "author", None)
+        run = self.current
+        if author and author != "user":
+            if getattr(event, "branch", None):
+                run = self.parallel.get(author)
+                if run is None:
+                    if not self.parallel:
+                        # Início do grupo paralelo
+                        updates.extend(self._end_current(self._mark))
+                        self._group_start = self._mark
+                    run = self._start_run(author, self._group_start, updates)
+                    self.parallel[author] = run
+                self._last_seen[author] = time.time()
+            else:
+                updates.extend(self._end_parallel())
+                if self.current is None or self.current["agent"] != author:
+                    updates.extend(self._end_current(self._mark))
+                    self.current = self._start_run(author, self._mark, updates)
+                run = self.current
+        # Eventos parciais repetem a contagem da resposta final
+        usage = None
+        if not getattr(event, "partial", None) and author and author != "user":
+            recorded = self.model_usage.take(author)
+            # Versões do ADK que repassam o usage_metadata no evento dispensam o registrado pelo modelo
+            usage = event_usage(event) or recorded
+        if usage and run is not None:
+            run["usage"] = add_usage(run["usage"], usage)
+        actions = getattr(event, "actions", None)
+        target = getattr(actions, "transfer_to_agent", None) if actions is not None else None
+        if target:
+            updates.append({"type": "transfer", "from": author, "to": target, "timestamp": time.time()})
+        if author != "user":
+            self._mark = time.time()
+        return updates
+
+    def finish(self) -> List[Dict]:
+        updates = self._end_parallel() + self._end_current(time.time())
+        if self._usage_token is not None:
+            try:
+                _model_usage.reset(self._usage_token)
+            except ValueError:
+                # Encerrado a partir de outro contexto: o da execução termina com ela
+                pass
+            self._usage_token = None
+        return updates
+
+    def summary(self) -> List[Dict]:
+        return [dict(run) for run in self.runs]
+
+    def _start_run(self, author: str, started_at: float, updates: List[Dict]) -> Dict:
+        run = {"agent": author, "startedAt": started_at, "endedAt": None, "durationMs": None, "usage": None}
+        self.runs.append(run)
+        updates.append({"type": "status", "agent": author, "state": "executing", "startedAt": started_at, "timestamp": time.time()})
+        return run
+
+    def _end_parallel(self) -> List[Dict]:
+        updates = []
+        for author, run in self.parallel.items():
+            updates.extend(self._end_run(run, self._last_seen.get(author, time.time())))
+        self.parallel = {}
+        return updates
+
+    def _end_current(self, ended_at: float) -> List[Dict]:
+        if self.current is None:
+            return []
+        run = self.current
+        self.current = None
+        return self._end_run(run, ended_at)
+
+    def _end_run(self, run: Dict, ended_at: float) -> List[Dict]:
+        # Uso registrado depois do último evento não parcial do agente (ex.: chamada de ferramenta em streaming)
+        run["usage"] = add_usage(run["usage"], self.model_usage.take(run["agent"]))
+        run["endedAt"] = ended_at
+        run["durationMs"] = round((run["endedAt"] - run["startedAt"]) * 1000, 1)
+        metrics.AGENT_RUN_DURATION.labels(run["agent"]).observe(run["endedAt"] - run["startedAt"])
+        usage = run["usage"] or {}
+        tracing.record_span(f"agent {run['agent']}", run["startedAt"], run["endedAt"], {
+            "gen_ai.agent.name": run["agent"],
+            "gen_ai.usage.input_tokens": usage.get("promptTokenCount"),
+            "gen_ai.usage.output_tokens": usage.get("candidatesTokenCount"),
+        })
+        return [{"type": "status", "state": "done", "timestamp": run["endedAt"], **run}]
+
+
+_runtime: Optional[AgentRuntime] = None
+_runtime_lock = threading.Lock()
+
+
+def get_agent_runtime() -> AgentRuntime:
+    """Retorna o runtime do processo, criando-o na primeira chamada"""
+    global _runtime
+    if _runtime is None:
+        with _runtime_lock:
+            if _runtime is None:
+                _runtime = AgentRuntime()
+    return _runtime
+
+
+def current_agent_runtime() -> Optional[AgentRuntime]:
+    """Runtime do processo se já foi criado (não o cria nem espera a criação em andamento)"""
+    return _runtime
+
+
+def shutdown_agent_runtime():
+    """Encerra o runtime do processo (chamado no shutdown do app)"""
+    global _runtime
+    with _runtime_lock:
+        if _runtime is not None:
+            _runtime.close()
+            _runtime = None
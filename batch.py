@@ -0,0 +1,75 @@
+"""Execução em lote com paralelismo limitado (``POST /run_batch``).
+
+``run_bounded`` executa um worker por item com no máximo ``concurrency`` em
+andamento e um tempo limite por item, e gera os resultados na ordem em que os
+itens terminam. Itens com a mesma chave serial (ex.: o mesmo ``sessionId``)
+rodam um de cada vez, na ordem do lote, sem ocupar vaga enquanto esperam.
+A falha de um item vira o resultado daquele item e não interrompe os demais.
+"""
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional, Sequence, Tuple
+
+# Configurações
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "500"))
+# Itens executando ao mesmo tempo: padrão do lote e teto aceito na requisição
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+# Segundos por item (inclui a espera na fila de admissão): padrão e teto
+BATCH_ITEM_TIMEOUT = float(os.getenv("BATCH_ITEM_TIMEOUT", "120"))
+BATCH_MAX_ITEM_TIMEOUT = float(os.getenv("BATCH_MAX_ITEM_TIMEOUT", "600"))
+
+
+def batch_limits(concurrency: Optional[int], item_timeout: Optional[float]) -> Tuple[int, float]:
+    """Paralelismo e tempo limite efetivos do lote, dentro dos tetos configurados"""
+    concurrency = max(1, min(concurrency or BATCH_CONCURRENCY, BATCH_MAX_CONCURRENCY))
+    if not item_timeout or item_timeout <= 0:
+        item_timeout = BATCH_ITEM_TIMEOUT
+    return concurrency, min(item_timeout, BATCH_MAX_ITEM_TIMEOUT)
+
+
+async def run_bounded(
+    items: Sequence[Any],
+    worker: Callable[[int, Any], Awaitable[Any]],
+    concurrency: int,
+    timeout: float,
+    serial_key: Optional[Callable[[Any], Optional[str]]] = None,
+) -> AsyncIterator[Tuple[int, Any, float]]:
+    """Gera ``(índice, resultado, latência)`` de cada item na ordem de conclusão.
+
+    ``resultado`` é o retorno de ``worker(índice, item)`` ou a exceção levantada
+    (``asyncio.TimeoutError`` quando o item passa de ``timeout``); a latência,
+    em segundos, conta a partir da vaga obtida. Fechar o gerador (ex.: cliente
+    desconectou) cancela os itens pendentes.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+    serial_locks: Dict[str, asyncio.Lock] = {}
+    finished: asyncio.Queue = asyncio.Queue()
+
+    async def run(index: int, item: Any):
+        key = serial_key(item) if serial_key is not None else None
+        # Tasks começam na ordem de criação e o Lock é FIFO: a ordem do lote se mantém
+        lock = serial_locks.setdefault(key, asyncio.Lock()) if key is not None else None
+        if lock is not None:
+            await lock.acquire()
+        try:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    outcome = await asyncio.wait_for(worker(index, item), timeout)
+                except Exception as e:
+                    outcome = e
+                finished.put_nowait((index, outcome, time.perf_counter() - started))
+        finally:
+            if lock is not None:
+                lock.release()
+
+    tasks = [asyncio.ensure_future(run(index, item)) for index, item in enumerate(items)]
+    try:
+        for _ in range(len(tasks)):
+            yield await finished.get()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
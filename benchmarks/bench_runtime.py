@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""Mede o overhead por turno da construção do runtime do ADK.
+
+Compara o caminho antigo (novo DatabaseSessionService + InMemoryArtifactService
++ Runner a cada mensagem) com o runtime compartilhado de ``agent_runtime``.
+Nenhuma chamada ao modelo é feita: apenas a preparação do turno é medida.
+
+Uso: python benchmarks/bench_runtime.py [--turns 200]
+"""
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+import uuid
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agent_runtime import AgentRuntime  # noqa: E402
+
+
+def per_request_setup(db_url: str, agent):
+    from google.adk.artifacts import InMemoryArtifactService
+    from google.adk.runners import Runner
+    from google.adk.sessions import DatabaseSessionService
+    from google.genai import types
+
+    session_id = user_id = str(uuid.uuid4())
+    session_service = DatabaseSessionService(db_url=db_url)
+    session_service.create_session(app_name="Luminus", user_id=user_id, session_id=session_id)
+    Runner(app_name="Luminus", agent=agent, session_service=session_service, artifact_service=InMemoryArtifactService())
+    types.Content(role="user", parts=[types.Part.from_text(text="ping")])
+    session_service.db_engine.dispose()
+
+
+def shared_setup(runtime: AgentRuntime):
+    session_id = user_id = str(uuid.uuid4())
+    runtime.ensure_session(user_id, session_id)
+    runtime.build_message("ping")
+
+
+def measure(fn, turns: int):
+    samples = []
+    for _ in range(turns):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "mean_ms": statistics.mean(samples),
+        "p50_ms": samples[len(samples) // 2],
+        "p95_ms": samples[int(len(samples) * 0.95) - 1],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--turns", type=int, default=200)
+    args = parser.parse_args()
+
+    from agent import root_agent
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_url = f"sqlite:///{tmp}/bench.db"
+        runtime = AgentRuntime(db_url=db_url, agent=root_agent)
+        before = measure(lambda: per_request_setup(db_url, root_agent), args.turns)
+        after = measure(lambda: shared_setup(runtime), args.turns)
+        runtime.close()
+
+    for label, result in (("por requisição", before), ("runtime compartilhado", after)):
+        print(f"{label:>22}: média={result['mean_ms']:.2f}ms p50={result['p50_ms']:.2f}ms p95={result['p95_ms']:.2f}ms")
+
+
+if __name__ == "__main__":
+    main()
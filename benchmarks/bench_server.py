@@ -0,0 +1,335 @@
+#!/usr/bin/env python3
+"""Benchmark de carga offline do ``/run_sse`` e das rotas de sessão.
+
+Sobe o ``app`` do ``server.py`` num uvicorn local (thread própria) com um
+agente stub (sem modelo) e um Firestore falso em memória, e dispara muitos
+clientes concorrentes em três cenários. Com ``--agent fake`` o turno passa pelo
+``Runner`` real do ADK com o ``root_agent`` usando o modelo falso de
+``fake_llm.py`` (``AGENT_MODEL_BACKEND=fake``; ritmo em ``FAKE_LLM_*``).
+Cenários:
+
+- ``stream``: ``/run_sse`` com ``streaming=true``
+- ``json``: ``/run_sse`` sem streaming
+- ``sessions``: ``POST /sessions``, ``GET /sessions``, ``GET /sessions/{id}``
+  e ``GET /sessions/{id}/messages`` das sessões criadas nos cenários anteriores
+
+Para cada cenário reporta p50/p95/p99 de tempo até o primeiro byte do corpo
+(TTFB), do primeiro delta (apenas ``stream``) e da latência total, vazão e
+crescimento do RSS do processo. O resultado é gravado em JSON para comparar
+commits (``--compare resultado_anterior.json``).
+
+Uso: python benchmarks/bench_server.py [--clients 32] [--requests 10] [--store fake|memory] [--agent stub|fake]
+     [--firestore-latency 0.005] [--tokens 200] [--token-delay 0.001]
+     [--output bench_server.json] [--compare anterior.json]
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+DELTA_MARKER = b'"type":"delta"'
+
+
+class StubRuntime:
+    """Substitui o ``AgentRuntime``: coordenador transfere para um especialista
+    que gera ``tokens`` pedaços de texto, um a cada ``token_delay`` segundos."""
+
+    def __init__(self, tokens: int, token_delay: float, think_time: float):
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.think_time = think_time
+        self.agent = SimpleNamespace(name="intelligent_coordinator")
+        self.fingerprint = "bench-stub"
+
+    def stream_run_config(self):
+        return None
+
+    def agent_for(self, mode=None):
+        return self.agent
+
+    def fingerprint_for(self, mode=None):
+        return self.fingerprint
+
+    def run(self, message, user_id, session_id, run_config=None, mode=None):
+        return self._events(message)
+
+    @staticmethod
+    def _event(author, text=None, partial=None, transfer=None, usage=None):
+        content = SimpleNamespace(parts=[SimpleNamespace(text=text)]) if text else None
+        return SimpleNamespace(
+            author=author, content=content, partial=partial, usage_metadata=usage,
+            actions=SimpleNamespace(transfer_to_agent=transfer),
+            is_final_response=lambda: text is not None and not partial,
+        )
+
+    async def _events(self, message):
+        yield self._event("user", message)
+        await asyncio.sleep(self.think_time)
+        yield self._event("intelligent_coordinator", transfer="technical_expert",
+                          usage=SimpleNamespace(prompt_token_count=40, candidates_token_count=5, total_token_count=45))
+        pieces = []
+        for i in range(self.tokens):
+            if self.token_delay:
+                await asyncio.sleep(self.token_delay)
+            piece = f"tok{i % 97} "
+            pieces.append(piece)
+            yield self._event("technical_expert", piece, partial=True)
+        yield self._event("technical_expert", "".join(pieces),
+                          usage=SimpleNamespace(prompt_token_count=60, candidates_token_count=self.tokens,
+                                                total_token_count=60 + self.tokens))
+
+
+def rss_mb() -> float:
+    """RSS atual do processo (Linux); fora do Linux, o pico informado pelo ``resource``"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except OSError:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def percentiles(samples):
+    if not samples:
+        return None
+    ordered = sorted(samples)
+
+    def rank(p):
+        return round(ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p + 0.5) - 1))], 2)
+
+    return {"p50": rank(0.50), "p95": rank(0.95), "p99": rank(0.99), "max": round(ordered[-1], 2)}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except Exception:
+        return "desconhecido"
+
+
+def start_server(app, port: int):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", access_log=False))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.time() + 30
+    while not server.started:
+        if time.time() > deadline or not thread.is_alive():
+            raise RuntimeError("uvicorn não iniciou")
+        time.sleep(0.05)
+    return server, thread
+
+
+async def timed_request(client, method: str, url: str, samples: dict, **kwargs):
+    """Executa a requisição lendo o corpo em streaming; registra TTFB, primeiro delta e total (ms)"""
+    start = time.perf_counter()
+    ttfb = ttfd = None
+    try:
+        async with client.stream(method, url, **kwargs) as response:
+            async for chunk in response.aiter_raw():
+                now = time.perf_counter()
+                if ttfb is None:
+                    ttfb = now
+                if ttfd is None and DELTA_MARKER in chunk:
+                    ttfd = now
+            status = response.status_code
+    except Exception:
+        status = None
+    end = time.perf_counter()
+    if status is None or status >= 400:
+        samples["errors"] += 1
+        return False
+    samples["latency"].append((end - start) * 1000)
+    samples["ttfb"].append(((ttfb or end) - start) * 1000)
+    if ttfd is not None:
+        samples["ttfd"].append((ttfd - start) * 1000)
+    return True
+
+
+def run_payload(user_id: str, session_id: str, text: str, streaming: bool):
+    return {
+        "appName": "Luminus",
+        "userId": user_id,
+        "sessionId": session_id,
+        "newMessage": {"role": "user", "parts": [{"text": text}]},
+        "streaming": streaming,
+    }
+
+
+async def chat_client(client, index: int, requests: int, streaming: bool, samples: dict, sessions: list):
+    user_id = f"bench-user-{index}"
+    session_id = str(uuid.uuid4())
+    sessions.append((user_id, session_id))
+    for turn in range(requests):
+        payload = run_payload(user_id, session_id, f"pergunta {index}-{turn} ({'stream' if streaming else 'json'})", streaming)
+        await timed_request(client, "POST", "/run_sse", samples, json=payload)
+
+
+async def sessions_client(client, index: int, requests: int, samples: dict, sessions: list):
+    user_id, session_id = sessions[index % len(sessions)]
+    for _ in range(requests):
+        await timed_request(client, "POST", "/sessions", samples, json={"appName": "Luminus", "userId": user_id})
+        await timed_request(client, "GET", "/sessions", samples, params={"userId": user_id})
+        await timed_request(client, "GET", f"/sessions/{session_id}", samples)
+        await timed_request(client, "GET", f"/sessions/{session_id}/messages", samples)
+
+
+async def run_scenario(name: str, base_url: str, clients: int, make_client):
+    import httpx
+
+    samples = {"latency": [], "ttfb": [], "ttfd": [], "errors": 0}
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    gc.collect()
+    rss_before = rss_mb()
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=120) as client:
+        start = time.perf_counter()
+        await asyncio.gather(*(make_client(client, i, samples) for i in range(clients)))
+        elapsed = time.perf_counter() - start
+    gc.collect()
+    rss_after = rss_mb()
+    completed = len(samples["latency"])
+    return {
+        "clients": clients,
+        "requests": completed + samples["errors"],
+        "errors": samples["errors"],
+        "elapsed_s": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 2) if elapsed else None,
+        "ttfb_ms": percentiles(samples["ttfb"]),
+        "ttfd_ms": percentiles(samples["ttfd"]),
+        "latency_ms": percentiles(samples["latency"]),
+        "rss_before_mb": round(rss_before, 1),
+        "rss_after_mb": round(rss_after, 1),
+        "rss_growth_mb": round(rss_after - rss_before, 1),
+    }
+
+
+def print_results(results: dict, baseline: dict = None):
+    def fmt(stats, key):
+        return f"{stats[key]:.1f}" if stats else "-"
+
+    for name, r in results["scenarios"].items():
+        print(f"{name:>9}: req={r['requests']} erros={r['errors']} vazão={r['throughput_rps']}/s "
+              f"ttfb p50/p95/p99={fmt(r['ttfb_ms'], 'p50')}/{fmt(r['ttfb_ms'], 'p95')}/{fmt(r['ttfb_ms'], 'p99')}ms "
+              f"latência p50/p95/p99={fmt(r['latency_ms'], 'p50')}/{fmt(r['latency_ms'], 'p95')}/{fmt(r['latency_ms'], 'p99')}ms "
+              f"rss +{r['rss_growth_mb']}MB")
+        old = (baseline or {}).get("scenarios", {}).get(name)
+        if not old:
+            continue
+        changes = []
+        for metric in ("ttfb_ms", "latency_ms"):
+            for p in ("p50", "p95", "p99"):
+                if r.get(metric) and old.get(metric) and old[metric][p]:
+                    changes.append(f"{metric[:-3]} {p} {100 * (r[metric][p] - old[metric][p]) / old[metric][p]:+.1f}%")
+        if r["throughput_rps"] and old.get("throughput_rps"):
+            changes.append(f"vazão {100 * (r['throughput_rps'] - old['throughput_rps']) / old['throughput_rps']:+.1f}%")
+        print(f"{'':>9}  vs {baseline['meta'].get('commit')}: " + ", ".join(changes))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--clients", type=int, default=32, help="clientes concorrentes por cenário")
+    parser.add_argument("--requests", type=int, default=10, help="requisições (turnos) por cliente")
+    parser.add_argument("--scenarios", default="stream,json,sessions")
+    parser.add_argument("--store", choices=("fake", "memory"), default="fake",
+                        help="fake: Firestore falso (write-behind e pool de threads); memory: fallback em memória")
+    parser.add_argument("--firestore-latency", type=float, default=0.005, help="segundos por round trip do Firestore falso")
+    parser.add_argument("--agent", choices=("stub", "fake"), default="stub",
+                        help="stub: eventos sintéticos sem ADK; fake: Runner do ADK com fake_llm")
+    parser.add_argument("--tokens", type=int, default=200, help="pedaços de texto por resposta do agente stub")
+    parser.add_argument("--token-delay", type=float, default=0.001)
+    parser.add_argument("--think-time", type=float, default=0.05, help="latência do coordenador antes do primeiro token")
+    parser.add_argument("--max-concurrent", type=int, default=64, help="ADMISSION_MAX_CONCURRENT do servidor")
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", default="bench_server.json")
+    parser.add_argument("--compare", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    # Configuração do servidor antes do import (constantes lidas de os.getenv)
+    os.environ.pop("LUMINUS_API_KEY", None)
+    os.environ["ADMISSION_MAX_CONCURRENT"] = str(args.max_concurrent)
+    os.environ["ADMISSION_MAX_QUEUE"] = str(max(args.clients * 2, 64))
+    os.environ["ADMISSION_MAX_QUEUE_PER_USER"] = str(max(args.requests, 4))
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("TRACE_EXPORTER", "none")
+    if args.agent == "fake":
+        import tempfile
+        os.environ["AGENT_MODEL_BACKEND"] = "fake"
+        os.environ["ADK_DB_URL"] = f"sqlite:///{tempfile.mkdtemp()}/bench_adk.db"
+    logging.basicConfig(level=args.log_level)
+
+    import server  # noqa: E402
+    from fake_firestore import FakeFirestore  # noqa: E402
+
+    logging.getLogger().setLevel(args.log_level)
+    if args.agent == "stub":
+        runtime = StubRuntime(args.tokens, args.token_delay, args.think_time)
+        server.get_agent_runtime = lambda: runtime
+    fake_db = FakeFirestore(latency=args.firestore_latency) if args.store == "fake" else None
+    server.db = fake_db
+
+    port = free_port()
+    uvicorn_server, thread = start_server(server.app, port)
+    base_url = f"http://127.0.0.1:{port}"
+
+    sessions = []
+    scenarios = {
+        "stream": lambda client, i, samples: chat_client(client, i, args.requests, True, samples, sessions),
+        "json": lambda client, i, samples: chat_client(client, i, args.requests, False, samples, sessions),
+        "sessions": lambda client, i, samples: sessions_client(client, i, args.requests, samples, sessions),
+    }
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in [n.strip() for n in args.scenarios.split(",") if n.strip()]:
+            if name == "sessions" and not sessions:
+                sessions.append(("bench-user-0", str(uuid.uuid4())))
+            results["scenarios"][name] = asyncio.run(run_scenario(name, base_url, args.clients, scenarios[name]))
+    finally:
+        uvicorn_server.should_exit = True
+        thread.join(timeout=30)
+    if fake_db is not None:
+        results["meta"]["firestore"] = {"round_trips": fake_db.round_trips, "batches": fake_db.batches}
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+    print(f"Resultado salvo em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""Compara a emissão SSE antiga (um frame por pedaço) com o emissor agrupado.
+
+Usa uma fonte sintética de tokens (sem modelo) e mede, por resposta:
+frames emitidos, bytes no fio, CPU por KB de texto transmitido e tempo até
+o primeiro byte.
+
+Uso: python benchmarks/bench_sse.py [--tokens 3000] [--token-delay 0.0005]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sse import coalesce_deltas, sse_frame  # noqa: E402
+
+logger = logging.getLogger("bench.sse")
+logger.addHandler(logging.NullHandler())
+logger.setLevel(logging.INFO)
+logger.propagate = False
+
+
+async def token_source(tokens: int, delay: float):
+    for i in range(tokens):
+        if delay:
+            await asyncio.sleep(delay)
+        yield f"tok{i % 97} "
+
+
+def chunk_delta_text(delta_text: str, max_chars: int = 120):
+    # Cópia do helper removido de server.run_sse
+    if not delta_text:
+        return []
+    chunks = []
+    current = []
+    current_len = 0
+    for token in delta_text.split(" "):
+        token_str = (" " if current else "") + token
+        if current_len + len(token_str) > max_chars or "\n\n" in token_str:
+            parts = token_str.split("\n\n")
+            if current:
+                chunks.append("".join(current))
+                current = []
+                current_len = 0
+            for p in parts:
+                chunks.append("\n\n" if not p else p)
+        else:
+            current.append(token_str)
+            current_len += len(token_str)
+    if current:
+        chunks.append("".join(current))
+    normalized = []
+    for c in chunks:
+        if len(c) <= max_chars:
+            normalized.append(c)
+        else:
+            for i in range(0, len(c), max_chars):
+                normalized.append(c[i:i + max_chars])
+    return normalized
+
+
+async def legacy_stream(source):
+    async for delta in source:
+        for piece in chunk_delta_text(delta):
+            payload = {"type": "delta", "invocationId": "e-1", "delta": piece, "agent": "a",
+                       "done": False, "timestamp": time.time(), "author": "practia-agent"}
+            logger.info(f"[/run_sse] emitindo delta len={len(piece)} preview='{piece[:40]}'")
+            yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
+            await asyncio.sleep(0)
+
+
+async def coalesced_stream(source):
+    async for delta in coalesce_deltas(source):
+        payload = {"type": "delta", "invocationId": "e-1", "delta": delta, "agent": "a",
+                   "done": False, "timestamp": time.time(), "author": "practia-agent"}
+        logger.debug(f"[/run_sse] emitindo delta len={len(delta)}")
+        yield sse_frame(payload)
+
+
+async def run(stream_factory, tokens: int, delay: float):
+    frames = 0
+    size = 0
+    text_size = sum(len(f"tok{i % 97} ".encode("utf-8")) for i in range(tokens))
+    ttfb = None
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    async for frame in stream_factory(token_source(tokens, delay)):
+        if ttfb is None:
+            ttfb = time.perf_counter() - start
+        frames += 1
+        size += len(frame.encode("utf-8") if isinstance(frame, str) else frame)
+    cpu = time.process_time() - cpu_start
+    return {
+        "frames": frames,
+        "wire_kb": size / 1024,
+        "cpu_ms_per_kb": cpu * 1000 / (text_size / 1024),
+        "ttfb_ms": ttfb * 1000,
+        "total_ms": (time.perf_counter() - start) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--tokens", type=int, default=3000)
+    parser.add_argument("--token-delay", type=float, default=0.0005)
+    args = parser.parse_args()
+
+    for label, factory in (("antigo", legacy_stream), ("agrupado", coalesced_stream)):
+        r = asyncio.run(run(factory, args.tokens, args.token_delay))
+        print(f"{label:>9}: frames={r['frames']} wire_kb={r['wire_kb']:.1f} cpu/kb={r['cpu_ms_per_kb']:.3f}ms "
+              f"ttfb={r['ttfb_ms']:.2f}ms total={r['total_ms']:.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
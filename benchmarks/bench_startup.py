@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""Benchmark do tempo de boot do servidor.
+
+Sobe ``uvicorn server:app`` como processo separado, ``--runs`` vezes, e mede a
+partir do ``spawn``:
+
+- ``first_request``: primeira resposta 200 de ``/health`` (o servidor aceita
+  requisições; com a inicialização em segundo plano não espera Firebase/ADK)
+- ``ready``: primeira resposta 200 de ``/ready`` (Firebase e runtime do ADK
+  inicializados, com ou sem falha)
+
+e reporta também a duração de cada componente informada pelo ``/ready``.
+Por padrão usa o modelo falso (``AGENT_MODEL_BACKEND=fake``) e um banco SQLite
+temporário do ADK; as credenciais do Firebase vêm do ambiente/``.env``.
+
+Uso: python benchmarks/bench_startup.py [--runs 5] [--agent fake|gemini]
+     [--connection-check read|write|none] [--output bench_startup.json]
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_server import free_port, git_commit, percentiles
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_for(client: httpx.Client, url: str, process: subprocess.Popen, started: float, timeout: float):
+    """Segundos até ``url`` responder 200 (``None`` se o processo morreu ou estourou o tempo)"""
+    while time.perf_counter() - started < timeout:
+        if process.poll() is not None:
+            return None, None
+        try:
+            response = client.get(url)
+            if response.status_code == 200:
+                return time.perf_counter() - started, response
+        except httpx.TransportError:
+            pass
+        time.sleep(0.01)
+    return None, None
+
+
+def run_once(args, db_dir: str, index: int):
+    port = free_port()
+    env = dict(os.environ)
+    env["FIREBASE_CONNECTION_CHECK"] = args.connection_check
+    env.setdefault("ADK_DB_URL", f"sqlite:///{os.path.join(db_dir, f'adk_{index}.db')}")
+    if args.agent == "fake":
+        env["AGENT_MODEL_BACKEND"] = "fake"
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}", timeout=5) as client:
+            first_request, _ = wait_for(client, "/health", process, started, args.timeout)
+            ready, response = wait_for(client, "/ready", process, started, args.timeout)
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+    status = response.json() if response is not None else {}
+    return {
+        "first_request_ms": round(first_request * 1000, 1) if first_request is not None else None,
+        "ready_ms": round(ready * 1000, 1) if ready is not None else None,
+        "components": {name: component.get("durationMs") for name, component in status.get("components", {}).items()},
+        "statuses": {name: component.get("status") for name, component in status.get("components", {}).items()},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--agent", choices=("fake", "gemini"), default="fake",
+                        help="backend de modelo dos agentes (AGENT_MODEL_BACKEND)")
+    parser.add_argument("--connection-check", choices=("read", "write", "none"), default="read",
+                        help="FIREBASE_CONNECTION_CHECK do servidor")
+    parser.add_argument("--timeout", type=float, default=120, help="segundos máximos por boot")
+    parser.add_argument("--output", default="bench_startup.json")
+    args = parser.parse_args()
+
+    runs = []
+    with tempfile.TemporaryDirectory(prefix="bench_startup_") as db_dir:
+        for index in range(args.runs):
+            run = run_once(args, db_dir, index)
+            runs.append(run)
+            print(f"boot {index + 1}/{args.runs}: primeira requisição {run['first_request_ms']} ms, "
+                  f"pronto {run['ready_ms']} ms {run['statuses']}")
+
+    components = sorted({name for run in runs for name in run["components"]})
+    results = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "first_request_ms": percentiles([r["first_request_ms"] for r in runs if r["first_request_ms"] is not None]),
+        "ready_ms": percentiles([r["ready_ms"] for r in runs if r["ready_ms"] is not None]),
+        "components_ms": {
+            name: percentiles([r["components"][name] for r in runs if r["components"].get(name) is not None])
+            for name in components
+        },
+        "runs": runs,
+    }
+    print(f"primeira requisição: {results['first_request_ms']}")
+    print(f"pronto:              {results['ready_ms']}")
+    for name, stats in results["components_ms"].items():
+        print(f"  {name:<19}{stats}")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"Resultado salvo em {args.output}")
+
+
+if __name__ == "__main__":
+    main()
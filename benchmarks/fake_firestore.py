@@ -0,0 +1,216 @@
+"""Cliente Firestore falso, em memória, para os benchmarks.
+
+Implementa apenas a parte da API usada por ``server.py`` (documentos,
+subcoleções, ``where``/``order_by``/``start_after``/``limit``, ``WriteBatch``
+e os sentinelas ``SERVER_TIMESTAMP``, ``DELETE_FIELD`` e ``Increment``).
+Cada round trip dorme ``latency`` segundos para simular a rede; as chamadas
+continuam síncronas, como as do cliente real (o servidor as executa no pool
+de ``run_firestore``).
+"""
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+from google.cloud import firestore
+
+Path = Tuple[str, ...]
+
+
+def _resolve(current: Optional[Dict[str, Any]], data: Dict[str, Any]) -> Dict[str, Any]:
+    """Aplica ``data`` sobre ``current`` interpretando os sentinelas (merge recursivo)"""
+    result = dict(current or {})
+    for key, value in data.items():
+        if value is firestore.DELETE_FIELD:
+            result.pop(key, None)
+        elif value is firestore.SERVER_TIMESTAMP:
+            result[key] = datetime.now(timezone.utc)
+        elif isinstance(value, firestore.Increment):
+            previous = result.get(key)
+            result[key] = (previous if isinstance(previous, (int, float)) else 0) + value.value
+        elif isinstance(value, dict):
+            previous = result.get(key)
+            result[key] = _resolve(previous if isinstance(previous, dict) else None, value)
+        else:
+            result[key] = value
+    return result
+
+
+def _sort_key(value: Any):
+    return (value is None, value if value is not None else 0)
+
+
+class FakeSnapshot:
+    def __init__(self, ref: "FakeDocumentRef", data: Optional[Dict[str, Any]]):
+        self.reference = ref
+        self.id = ref.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return dict(self._data) if self._data is not None else None
+
+
+class FakeQuery:
+    def __init__(self, client: "FakeFirestore", path: Path):
+        self._client = client
+        self._path = path
+        self._filters: List[Tuple[str, str, Any]] = []
+        # (campo, decrescente); "__name__" é o id do documento
+        self._order: List[Tuple[str, bool]] = []
+        self._start_after: Optional[Union[FakeSnapshot, Dict[str, Any]]] = None
+        self._limit: Optional[int] = None
+
+    def _copy(self) -> "FakeQuery":
+        query = FakeQuery(self._client, self._path)
+        query._filters = list(self._filters)
+        query._order = list(self._order)
+        query._start_after = self._start_after
+        query._limit = self._limit
+        return query
+
+    def where(self, field: str, op: str, value: Any) -> "FakeQuery":
+        if op != "==":
+            raise NotImplementedError(f"Operador não suportado: {op}")
+        query = self._copy()
+        query._filters.append((field, op, value))
+        return query
+
+    def order_by(self, field: str, direction: str = "ASCENDING") -> "FakeQuery":
+        query = self._copy()
+        query._order.append((field, direction == firestore.Query.DESCENDING))
+        return query
+
+    def start_after(self, cursor: Union[FakeSnapshot, Dict[str, Any]]) -> "FakeQuery":
+        """Snapshot (continua depois do documento) ou valores dos campos de ``order_by``"""
+        query = self._copy()
+        query._start_after = cursor
+        return query
+
+    def _is_after(self, doc_id: str, data: Dict[str, Any], cursor: Dict[str, Any]) -> bool:
+        for field, descending in self._order:
+            value = _sort_key(doc_id if field == "__name__" else data.get(field))
+            bound = _sort_key(cursor.get(field))
+            if value != bound:
+                return value < bound if descending else value > bound
+        return False
+
+    def limit(self, count: int) -> "FakeQuery":
+        query = self._copy()
+        query._limit = count
+        return query
+
+    def stream(self):
+        self._client._round_trip()
+        docs = self._client._list(self._path)
+        for field, _, value in self._filters:
+            docs = [(doc_id, data) for doc_id, data in docs if data.get(field) == value]
+        # Ordenações estáveis do último campo para o primeiro
+        for field, descending in reversed(self._order):
+            docs.sort(key=lambda item: _sort_key(item[0] if field == "__name__" else item[1].get(field)),
+                      reverse=descending)
+        if isinstance(self._start_after, dict):
+            docs = [(doc_id, data) for doc_id, data in docs if self._is_after(doc_id, data, self._start_after)]
+        elif self._start_after is not None:
+            ids = [doc_id for doc_id, _ in docs]
+            if self._start_after.id in ids:
+                docs = docs[ids.index(self._start_after.id) + 1:]
+        if self._limit is not None:
+            docs = docs[:self._limit]
+        return iter([FakeSnapshot(FakeDocumentRef(self._client, self._path + (doc_id,)), data) for doc_id, data in docs])
+
+
+class FakeCollectionRef(FakeQuery):
+    def document(self, document_id: Optional[str] = None) -> "FakeDocumentRef":
+        return FakeDocumentRef(self._client, self._path + (document_id or uuid.uuid4().hex,))
+
+
+class FakeDocumentRef:
+    def __init__(self, client: "FakeFirestore", path: Path):
+        self._client = client
+        self.path = path
+        self.id = path[-1]
+
+    def collection(self, name: str) -> FakeCollectionRef:
+        return FakeCollectionRef(self._client, self.path + (name,))
+
+    def get(self) -> FakeSnapshot:
+        self._client._round_trip()
+        return FakeSnapshot(self, self._client._get(self.path))
+
+    def set(self, data: Dict[str, Any], merge: bool = False):
+        self._client._round_trip()
+        self._client._set(self.path, data, merge)
+
+    def update(self, data: Dict[str, Any]):
+        self._client._round_trip()
+        self._client._update(self.path, data)
+
+
+class FakeWriteBatch:
+    def __init__(self, client: "FakeFirestore"):
+        self._client = client
+        self._ops: List[Tuple[str, Path, Dict[str, Any], bool]] = []
+
+    def set(self, ref: FakeDocumentRef, data: Dict[str, Any], merge: bool = False):
+        self._ops.append(("set", ref.path, data, merge))
+
+    def update(self, ref: FakeDocumentRef, data: Dict[str, Any]):
+        self._ops.append(("update", ref.path, data, False))
+
+    def commit(self):
+        self._client._round_trip()
+        with self._client._lock:
+            for kind, path, data, merge in self._ops:
+                if kind == "update":
+                    self._client._update(path, data)
+                else:
+                    self._client._set(path, data, merge)
+        self._client.batches += 1
+
+
+class FakeFirestore:
+    """Cliente com a mesma superfície usada pelo servidor; ``latency`` por round trip."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.round_trips = 0
+        self.batches = 0
+        self._docs: Dict[Path, Dict[str, Any]] = {}
+        self._lock = threading.RLock()
+
+    def collection(self, name: str) -> FakeCollectionRef:
+        return FakeCollectionRef(self, (name,))
+
+    def document(self, *path: str) -> FakeDocumentRef:
+        return FakeDocumentRef(self, tuple(path))
+
+    def batch(self) -> FakeWriteBatch:
+        return FakeWriteBatch(self)
+
+    def _round_trip(self):
+        with self._lock:
+            self.round_trips += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _get(self, path: Path) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            data = self._docs.get(path)
+            return dict(data) if data is not None else None
+
+    def _set(self, path: Path, data: Dict[str, Any], merge: bool):
+        with self._lock:
+            self._docs[path] = _resolve(self._docs.get(path) if merge else None, data)
+
+    def _update(self, path: Path, data: Dict[str, Any]):
+        with self._lock:
+            if path not in self._docs:
+                raise KeyError(f"Documento não encontrado: {'/'.join(path)}")
+            self._docs[path] = _resolve(self._docs[path], data)
+
+    def _list(self, collection: Path) -> List[Tuple[str, Dict[str, Any]]]:
+        with self._lock:
+            return [(path[-1], dict(data)) for path, data in self._docs.items()
+                    if len(path) == len(collection) + 1 and path[:-1] == collection]
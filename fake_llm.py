@@ -0,0 +1,206 @@
+"""Backend de modelo falso e determinístico para rodar os agentes sem rede.
+
+``FakeLlm`` implementa o ``BaseLlm`` do ADK e entra no lugar do
+``gemini-2.5-flash`` em cada ``LlmAgent`` de ``agent.py`` quando
+``AGENT_MODEL_BACKEND=fake``: a mesma topologia (coordenador + especialistas)
+roda de verdade pelo ``Runner``, com transferências (``transfer_to_agent``) e
+chamadas de ferramenta executadas pelo próprio ADK. O texto vem de um roteiro
+JSON (``FAKE_LLM_SCRIPT``) ou é sintético, gerado a partir de uma semente e da
+mensagem do usuário, e é emitido na velocidade configurada. Cada chamada
+registra um uso de tokens determinístico (uma palavra = um token), como o
+``gemini_llm.UsageGemini`` faz com o uso real.
+
+Configuração (variáveis de ambiente):
+
+- ``FAKE_LLM_FIRST_TOKEN_LATENCY``: segundos até a primeira saída de cada chamada
+- ``FAKE_LLM_TOKENS_PER_SECOND``: ritmo dos tokens (``0`` = sem espera)
+- ``FAKE_LLM_RESPONSE_TOKENS``: tamanho das respostas sintéticas, em palavras
+- ``FAKE_LLM_TRANSFERS``: transferências por turno (``0`` = o coordenador responde)
+- ``FAKE_LLM_TOOL_CALLS``: chamadas de ferramenta por resposta de agente com ferramentas
+- ``FAKE_LLM_TOOL_LATENCY``: duração de ``fake_search``
+- ``FAKE_LLM_SEED``: semente do texto sintético e do roteamento sem palavra-chave
+- ``FAKE_LLM_SCRIPT``: arquivo JSON ``{"<agente>": "<texto>" | ["<texto>", ...]}``
+"""
+import asyncio
+import json
+import logging
+import os
+import random
+import zlib
+from typing import Any, AsyncGenerator, Dict, List, Optional, Tuple
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from agent_runtime import record_model_usage
+
+logger = logging.getLogger("practia.fake_llm")
+
+# Configurações
+FAKE_LLM_FIRST_TOKEN_LATENCY = float(os.getenv("FAKE_LLM_FIRST_TOKEN_LATENCY", "0.2"))
+FAKE_LLM_TOKENS_PER_SECOND = float(os.getenv("FAKE_LLM_TOKENS_PER_SECOND", "50"))
+FAKE_LLM_RESPONSE_TOKENS = int(os.getenv("FAKE_LLM_RESPONSE_TOKENS", "120"))
+FAKE_LLM_TRANSFERS = int(os.getenv("FAKE_LLM_TRANSFERS", "1"))
+FAKE_LLM_TOOL_CALLS = int(os.getenv("FAKE_LLM_TOOL_CALLS", "1"))
+FAKE_LLM_TOOL_LATENCY = float(os.getenv("FAKE_LLM_TOOL_LATENCY", "0.1"))
+FAKE_LLM_SEED = int(os.getenv("FAKE_LLM_SEED", "0"))
+FAKE_LLM_SCRIPT = os.getenv("FAKE_LLM_SCRIPT")
+
+TRANSFER_TOOL = "transfer_to_agent"
+FOREIGN_CONTEXT = "For context:"
+
+# Roteamento do coordenador por palavra-chave (mesmos critérios da instrução do root_agent)
+ROUTES: Tuple[Tuple[str, Tuple[str, ...]], ...] = (
+    ("content_refiner", ("melhor", "refin", "improve", "refine", "revis")),
+    ("content_analyst", ("analis", "avali", "review", "analy", "feedback")),
+    ("creative_writer", ("escrev", "redij", "artigo", "post", "write", "draft", "article")),
+    ("research_specialist", ("pesquis", "notícia", "noticia", "atual", "latest", "news", "research", "find")),
+    ("technical_expert", ("código", "codigo", "implement", "debug", "python", "api", "explain", "explique")),
+)
+
+_VOCABULARY = (
+    "a", "análise", "arquitetura", "de", "dados", "do", "em", "equipe", "exemplo", "fluxo", "implementação",
+    "modelo", "o", "para", "passo", "pesquisa", "processo", "projeto", "que", "resultado", "serviço",
+    "sistema", "solução", "também", "um", "uma", "usuário", "valor", "com", "mais", "isso", "como",
+)
+
+
+def _stable_hash(*values: Any) -> int:
+    return zlib.crc32("\0".join(str(value) for value in values).encode("utf-8"))
+
+
+def _load_script(path: Optional[str]) -> Dict[str, List[str]]:
+    if not path:
+        return {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            raw = json.load(f)
+    except Exception as e:
+        logger.warning(f"[fake_llm] Roteiro {path} ignorado: {e}")
+        return {}
+    return {agent: [texts] if isinstance(texts, str) else list(texts) for agent, texts in raw.items()}
+
+
+_script = _load_script(FAKE_LLM_SCRIPT)
+
+
+async def fake_search(query: str) -> dict:
+    """Busca determinística usada no lugar do google_search com o backend falso."""
+    await asyncio.sleep(FAKE_LLM_TOOL_LATENCY)
+    digest = _stable_hash(FAKE_LLM_SEED, query)
+    return {
+        "results": [
+            {"title": f"Resultado {i + 1} para {query[:60]}", "url": f"https://example.com/{(digest + i) % 100000}"}
+            for i in range(3)
+        ]
+    }
+
+
+class FakeLlm(BaseLlm):
+    """Modelo falso de um agente (``agent_name``) com as transferências possíveis."""
+
+    agent_name: str = ""
+    transfer_targets: List[str] = []
+
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        user_text, transfers, tool_calls = self._turn_state(llm_request.contents or [])
+        tools = sorted(name for name in llm_request.tools_dict if name != TRANSFER_TOOL)
+        targets = [name for name in self.transfer_targets if name != self.agent_name]
+
+        if TRANSFER_TOOL in llm_request.tools_dict and targets and transfers < FAKE_LLM_TRANSFERS:
+            await asyncio.sleep(FAKE_LLM_FIRST_TOKEN_LATENCY)
+            args = {"agent_name": self._route(user_text, targets, transfers)}
+            self._record_usage(llm_request, TRANSFER_TOOL, *args.values())
+            yield self._function_call(TRANSFER_TOOL, args)
+            return
+        if tools and tool_calls < FAKE_LLM_TOOL_CALLS:
+            await asyncio.sleep(FAKE_LLM_FIRST_TOKEN_LATENCY)
+            tool = llm_request.tools_dict[tools[tool_calls % len(tools)]]
+            args = self._tool_args(tool, user_text)
+            self._record_usage(llm_request, tool.name, *args.values())
+            yield self._function_call(tool.name, args)
+            return
+
+        text = self._response_text(user_text)
+        await asyncio.sleep(FAKE_LLM_FIRST_TOKEN_LATENCY)
+        if not stream:
+            words = len(text.split())
+            if FAKE_LLM_TOKENS_PER_SECOND > 0:
+                await asyncio.sleep(words / FAKE_LLM_TOKENS_PER_SECOND)
+            self._record_usage(llm_request, text)
+            yield LlmResponse(content=types.ModelContent(parts=[types.Part.from_text(text=text)]))
+            return
+        # Como o Gemini em modo SSE: parciais e, no fim, o texto agregado
+        for index, word in enumerate(text.split(" ")):
+            if index and FAKE_LLM_TOKENS_PER_SECOND > 0:
+                await asyncio.sleep(1 / FAKE_LLM_TOKENS_PER_SECOND)
+            chunk = word if index == 0 else " " + word
+            yield LlmResponse(content=types.ModelContent(parts=[types.Part.from_text(text=chunk)]), partial=True)
+        self._record_usage(llm_request, text)
+        yield LlmResponse(content=types.ModelContent(parts=[types.Part.from_text(text=text)]))
+
+    def _record_usage(self, llm_request: LlmRequest, *outputs: Any):
+        """Registra o uso da chamada como o Gemini faria (uma palavra = um token)"""
+        prompt = sum(len(part.text.split()) for content in llm_request.contents or []
+                     for part in content.parts or [] if part.text)
+        candidates = sum(len(str(output).split()) for output in outputs)
+        record_model_usage(self.agent_name, {
+            "promptTokenCount": prompt,
+            "candidatesTokenCount": candidates,
+            "totalTokenCount": prompt + candidates,
+        })
+
+    @staticmethod
+    def _turn_state(contents: List[types.Content]) -> Tuple[str, int, int]:
+        """Mensagem do usuário do turno atual, transferências e chamadas de ferramenta já feitas"""
+        start = 0
+        user_text = ""
+        for index, content in enumerate(contents):
+            parts = content.parts or []
+            if content.role == "user" and parts and parts[0].text and parts[0].text != FOREIGN_CONTEXT:
+                start = index + 1
+                user_text = "".join(part.text or "" for part in parts)
+        transfers = tool_calls = 0
+        for content in contents[start:]:
+            for part in content.parts or []:
+                if part.function_call is not None:
+                    if part.function_call.name == TRANSFER_TOOL:
+                        transfers += 1
+                elif part.function_response is not None:
+                    if part.function_response.name != TRANSFER_TOOL:
+                        tool_calls += 1
+                elif part.text and f"called tool `{TRANSFER_TOOL}`" in part.text:
+                    # Evento de outro agente, reescrito pelo ADK como contexto
+                    transfers += 1
+        return user_text, transfers, tool_calls
+
+    @staticmethod
+    def _route(user_text: str, targets: List[str], transfers: int) -> str:
+        lowered = user_text.lower()
+        if transfers == 0:
+            for agent, keywords in ROUTES:
+                if agent in targets and any(keyword in lowered for keyword in keywords):
+                    return agent
+        return targets[_stable_hash(FAKE_LLM_SEED, user_text, transfers) % len(targets)]
+
+    @staticmethod
+    def _tool_args(tool, user_text: str) -> Dict[str, Any]:
+        declaration = tool._get_declaration()
+        properties = (declaration.parameters.properties or {}) if declaration and declaration.parameters else {}
+        return {name: user_text[:200] for name, schema in properties.items() if schema.type == types.Type.STRING}
+
+    @staticmethod
+    def _function_call(name: str, args: Dict[str, Any]) -> LlmResponse:
+        return LlmResponse(content=types.ModelContent(parts=[types.Part(function_call=types.FunctionCall(name=name, args=args))]))
+
+    def _response_text(self, user_text: str) -> str:
+        scripted = _script.get(self.agent_name)
+        if scripted:
+            return scripted[_stable_hash(FAKE_LLM_SEED, user_text) % len(scripted)]
+        rng = random.Random(_stable_hash(FAKE_LLM_SEED, self.agent_name, user_text))
+        words = [rng.choice(_VOCABULARY) for _ in range(max(1, FAKE_LLM_RESPONSE_TOKENS))]
+        return f"[{self.agent_name}] " + " ".join(words) + "."
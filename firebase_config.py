@@ -1,16 +1,25 @@
 import os
 import json
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore
 
 # Carrega variáveis do .env (se existir)
 load_dotenv()
 
+# Verificação da conexão na inicialização: "read" (leitura de um documento, padrão),
+# "write" (grava test/connection, comportamento antigo) ou "none" (sem round trip)
+FIREBASE_CONNECTION_CHECK = os.getenv("FIREBASE_CONNECTION_CHECK", "read").lower()
+
 # Initialize Firebase Admin SDK
 def initialize_firebase():
     """Initialize Firebase Admin SDK"""
+    # Imports pesados só quando o Firebase é de fato inicializado
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+
     try:
         # Check if Firebase is already initialized
         firebase_admin.get_app()
@@ -65,7 +74,10 @@ def initialize_firebase():
         client = firestore.client()
         # Testar conexão
         test_doc = client.collection('test').document('connection')
-        test_doc.set({'timestamp': firestore.SERVER_TIMESTAMP, 'status': 'connected'})
+        if FIREBASE_CONNECTION_CHECK == "write":
+            test_doc.set({'timestamp': firestore.SERVER_TIMESTAMP, 'status': 'connected'})
+        elif FIREBASE_CONNECTION_CHECK != "none":
+            test_doc.get()
         print("Firestore connection test successful")
         return client
     except Exception as e:
@@ -75,8 +87,19 @@ def initialize_firebase():
 # Get Firestore client
 def get_firestore_client():
     """Get Firestore client instance"""
+    from firebase_admin import firestore
     try:
         return firestore.client()
     except Exception as e:
         print(f"Error getting Firestore client: {e}")
-        return None
\ No newline at end of file
+        return None
+
+# Pool limitado de threads para as chamadas síncronas do cliente Firestore.
+# Evita bloquear o event loop do uvicorn durante o round trip de rede.
+FIRESTORE_MAX_WORKERS = int(os.getenv("FIRESTORE_MAX_WORKERS", "16"))
+_firestore_executor = ThreadPoolExecutor(max_workers=FIRESTORE_MAX_WORKERS, thread_name_prefix="firestore")
+
+async def run_firestore(fn, *args, **kwargs):
+    """Executa uma chamada síncrona do Firestore no pool de threads"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_firestore_executor, functools.partial(fn, *args, **kwargs))
@@ -157,13 +157,11 @@ export function ChatSidebar({ onSessionSelect, updateSessionRef }: ChatSidebarPr
   };
 
   const allAgents = [
-    { key: 'enrichment_agent', label: 'Enrichment Agent', desc: 'Enriquece e complementa conteúdos.' },
-    { key: 'search_agent', label: 'Search Agent', desc: 'Pesquisa referências e exemplos (Google Search).' },
-    { key: 'main_agent', label: 'Main Agent', desc: 'Agente principal que coordena o processo.' },
-    { key: 'critique_agent', label: 'Critique Agent', desc: 'Analisa e critica o conteúdo gerado.' },
-    { key: 'generator_agent', label: 'Generator Agent', desc: 'Gera conteúdo e implementações.' },
-    { key: 'content_creator', label: 'Content Creator', desc: 'Cria conteúdo inicial baseado nas solicitações.' },
-    { key: 'content_evaluator', label: 'Content Evaluator', desc: 'Avalia e fornece feedback sobre o conteúdo.' },
+    { key: 'intelligent_coordinator', label: 'Coordinator', desc: 'Analisa o pedido e encaminha ao especialista adequado.' },
+    { key: 'research_specialist', label: 'Research Specialist', desc: 'Pesquisa informações atuais (Google Search).' },
+    { key: 'content_analyst', label: 'Content Analyst', desc: 'Analisa e fornece feedback sobre o conteúdo.' },
+    { key: 'creative_writer', label: 'Creative Writer', desc: 'Cria conteúdo original e artigos.' },
+    { key: 'technical_expert', label: 'Technical Expert', desc: 'Responde dúvidas técnicas e orienta implementações.' },
     { key: 'content_refiner', label: 'Content Refiner', desc: 'Refina o conteúdo com base no feedback.' },
   ];
   const getTranscript = useAgentEventsStore((s) => s.getAgentTranscript);
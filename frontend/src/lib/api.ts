@@ -7,6 +7,12 @@ const API_BASE_URL = import.meta.env.VITE_API_BASE_URL ||
     ? 'https://us-central1-luminus-aca84.cloudfunctions.net' 
     : 'http://127.0.0.1:8000');
 
+// Retomada do stream SSE (Last-Event-ID) após queda de conexão
+const STREAM_RESUME_ATTEMPTS = 5;
+const STREAM_RESUME_BACKOFF_MS = 500;
+
+const sleep = (ms: number) => new Promise<void>((resolve) => setTimeout(resolve, ms));
+
 interface ApiResponse<T> {
   data?: T;
   error?: string;
@@ -46,6 +52,10 @@ interface RunSSERequest {
   streaming: boolean;
   stateDelta?: Record<string, any>;
   locale?: string;
+  // Reenvios do mesmo turno (ex.: fallback de endpoint) reutilizam a execução em andamento
+  idempotencyKey?: string;
+  // "route" (padrão): um especialista; "parallel": especialistas em paralelo + consolidação
+  agentMode?: 'route' | 'parallel';
 }
 
 interface ContentPart {
@@ -68,6 +78,9 @@ interface UsageMetadata {
   promptTokenCount: number;
   promptTokensDetails: TokensDetails[];
   totalTokenCount: number;
+  // Tokens por agente e origem da contagem ('model' | 'cache' | 'estimate')
+  byAgent?: Record<string, { promptTokenCount: number; candidatesTokenCount: number; totalTokenCount: number }>;
+  source?: string;
 }
 
 interface Actions {
@@ -153,7 +166,8 @@ class ApiService {
         parts: [{ text: message }]
       },
       streaming: true,
-      stateDelta: {}
+      stateDelta: {},
+      idempotencyKey: crypto.randomUUID()
     };
 
     // Seleciona o endpoint conforme a baseUrl: Firebase Functions x Backend próprio
@@ -185,7 +199,7 @@ class ApiService {
     userId: string = 'default-user',
     onDelta?: (delta: string) => void,
     onStatus?: (info: { agent: string; state: 'thinking' | 'executing' | 'done'; timestamp?: number }) => void,
-    onAgentDelta?: (info: { agent: string; delta: string; invocationId: string; timestamp: number }) => void,
+    onAgentDelta?: (info: { agent: string; delta: string; invocationId: string; timestamp: number; branch?: string }) => void,
     signal?: AbortSignal,
     locale?: string
   ): Promise<{ finalText: string }> {
@@ -199,7 +213,8 @@ class ApiService {
        },
        streaming: true,
        stateDelta: {},
-       locale
+       locale,
+       idempotencyKey: crypto.randomUUID()
      };
 
     // Seleciona o endpoint conforme a baseUrl: Firebase Functions x Backend próprio
@@ -208,85 +223,118 @@ class ApiService {
     console.log('[api] sendMessageStream → POST', `${this.baseUrl}${endpoint}`);
     const headers: Record<string, string> = { 'Content-Type': 'application/json', 'Accept': 'text/event-stream' };
     if (this.apiKey) headers['X-API-Key'] = this.apiKey;
-    const response = await fetch(`${this.baseUrl}${endpoint}`, {
-      method: 'POST',
-      headers,
-      body: JSON.stringify(request),
-      signal,
+    const yieldToUi = () => new Promise<void>((resolve) => {
+      if (typeof requestAnimationFrame !== 'undefined') {
+        requestAnimationFrame(() => resolve());
+      } else {
+        setTimeout(() => resolve(), 0);
+      }
     });
 
-    if (!response.ok) {
-      const text = await response.text().catch(() => '');
-      throw new Error(text || `HTTP ${response.status}`);
-    }
+    let finalText = '';
+    // Id do último evento recebido: numa queda de conexão o stream é retomado com Last-Event-ID
+    let lastEventId: string | null = null;
 
-    // Se não for streaming, devolver JSON normal
-    const contentType = response.headers.get('Content-Type') || '';
-    console.log('[api] Content-Type:', contentType);
-    if (!contentType.includes('text/event-stream')) {
-      const data = await response.json();
-      const finalText = data?.content?.parts?.[0]?.text || '';
-      if (finalText && onDelta) onDelta(finalText);
-      console.log('[api] Non-stream JSON finalText len=', finalText.length);
-      return { finalText };
-    }
+    for (let attempt = 0; ; attempt++) {
+      if (lastEventId) headers['Last-Event-ID'] = lastEventId;
+      let response: Response;
+      try {
+        response = await fetch(`${this.baseUrl}${endpoint}`, {
+          method: 'POST',
+          headers,
+          body: JSON.stringify(request),
+          signal,
+        });
+      } catch (err) {
+        if (!lastEventId || signal?.aborted || attempt >= STREAM_RESUME_ATTEMPTS) throw err;
+        await sleep(STREAM_RESUME_BACKOFF_MS * 2 ** attempt);
+        continue;
+      }
 
-    const reader = response.body?.getReader();
-    if (!reader) return { finalText: '' };
+      if (!response.ok) {
+        const text = await response.text().catch(() => '');
+        throw new Error(text || `HTTP ${response.status}`);
+      }
 
-    const decoder = new TextDecoder();
-    let buffer = '';
-    let finalText = '';
+      // Se não for streaming, devolver JSON normal
+      const contentType = response.headers.get('Content-Type') || '';
+      console.log('[api] Content-Type:', contentType);
+      if (!contentType.includes('text/event-stream')) {
+        const data = await response.json();
+        const text = data?.content?.parts?.[0]?.text || '';
+        if (text && onDelta) onDelta(text);
+        console.log('[api] Non-stream JSON finalText len=', text.length);
+        return { finalText: text };
+      }
+      if (response.headers.get('X-Resumed')) {
+        console.log('[api] stream retomado após', lastEventId);
+      }
+
+      const reader = response.body?.getReader();
+      if (!reader) return { finalText: '' };
+
+      const decoder = new TextDecoder();
+      let buffer = '';
 
-    while (true) {
-      const { value, done } = await reader.read();
-      if (done) break;
-      buffer += decoder.decode(value, { stream: true });
-
-      const events = buffer.split('\n\n');
-      buffer = events.pop() || '';
-
-      for (const raw of events) {
-        const line = raw.trim();
-        if (!line.startsWith('data: ')) continue;
-        const jsonStr = line.replace(/^data: /, '');
-        try {
-          const payload = JSON.parse(jsonStr);
-          if (payload?.type === 'status' && payload.agent && payload.state && onStatus) {
-            onStatus({ agent: payload.agent, state: payload.state, timestamp: payload.timestamp });
-          } else if (payload?.delta) {
-            finalText += payload.delta;
-            onDelta?.(payload.delta);
-            if (payload.agent && payload.invocationId && onAgentDelta) {
-              onAgentDelta({ agent: payload.agent, delta: payload.delta, invocationId: payload.invocationId, timestamp: payload.timestamp || Date.now() });
+      try {
+        while (true) {
+          const { value, done } = await reader.read();
+          if (done) break;
+          buffer += decoder.decode(value, { stream: true }).replace(/\r\n/g, '\n');
+
+          const events = buffer.split('\n\n');
+          buffer = events.pop() || '';
+
+          for (const raw of events) {
+            // Um evento SSE pode ter várias linhas: "id: ..." e "data: ..."
+            let eventId: string | null = null;
+            const dataLines: string[] = [];
+            for (const line of raw.split('\n')) {
+              if (line.startsWith('id:')) eventId = line.slice(3).trim();
+              else if (line.startsWith('data:')) dataLines.push(line.slice(5).replace(/^ /, ''));
             }
-            console.log('[api] delta len=', payload.delta.length, 'preview=', String(payload.delta).slice(0, 40));
-            // Ceder ao event loop para permitir repaint imediato
-            await new Promise<void>((resolve) => {
-              if (typeof requestAnimationFrame !== 'undefined') {
-                requestAnimationFrame(() => resolve());
-              } else {
-                setTimeout(() => resolve(), 0);
+            if (!dataLines.length) continue;
+            try {
+              const payload = JSON.parse(dataLines.join('\n'));
+              if (eventId) lastEventId = eventId;
+              if (payload?.type === 'status' && payload.agent && payload.state && onStatus) {
+                onStatus({ agent: payload.agent, state: payload.state, timestamp: payload.timestamp });
+              } else if (payload?.type === 'gap') {
+                console.warn('[api] eventos perdidos na retomada:', payload.missedEvents);
+              } else if (payload?.delta) {
+                // Deltas de ramos paralelos (agentMode "parallel") são resultados intermediários:
+                // vão só para o agente; a resposta é o texto da consolidação
+                if (!payload.branch) {
+                  finalText += payload.delta;
+                  onDelta?.(payload.delta);
+                }
+                if (payload.agent && payload.invocationId && onAgentDelta) {
+                  onAgentDelta({ agent: payload.agent, delta: payload.delta, invocationId: payload.invocationId, timestamp: payload.timestamp || Date.now(), branch: payload.branch });
+                }
+                console.log('[api] delta len=', payload.delta.length, 'preview=', String(payload.delta).slice(0, 40));
+                // Ceder ao event loop para permitir repaint imediato
+                await yieldToUi();
               }
-            });
-          }
-          if (payload?.done || payload?.type === 'done') {
-            // finalizar
-            console.log('[api] done signal received');
-            return { finalText: finalText.trim() };
+              if (payload?.done || payload?.type === 'done') {
+                // finalizar
+                console.log('[api] done signal received');
+                return { finalText: finalText.trim() };
+              }
+            } catch {
+              // ignorar eventos malformados
+            }
           }
-        } catch {
-          // ignorar eventos malformados
+          // Ceder entre blocos também
+          await yieldToUi();
         }
+      } catch (err) {
+        if (!lastEventId || signal?.aborted || attempt >= STREAM_RESUME_ATTEMPTS) throw err;
       }
-      // Ceder entre blocos também
-      await new Promise<void>((resolve) => {
-        if (typeof requestAnimationFrame !== 'undefined') {
-          requestAnimationFrame(() => resolve());
-        } else {
-          setTimeout(() => resolve(), 0);
-        }
-      });
+
+      // Conexão caiu antes do evento final: retomar a partir do último id recebido
+      if (!lastEventId || signal?.aborted || attempt >= STREAM_RESUME_ATTEMPTS) break;
+      console.log('[api] conexão interrompida, retomando stream de', lastEventId);
+      await sleep(STREAM_RESUME_BACKOFF_MS * 2 ** attempt);
     }
 
     return { finalText: finalText.trim() };
@@ -0,0 +1,67 @@
+"""Modelo Gemini dos agentes, com registro do uso de tokens de cada chamada.
+
+No google-adk 0.1.0 o ``LlmResponse`` (e, portanto, o ``Event``) não carrega o
+``usage_metadata`` da ``GenerateContentResponse``. ``UsageGemini`` é o mesmo
+``Gemini`` do ADK com o cliente do google-genai envolvido: cada resposta da API
+tem o uso lido e registrado no turno corrente (``agent_runtime.record_model_usage``)
+em nome do agente dono do modelo. Em streaming vale o ``usage_metadata`` do
+último pedaço, que traz o total da chamada.
+"""
+from functools import cached_property
+from typing import Any
+
+from google.adk.models import Gemini
+
+from agent_runtime import record_model_usage, usage_from_metadata
+
+
+class _Proxy:
+    """Repassa atributos ao objeto envolvido, exceto os substituídos"""
+
+    def __init__(self, target: Any, **overrides: Any):
+        self._target = target
+        self.__dict__.update(overrides)
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._target, name)
+
+
+class _UsageModels(_Proxy):
+    """``client.aio.models`` com registro do uso das respostas"""
+
+    def __init__(self, models: Any, agent_name: str):
+        super().__init__(models)
+        self._agent_name = agent_name
+
+    async def generate_content(self, **kwargs):
+        response = await self._target.generate_content(**kwargs)
+        record_model_usage(self._agent_name, usage_from_metadata(getattr(response, "usage_metadata", None)))
+        return response
+
+    async def generate_content_stream(self, **kwargs):
+        return self._recording(await self._target.generate_content_stream(**kwargs))
+
+    async def _recording(self, responses):
+        usage = None
+        try:
+            async for response in responses:
+                usage = getattr(response, "usage_metadata", None) or usage
+                yield response
+        finally:
+            # Registrado antes de o Gemini emitir o texto agregado da chamada
+            record_model_usage(self._agent_name, usage_from_metadata(usage))
+
+
+def usage_client(client: Any, agent_name: str) -> _Proxy:
+    """Envolve um ``google.genai.Client`` para registrar o uso em nome de ``agent_name``"""
+    return _Proxy(client, aio=_Proxy(client.aio, models=_UsageModels(client.aio.models, agent_name)))
+
+
+class UsageGemini(Gemini):
+    """``Gemini`` de um agente (``agent_name``) que registra o uso de tokens."""
+
+    agent_name: str = ""
+
+    @cached_property
+    def api_client(self):
+        return usage_client(Gemini.api_client.func(self), self.agent_name)
@@ -0,0 +1,283 @@
+"""Turnos em andamento compartilhados entre requisições duplicadas.
+
+Cada turno do ``/run_sse`` é executado por uma task desacoplada da conexão
+HTTP, que publica os frames SSE e o resultado final num ``InflightTurn``.
+Os clientes apenas acompanham o turno: uma requisição duplicada (mesma chave
+de idempotência, ou mesma sessão e mensagem dentro de uma janela curta) se liga
+ao turno existente e recebe o mesmo stream ou o mesmo resultado, sem iniciar
+outra execução do agente.
+
+Cada frame publicado recebe o id SSE ``<invocationId>:<seq>`` (``seq``
+crescente a partir de 1) e fica num buffer circular do turno
+(``SSE_REPLAY_MAX_FRAMES``), mantido por ``SSE_REPLAY_TTL`` segundos após o
+fim. Um cliente que reconecta com ``Last-Event-ID`` recebe os frames perdidos
+e continua acompanhando a execução ao vivo (``InflightRegistry.resume``).
+Quando o último cliente sai, a execução é cancelada após ``SSE_RESUME_GRACE``
+segundos se ninguém reconectar.
+
+O registro é do processo: com vários workers, a reconexão só encontra o turno
+no worker que o executa (balanceador com afinidade por sessão); nos demais o
+id é desconhecido e o servidor responde 404, sem iniciar outro turno.
+
+Deve ser usado a partir de um único event loop (sem locks).
+"""
+import asyncio
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from sse import SSE_DISCONNECT_POLL_INTERVAL, ClientDisconnected, sse_frame
+
+# Configurações
+# Janela (segundos) em que a mesma sessão + mensagem sem chave é tratada como duplicada
+INFLIGHT_DEDUP_WINDOW = float(os.getenv("INFLIGHT_DEDUP_WINDOW", "10"))
+# Retenção (segundos) do resultado de um turno com chave de idempotência explícita
+IDEMPOTENCY_KEY_TTL = float(os.getenv("IDEMPOTENCY_KEY_TTL", "600"))
+# Máximo de turnos concluídos retidos para repetição
+INFLIGHT_MAX_RETAINED = int(os.getenv("INFLIGHT_MAX_RETAINED", "1000"))
+# Frames mantidos por turno para reenvio após reconexão (buffer circular)
+SSE_REPLAY_MAX_FRAMES = int(os.getenv("SSE_REPLAY_MAX_FRAMES", "4096"))
+# Retenção (segundos) dos frames de um turno concluído para reconexões com Last-Event-ID
+SSE_REPLAY_TTL = float(os.getenv("SSE_REPLAY_TTL", "120"))
+# Segundos que a execução continua sem clientes, aguardando uma reconexão
+SSE_RESUME_GRACE = float(os.getenv("SSE_RESUME_GRACE", "15"))
+
+
+def parse_event_id(event_id: str) -> Optional[Tuple[str, int]]:
+    """``(invocationId, seq)`` de um id ``<invocationId>:<seq>`` (``None`` se inválido)"""
+    invocation_id, sep, seq = (event_id or "").strip().rpartition(":")
+    if not sep or not invocation_id or not seq.isdigit():
+        return None
+    return invocation_id, int(seq)
+
+
+def turn_key(user_id: str, session_id: str, message: str,
+             idempotency_key: Optional[str] = None) -> Tuple[str, float]:
+    """Retorna ``(chave, retenção)`` do turno.
+
+    Com chave de idempotência o resultado fica retido por ``IDEMPOTENCY_KEY_TTL``;
+    sem ela, a chave é o hash de sessão + mensagem e vale por ``INFLIGHT_DEDUP_WINDOW``.
+    """
+    if idempotency_key:
+        raw = "\0".join(("key", user_id, session_id, idempotency_key))
+        retention = IDEMPOTENCY_KEY_TTL
+    else:
+        raw = "\0".join(("msg", user_id, session_id, message))
+        retention = INFLIGHT_DEDUP_WINDOW
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest(), retention
+
+
+class InflightTurn:
+    """Frames publicados e resultado de um turno, com os clientes que o acompanham."""
+
+    def __init__(self, key: str, retention: float, invocation_id: str = "",
+                 owner: Optional[Tuple[str, str]] = None, max_frames: int = SSE_REPLAY_MAX_FRAMES,
+                 resume_grace: float = SSE_RESUME_GRACE):
+        self.key = key
+        self.retention = retention
+        self.invocation_id = invocation_id
+        # (userId, sessionId) de quem iniciou: só o dono pode retomar o stream
+        self.owner = owner
+        self.max_frames = max(1, max_frames)
+        self.resume_grace = resume_grace
+        # Buffer circular: frames[i] tem seq first_seq + i
+        self.frames: List[bytes] = []
+        self.first_seq = 1
+        self.last_seq = 0
+        self.bytes_published = 0
+        # {"text": str, "agents": list, "error": Optional[str]}
+        self.result: Optional[Dict[str, Any]] = None
+        self.done = False
+        self.finished_at: Optional[float] = None
+        self.subscribers = 0
+        self.task: Optional[asyncio.Future] = None
+        # Trace da requisição que iniciou o turno (header X-Trace-Id dos duplicados)
+        self.trace_id: Optional[str] = None
+        self._cancel_handle: Optional[asyncio.TimerHandle] = None
+        self._changed = asyncio.Event()
+
+    def publish(self, frame: bytes):
+        """Publica um frame SSE (``data: ...``), prefixado com o próximo id"""
+        self.last_seq += 1
+        frame = b"id: " + f"{self.invocation_id}:{self.last_seq}".encode("utf-8") + b"\n" + frame
+        self.frames.append(frame)
+        self.bytes_published += len(frame)
+        # Descarta os mais antigos em blocos (custo amortizado constante por frame)
+        excess = len(self.frames) - self.max_frames
+        if excess > self.max_frames // 4:
+            del self.frames[:excess]
+            self.first_seq += excess
+        self._notify()
+
+    def finish(self, result: Dict[str, Any]):
+        if self.done:
+            return
+        self.result = result
+        self.done = True
+        self.finished_at = time.monotonic()
+        self._notify()
+
+    def subscribe(self):
+        self.subscribers += 1
+        if self._cancel_handle is not None:
+            # Cliente reconectou dentro da carência: a execução continua
+            self._cancel_handle.cancel()
+            self._cancel_handle = None
+
+    def unsubscribe(self, grace: bool = False):
+        """Sai do turno; sem clientes restantes, cancela a execução em andamento.
+
+        Com ``grace`` (cliente de streaming que caiu) o cancelamento espera
+        ``resume_grace`` segundos por uma reconexão.
+        """
+        self.subscribers -= 1
+        if self.subscribers > 0 or self.done or self.task is None or self.task.done():
+            return
+        if grace and self.resume_grace > 0:
+            if self._cancel_handle is None:
+                self._cancel_handle = asyncio.get_running_loop().call_later(self.resume_grace, self._cancel_abandoned)
+        else:
+            self.task.cancel()
+
+    def _cancel_abandoned(self):
+        self._cancel_handle = None
+        if self.subscribers <= 0 and not self.done and self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    async def follow(self, after: int = 0, is_disconnected: Optional[Callable[[], bool]] = None,
+                     poll_interval: float = SSE_DISCONNECT_POLL_INTERVAL) -> AsyncIterator[bytes]:
+        """Gera os frames com seq maior que ``after`` e acompanha os novos até o fim do turno.
+
+        Se parte deles já saiu do buffer circular, emite antes um evento
+        ``{"type": "gap", "missedEvents": n}`` (sem id) e continua do mais antigo retido.
+        Com ``is_disconnected`` a conexão é verificada a cada ``poll_interval``
+        segundos enquanto não há frames novos; se o cliente saiu, levanta
+        ``ClientDisconnected``.
+        """
+        seq = after + 1
+        while True:
+            if seq < self.first_seq:
+                # O buffer circular foi podado (inclusive enquanto este cliente estava suspenso)
+                yield sse_frame({"type": "gap", "invocationId": self.invocation_id, "missedEvents": self.first_seq - seq})
+                seq = self.first_seq
+            elif seq <= self.last_seq:
+                yield self.frames[seq - self.first_seq]
+                seq += 1
+            elif self.done:
+                return
+            else:
+                if is_disconnected is not None and is_disconnected():
+                    raise ClientDisconnected()
+                await self._wait(poll_interval if is_disconnected is not None else None)
+
+    async def wait_result(self) -> Dict[str, Any]:
+        while not self.done:
+            await self._wait(None)
+        return self.result
+
+    async def _wait(self, timeout: Optional[float]):
+        changed = self._changed
+        try:
+            await asyncio.wait_for(changed.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    def _notify(self):
+        # Acorda todos os clientes à espera; os próximos esperam num evento novo
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+
+class InflightRegistry:
+    """Turnos em andamento e concluídos recentemente, por chave e por invocationId."""
+
+    def __init__(self, max_retained: int = INFLIGHT_MAX_RETAINED, replay_ttl: float = SSE_REPLAY_TTL):
+        self.max_retained = max_retained
+        self.replay_ttl = replay_ttl
+        self._turns: "OrderedDict[str, InflightTurn]" = OrderedDict()
+        # Streams retomáveis (Last-Event-ID), independentes da janela de deduplicação
+        self._streams: "OrderedDict[str, InflightTurn]" = OrderedDict()
+        self.started = 0
+        self.coalesced = 0
+        self.replayed = 0
+        self.resumed = 0
+
+    def attach(self, key: str) -> Optional[InflightTurn]:
+        """Turno existente para a chave (em andamento ou retido), já com o cliente inscrito"""
+        self._purge()
+        turn = self._turns.get(key)
+        if turn is None:
+            return None
+        if turn.done:
+            self.replayed += 1
+        else:
+            self.coalesced += 1
+        turn.subscribe()
+        return turn
+
+    def start(self, key: str, retention: float, invocation_id: str = "",
+              owner: Optional[Tuple[str, str]] = None) -> InflightTurn:
+        """Registra um turno novo, com o cliente que o iniciou inscrito"""
+        turn = InflightTurn(key, retention, invocation_id, owner)
+        turn.subscribe()
+        self._turns[key] = turn
+        if invocation_id:
+            self._streams[invocation_id] = turn
+        self.started += 1
+        return turn
+
+    def resume(self, event_id: str, owner: Tuple[str, str]) -> Optional[Tuple[InflightTurn, int]]:
+        """Turno e último seq recebido de um ``Last-Event-ID``, já com o cliente inscrito.
+
+        ``None`` se o id é inválido, o stream expirou, foi iniciado em outro processo
+        ou pertence a outro usuário/sessão.
+        """
+        self._purge()
+        parsed = parse_event_id(event_id)
+        if parsed is None:
+            return None
+        invocation_id, seq = parsed
+        turn = self._streams.get(invocation_id)
+        if turn is None or turn.owner != owner:
+            return None
+        self.resumed += 1
+        turn.subscribe()
+        return turn, seq
+
+    def discard(self, turn: InflightTurn):
+        """Remove o turno da deduplicação (ex.: falhou ou foi truncado: não deve ser repetido).
+
+        Os frames continuam disponíveis para reconexões até ``replay_ttl``.
+        """
+        if self._turns.get(turn.key) is turn:
+            del self._turns[turn.key]
+
+    def stats(self) -> Dict[str, Any]:
+        self._purge()
+        running = sum(1 for turn in self._turns.values() if not turn.done)
+        return {
+            "running": running,
+            "retained": len(self._turns) - running,
+            "started": self.started,
+            "coalesced": self.coalesced,
+            "replayed": self.replayed,
+            "resumable": len(self._streams),
+            "resumed": self.resumed,
+        }
+
+    def _purge(self):
+        now = time.monotonic()
+        finished = [turn for turn in self._turns.values() if turn.done]
+        excess = len(finished) - self.max_retained
+        for turn in finished:
+            if excess > 0 or now - turn.finished_at >= turn.retention:
+                excess -= 1
+                del self._turns[turn.key]
+        finished = [turn for turn in self._streams.values() if turn.done]
+        excess = len(finished) - self.max_retained
+        for turn in finished:
+            if excess > 0 or now - turn.finished_at >= self.replay_ttl:
+                excess -= 1
+                del self._streams[turn.invocation_id]
@@ -0,0 +1,344 @@
+"""Armazenamento local de sessões e mensagens (fallback quando não há Firestore).
+
+Dois backends, escolhidos por ``LOCAL_STORE``:
+
+- ``memory`` (padrão): dicts do processo com o índice por usuário de
+  ``session_index.py``. Cada worker do uvicorn tem a sua própria visão.
+- ``sqlite``: arquivo SQLite em modo WAL (``LOCAL_STORE_PATH``) compartilhado
+  por todos os workers do nó (``uvicorn server:app --workers N``). Leituras não
+  bloqueiam escritas; as atualizações de metadados (``messageCount``, uso de
+  tokens) são read-modify-write dentro de ``BEGIN IMMEDIATE``, que serializa
+  os escritores entre processos, e a espera pelo lock é limitada por
+  ``LOCAL_STORE_BUSY_TIMEOUT``.
+
+Os dois backends expõem a mesma interface, com as mesmas semânticas de
+paginação do servidor: mensagens em ordem de gravação (cursor = posição da
+última mensagem, append-only) e sessões por ``lastActivity`` decrescente
+(cursor = chave ``(lastActivity, sessionId)`` da última sessão, ``encode_cursor``). O servidor chama os métodos por ``run``: no
+SQLite eles rodam num pool de threads próprio, nunca no event loop.
+"""
+import asyncio
+import functools
+import json
+import logging
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from agent_runtime import merge_turn_usage
+from session_index import BATCH_SESSION_SOURCE, UserSessionIndex, decode_cursor, encode_cursor
+
+logger = logging.getLogger("practia.local_store")
+
+# Configurações
+# "memory" (por processo) ou "sqlite" (compartilhado entre workers)
+LOCAL_STORE = os.getenv("LOCAL_STORE", "memory").lower()
+LOCAL_STORE_PATH = os.getenv("LOCAL_STORE_PATH", "luminus_local.db")
+# Segundos máximos esperando o lock de escrita de outro worker
+LOCAL_STORE_BUSY_TIMEOUT = float(os.getenv("LOCAL_STORE_BUSY_TIMEOUT", "10"))
+# Threads do pool que executa as operações do SQLite
+LOCAL_STORE_THREADS = int(os.getenv("LOCAL_STORE_THREADS", "4"))
+
+
+def _parse_cursor(cursor: Optional[str]) -> int:
+    """Cursor de mensagens: inteiro não negativo (``None`` = início)"""
+    try:
+        position = int(cursor) if cursor else 0
+    except ValueError:
+        raise ValueError("Cursor inválido")
+    if position < 0:
+        raise ValueError("Cursor inválido")
+    return position
+
+
+def _apply_update(session: Dict, updates: Dict, message_delta: int, usage: Optional[Dict]) -> Dict:
+    session.update(updates)
+    if message_delta:
+        session['messageCount'] = session.get('messageCount', 0) + message_delta
+    if usage:
+        session['usage'] = merge_turn_usage(session.get('usage'), usage)
+    return session
+
+
+class MemoryLocalStore:
+    """Sessões e mensagens em dicts do processo."""
+
+    backend = "memory"
+
+    def __init__(self):
+        self.sessions: Dict[str, Dict] = {}
+        self.messages: Dict[str, List[Dict]] = {}
+        self._message_count = 0
+        # Índice por usuário ordenado por lastActivity (listagem sem varrer sessions)
+        self.index = UserSessionIndex()
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Dicts do processo: executa direto no event loop"""
+        return func(*args, **kwargs)
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        return self.sessions.get(session_id)
+
+    def put_session(self, session_id: str, session_data: Dict):
+        self.sessions[session_id] = session_data
+        self.index.upsert(session_data)
+
+    def update_session(self, session_id: str, updates: Dict, message_delta: int = 0,
+                       usage: Optional[Dict] = None) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        self.index.upsert(_apply_update(session, updates, message_delta, usage))
+        return True
+
+    def delete_session(self, session_id: str, deleted_at: str) -> bool:
+        session = self.sessions.get(session_id)
+        if session is None:
+            return False
+        session['deleted'] = True
+        session['deletedAt'] = deleted_at
+        self.index.remove(session_id)
+        return True
+
+    def list_sessions(self, user_id: str, app_name: Optional[str], limit: int,
+                      cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        session_ids, next_cursor = self.index.page(user_id, app_name, limit, cursor)
+        return [self.sessions[session_id] for session_id in session_ids], next_cursor
+
+    def append_message(self, session_id: str, message: Dict):
+        self.messages.setdefault(session_id, []).append(message)
+        self._message_count += 1
+
+    def messages_page(self, session_id: str, limit: int,
+                      cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        """Mensagens depois de ``cursor`` e o cursor da próxima página (``None`` no fim)"""
+        offset = _parse_cursor(cursor)
+        stored = self.messages.get(session_id, [])
+        page = stored[offset:offset + limit]
+        return page, str(offset + len(page)) if offset + limit < len(stored) else None
+
+    def counts(self) -> Dict[str, int]:
+        return {"sessions": len(self.sessions), "messages": self._message_count}
+
+    def close(self):
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    user_id TEXT,
+    app_name TEXT,
+    last_activity TEXT NOT NULL DEFAULT '',
+    deleted INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_by_user
+    ON sessions (user_id, deleted, last_activity, session_id);
+CREATE INDEX IF NOT EXISTS sessions_by_user_app
+    ON sessions (user_id, app_name, deleted, last_activity, session_id);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_by_session ON messages (session_id, id);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) SELECT 'sessions', COUNT(*) FROM sessions;
+INSERT OR IGNORE INTO counters (name, value) SELECT 'messages', COUNT(*) FROM messages;
+CREATE TRIGGER IF NOT EXISTS sessions_counter AFTER INSERT ON sessions
+BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'sessions';
+END;
+CREATE TRIGGER IF NOT EXISTS messages_counter AFTER INSERT ON messages
+BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'messages';
+END;
+"""
+
+
+class SQLiteLocalStore:
+    """Sessões e mensagens num arquivo SQLite (WAL) compartilhado entre processos.
+
+    Uma conexão por thread do pool próprio (``run``); transações curtas e em
+    autocommit fora delas. Os totais de sessões e mensagens ficam na tabela
+    ``counters``, mantida por triggers, para que /metrics não faça ``COUNT(*)``.
+    """
+
+    backend = "sqlite"
+
+    def __init__(self, path: str = LOCAL_STORE_PATH, busy_timeout: float = LOCAL_STORE_BUSY_TIMEOUT):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._lock = threading.Lock()
+        # Criado sob demanda: close() no fim de um lifespan não inutiliza o store do módulo
+        self._executor: Optional[ThreadPoolExecutor] = None
+        conn = self._conn()
+        # journal_mode=WAL fica gravado no arquivo; o schema é idempotente entre workers
+        conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction() as tx:
+            # executescript faria COMMIT da transação: os triggers têm ";" internos
+            for statement in _schema_statements():
+                tx.execute(statement)
+        logger.info(f"[local_store] SQLite compartilhado em {path} (WAL)")
+
+    async def run(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Executa uma operação no pool de threads do store"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool(), functools.partial(func, *args, **kwargs))
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=LOCAL_STORE_THREADS, thread_name_prefix="local-store")
+            return self._executor
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn())
+
+    def get_session(self, session_id: str) -> Optional[Dict]:
+        row = self._conn().execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_session(self, session_id: str, session_data: Dict):
+        with self._transaction() as tx:
+            self._write_session(tx, session_id, session_data)
+
+    def update_session(self, session_id: str, updates: Dict, message_delta: int = 0,
+                       usage: Optional[Dict] = None) -> bool:
+        # Read-modify-write sob o lock de escrita: incrementos de outros workers não se perdem
+        with self._transaction() as tx:
+            row = tx.execute("SELECT data FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+            if row is None:
+                return False
+            self._write_session(tx, session_id, _apply_update(json.loads(row[0]), updates, message_delta, usage))
+            return True
+
+    def delete_session(self, session_id: str, deleted_at: str) -> bool:
+        return self.update_session(session_id, {'deleted': True, 'deletedAt': deleted_at})
+
+    def list_sessions(self, user_id: str, app_name: Optional[str], limit: int,
+                      cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        conn = self._conn()
+        # Sessões criadas por um lote ficam fora da listagem (is_listed)
+        where = "user_id = ? AND deleted = 0 AND json_extract(data, '$.source') IS NOT ?"
+        params: List = [user_id, BATCH_SESSION_SOURCE]
+        if app_name is not None:
+            where += " AND app_name = ?"
+            params.append(app_name)
+        if cursor:
+            # Keyset na chave do cursor: não depende da sessão ainda existir ou estar no mesmo lugar
+            last_activity, session_id = decode_cursor(cursor, user_id, app_name)
+            where += " AND (last_activity, session_id) < (?, ?)"
+            params += [str(last_activity), session_id]
+        rows = conn.execute(
+            f"SELECT session_id, last_activity, data FROM sessions WHERE {where} "
+            f"ORDER BY last_activity DESC, session_id DESC LIMIT ?",
+            params + [limit + 1],
+        ).fetchall()
+        page = rows[:limit]
+        next_cursor = encode_cursor(user_id, app_name, page[-1][1], page[-1][0]) if len(rows) > limit and page else None
+        return [json.loads(data) for _, _, data in page], next_cursor
+
+    def append_message(self, session_id: str, message: Dict):
+        self._conn().execute("INSERT INTO messages (session_id, data) VALUES (?, ?)",
+                             (session_id, json.dumps(message, ensure_ascii=False)))
+
+    def messages_page(self, session_id: str, limit: int,
+                      cursor: Optional[str] = None) -> Tuple[List[Dict], Optional[str]]:
+        # Keyset no id (cursor = id da última mensagem): cada página é uma busca no índice
+        rows = self._conn().execute(
+            "SELECT id, data FROM messages WHERE session_id = ? AND id > ? ORDER BY id LIMIT ?",
+            (session_id, _parse_cursor(cursor), limit + 1),
+        ).fetchall()
+        page = rows[:limit]
+        next_cursor = str(page[-1][0]) if len(rows) > limit else None
+        return [json.loads(data) for _, data in page], next_cursor
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self._conn().execute("SELECT name, value FROM counters").fetchall())
+
+    def close(self):
+        """Encerra o pool e as conexões; o próximo uso (novo lifespan) abre outros"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    @staticmethod
+    def _write_session(tx: sqlite3.Connection, session_id: str, session_data: Dict):
+        tx.execute(
+            "INSERT INTO sessions (session_id, user_id, app_name, last_activity, deleted, data) "
+            "VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+            "user_id = excluded.user_id, app_name = excluded.app_name, "
+            "last_activity = excluded.last_activity, deleted = excluded.deleted, data = excluded.data",
+            (
+                session_id,
+                session_data.get('userId'),
+                session_data.get('appName'),
+                str(session_data.get('lastActivity') or ''),
+                1 if session_data.get('deleted', False) else 0,
+                json.dumps(session_data, ensure_ascii=False, default=str),
+            ),
+        )
+
+
+def _schema_statements() -> List[str]:
+    """Comandos de ``_SCHEMA``, mantendo o corpo ``BEGIN ... END;`` dos triggers inteiro"""
+    statements, current = [], ""
+    for line in _SCHEMA.strip().splitlines():
+        current += line + "\n"
+        if sqlite3.complete_statement(current):
+            statements.append(current.strip())
+            current = ""
+    return statements
+
+
+class _ImmediateTransaction:
+    """``BEGIN IMMEDIATE`` ... ``COMMIT``/``ROLLBACK``: pega o lock de escrita logo no início"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self) -> sqlite3.Connection:
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        return False
+
+
+def create_local_store():
+    """Backend configurado em ``LOCAL_STORE`` (``memory`` se o SQLite não abrir)"""
+    if LOCAL_STORE == "sqlite":
+        try:
+            return SQLiteLocalStore()
+        except Exception as e:
+            logger.error(f"[local_store] Falha ao abrir {LOCAL_STORE_PATH}: {e}. Usando memória do processo")
+    elif LOCAL_STORE != "memory":
+        logger.warning(f"[local_store] LOCAL_STORE={LOCAL_STORE} desconhecido. Usando memória do processo")
+    return MemoryLocalStore()
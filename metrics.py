@@ -0,0 +1,279 @@
+"""Registro de métricas em processo no formato de exposição do Prometheus.
+
+Implementação mínima (contadores, gauges e histogramas com labels), sem
+dependências externas; ``REGISTRY.render()`` gera o texto servido em ``/metrics``.
+"""
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TURN_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0, 120.0)
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels_text(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), registry: Optional["MetricsRegistry"] = None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        (registry or REGISTRY).register(self)
+
+    def labels(self, *values: str):
+        if len(values) != len(self.labelnames):
+            raise ValueError(f"{self.name}: esperados labels {self.labelnames}")
+        key = tuple(str(value) for value in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def _default(self):
+        return self.labels()
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Value:
+    def __init__(self):
+        self._value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def value(self) -> float:
+        return self._function() if self._function is not None else self._value
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        with self._lock:
+            self._value -= amount
+
+    def set(self, value: float):
+        self._value = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Calcula o valor no momento da coleta"""
+        self._function = function
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels_text(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in list(self._children.items())]
+
+
+class Gauge(_Metric):
+    """Gauge com valor explícito ou calculado na coleta (``set_function``)."""
+    kind = "gauge"
+
+    def _new_child(self):
+        return _Value()
+
+    def inc(self, amount: float = 1.0):
+        self._default().inc(amount)
+
+    def dec(self, amount: float = 1.0):
+        self._default().dec(amount)
+
+    def set(self, value: float):
+        self._default().set(value)
+
+    def set_function(self, function: Callable[[], float]):
+        self._default().set_function(function)
+
+    def samples(self) -> List[str]:
+        return [f"{self.name}{_labels_text(self.labelnames, key)} {_format_value(child.value)}"
+                for key, child in list(self._children.items())]
+
+
+class _HistogramValue:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS, registry: Optional["MetricsRegistry"] = None):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramValue(self.buckets)
+
+    def observe(self, value: float):
+        self._default().observe(value)
+
+    def samples(self) -> List[str]:
+        lines = []
+        for key, child in list(self._children.items()):
+            with child._lock:
+                counts = list(child.counts)
+                total_sum = child.sum
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                labels = _labels_text(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _labels_text(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total_sum)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Métrica duplicada: {metric.name}")
+        self._metrics[metric.name] = metric
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+# Pipeline de chat (/run_sse)
+SSE_TIME_TO_FIRST_DELTA = Histogram(
+    "luminus_sse_time_to_first_delta_seconds",
+    "Tempo entre a chegada da requisição e o primeiro delta de texto publicado",
+    buckets=TURN_BUCKETS,
+)
+TURN_DURATION = Histogram(
+    "luminus_turn_duration_seconds",
+    "Duração total de um turno do /run_sse",
+    ["mode", "outcome"],
+    buckets=TURN_BUCKETS,
+)
+SSE_DELTAS_PER_RESPONSE = Histogram(
+    "luminus_sse_deltas_per_response",
+    "Frames de delta enviados por resposta em streaming",
+    buckets=COUNT_BUCKETS,
+)
+SSE_BYTES_PER_RESPONSE = Histogram(
+    "luminus_sse_bytes_per_response",
+    "Bytes de frames SSE enviados por resposta em streaming",
+    buckets=BYTES_BUCKETS,
+)
+SSE_STREAMS_IN_FLIGHT = Gauge(
+    "luminus_sse_streams_in_flight",
+    "Conexões SSE abertas acompanhando um turno",
+)
+WS_CONNECTIONS = Gauge(
+    "luminus_ws_connections",
+    "Conexões WebSocket abertas em /ws",
+)
+WS_STREAMS_IN_FLIGHT = Gauge(
+    "luminus_ws_streams_in_flight",
+    "Streams multiplexados nas conexões WebSocket acompanhando um turno",
+)
+BATCH_ITEMS = Counter(
+    "luminus_batch_items_total",
+    "Itens do /run_batch por resultado (completed, failed, timeout)",
+    ["status"],
+)
+AGENT_RUNS_IN_FLIGHT = Gauge(
+    "luminus_agent_runs_in_flight",
+    "Execuções do agente em andamento (vagas ocupadas no controle de admissão)",
+)
+
+# Agentes do ADK
+AGENT_RUN_DURATION = Histogram(
+    "luminus_agent_run_duration_seconds",
+    "Duração da execução de cada agente dentro de um turno",
+    ["agent"],
+    buckets=TURN_BUCKETS,
+)
+
+# Firestore
+FIRESTORE_OPERATION_DURATION = Histogram(
+    "luminus_firestore_operation_duration_seconds",
+    "Latência dos helpers de persistência",
+    ["operation", "backend"],
+)
+FIRESTORE_ERRORS = Counter(
+    "luminus_firestore_errors_total",
+    "Exceções levantadas por helpers de persistência",
+    ["operation"],
+)
+FIRESTORE_FALLBACKS = Counter(
+    "luminus_firestore_fallbacks_total",
+    "Operações do Firestore que falharam e foram atendidas pelo armazenamento em memória",
+    ["operation"],
+)
+
+# Boot do servidor
+STARTUP_DURATION = Gauge(
+    "luminus_startup_seconds",
+    "Tempo de inicialização por componente; ready e first_request contados desde o import do servidor",
+    ["phase"],
+)
+
+# Armazenamento em memória (fallback)
+FALLBACK_STORE_SIZE = Gauge(
+    "luminus_fallback_store_entries",
+    "Entradas nos dicionários em memória",
+    ["store"],
+)
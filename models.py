@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Literal
 
 class WeatherTimeRequest(BaseModel):
     query: str
@@ -25,6 +25,30 @@ class RunSSERequest(BaseModel):
     streaming: bool
     stateDelta: Optional[Dict[str, Any]] = None
     locale: Optional[str] = None
+    # Ignora o cache de respostas nesta requisição
+    bypassCache: Optional[bool] = False
+    # Chave de idempotência do turno (alternativa ao header Idempotency-Key)
+    idempotencyKey: Optional[str] = None
+    # Modo de execução: "route" (um especialista) ou "parallel" (especialistas em paralelo + consolidação)
+    agentMode: Optional[Literal["route", "parallel"]] = None
+
+# Modelos para o endpoint /run_batch
+class BatchItem(BaseModel):
+    prompt: str
+    # Sessão em que o turno é registrado; sem ela o item ganha uma sessão própria
+    sessionId: Optional[str] = None
+    # Identificador do chamador, devolvido no resultado do item
+    id: Optional[str] = None
+
+class RunBatchRequest(BaseModel):
+    appName: str
+    userId: str
+    items: List[BatchItem]
+    # Itens executando ao mesmo tempo e segundos máximos por item (limitados pelo servidor)
+    concurrency: Optional[int] = None
+    itemTimeout: Optional[float] = None
+    bypassCache: Optional[bool] = False
+    agentMode: Optional[Literal["route", "parallel"]] = None
 
 class ContentPart(BaseModel):
     text: str
@@ -43,6 +67,9 @@ class UsageMetadata(BaseModel):
     promptTokenCount: int
     promptTokensDetails: List[TokensDetails]
     totalTokenCount: int
+    # Tokens por agente e origem da contagem: "model" (usage_metadata), "cache" ou "estimate"
+    byAgent: Optional[Dict[str, Dict[str, int]]] = None
+    source: Optional[str] = None
 
 class Actions(BaseModel):
     stateDelta: Dict[str, Any]
@@ -0,0 +1,50 @@
+"""Cache opcional de respostas para prompts repetidos.
+
+A chave combina o texto normalizado do prompt, o ``appName`` e a impressão
+digital do grafo de agentes (``AgentRuntime.fingerprint``), de modo que
+qualquer mudança em ``agent.py`` invalida as respostas antigas.
+"""
+import hashlib
+import os
+import re
+from typing import Any, Dict, Optional
+
+from ttl_cache import TTLCache
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Minúsculas, espaços colapsados e sem pontuação final repetida"""
+    normalized = _WHITESPACE.sub(" ", text.strip().lower())
+    return normalized.rstrip(" ?!.")
+
+
+class ResponseCache:
+    """Respostas do agente por prompt normalizado, com TTL e limite de tamanho."""
+
+    def __init__(self, enabled: bool = RESPONSE_CACHE_ENABLED, ttl: float = RESPONSE_CACHE_TTL,
+                 max_entries: int = RESPONSE_CACHE_MAX_ENTRIES):
+        self.enabled = enabled
+        self._cache = TTLCache(max_entries=max_entries, ttl=ttl)
+
+    @staticmethod
+    def key(prompt: str, app_name: str, fingerprint: str) -> str:
+        raw = "\0".join((app_name, fingerprint, normalize_prompt(prompt)))
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.enabled:
+            return None
+        return self._cache.get(key)
+
+    def set(self, key: str, entry: Dict[str, Any]):
+        if self.enabled:
+            self._cache.set(key, entry)
+
+    def stats(self) -> Dict[str, Any]:
+        return {"enabled": self.enabled, **self._cache.stats()}
@@ -1,21 +1,37 @@
 #!/usr/bin/env python3
 
-from fastapi import FastAPI, HTTPException, Request, status
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import FastAPI, HTTPException, Query, Request, Response, WebSocket, status
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, ValidationError
+from typing import List, Dict, Any, Optional, Tuple
 import asyncio
+import functools
 import json
 import uuid
 import time
 import os
+from contextlib import asynccontextmanager
 from datetime import datetime, timezone
 from dotenv import load_dotenv
-from google.adk.artifacts import InMemoryArtifactService
-from models import RunSSERequest, RunSSEResponse, Content, ContentPart, UsageMetadata, TokensDetails, Actions
+from models import BatchItem, RunBatchRequest, RunSSERequest, RunSSEResponse, Content, ContentPart, UsageMetadata, TokensDetails, Actions
 import logging
-from firebase_config import initialize_firebase, get_firestore_client
+from firebase_config import initialize_firebase, run_firestore
+from agent_runtime import AGENT_MODES, USAGE_FIELDS, AgentProgressTracker, AgentRuntime, current_agent_runtime, get_agent_runtime, resolve_agent_mode, shutdown_agent_runtime, turn_usage
+from write_behind import WriteBehindQueue, WriteOp
+from local_store import create_local_store
+from session_index import BATCH_SESSION_SOURCE, decode_cursor, encode_cursor, is_listed
+from sse import AgentDelta, ClientDisconnected, DisconnectWatcher, coalesce_deltas, encode_json, sse_frame
+from ttl_cache import TTLCache
+from response_cache import ResponseCache
+from admission import ADMISSION_POSITION_INTERVAL, ADMISSION_QUEUE_TIMEOUT, AdmissionController, AdmissionRejected
+from inflight import InflightRegistry, InflightTurn, parse_event_id, turn_key
+from batch import BATCH_MAX_ITEMS, batch_limits, run_bounded
+from ws_mux import WS_AUTH_TIMEOUT, WS_MAX_STREAMS, WS_STREAM_WINDOW, StreamCredit, UnsupportedFrame, control_message, event_message, parse_client_message
+from usage_ledger import UsageLedger
+import metrics
+import tracing
+from startup import BackgroundStartup
 
 # Carregar variáveis de ambiente
 load_dotenv()
@@ -32,7 +48,7 @@ if not API_KEY:
 async def verify_api_key(request: Request):
     """Middleware para verificar API key no header"""
     # Pular verificação para rotas de health check
-    if request.url.path in ["/", "/health", "/docs", "/openapi.json"]:
+    if request.url.path in ["/", "/health", "/ready", "/docs", "/openapi.json"]:
         return
     
     # Se API_KEY não estiver configurada, pular verificação
@@ -47,16 +63,41 @@ async def verify_api_key(request: Request):
             detail="API Key inválida ou ausente. Use o header 'X-API-Key'."
         )
 
-# Initialize Firebase
-try:
-    db = initialize_firebase()
-    print("Firebase initialized successfully")
-except Exception as e:
-    print(f"Firebase initialization failed: {e}")
-    db = None
-    print("Using in-memory storage as fallback")
-
-app = FastAPI(title="Luminus", version="1.0.0")
+# Firebase e runtime do ADK são inicializados em segundo plano no lifespan;
+# até lá (ou se o Firebase falhar) db fica None e o armazenamento é em memória
+db = None
+FIREBASE_INIT_TIMEOUT = float(os.getenv("FIREBASE_INIT_TIMEOUT", "20"))
+ADK_INIT_TIMEOUT = float(os.getenv("ADK_INIT_TIMEOUT", "60"))
+# Rotas que respondem sem aguardar a inicialização
+STARTUP_PROBE_PATHS = {"/", "/health", "/ready", "/metrics", "/docs", "/openapi.json"}
+
+def _set_firestore_client(client):
+    global db
+    db = client
+    if client is not None:
+        logger.info("Firebase initialized successfully")
+    else:
+        logger.warning("Firebase initialization failed. Using in-memory storage as fallback")
+
+background_startup = BackgroundStartup()
+background_startup.add("firestore", initialize_firebase, FIREBASE_INIT_TIMEOUT, on_result=_set_firestore_client)
+# Runtime do ADK criado uma única vez (Runner, sessões e pool de conexões)
+background_startup.add("agent_runtime", lambda: get_agent_runtime(), ADK_INIT_TIMEOUT,
+                       on_result=lambda runtime: setattr(app.state, "agent_runtime", runtime))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.agent_runtime = None
+    background_startup.start()
+    await write_queue.start()
+    yield
+    await background_startup.stop()
+    # Gravar escritas pendentes antes de encerrar
+    await write_queue.stop()
+    shutdown_agent_runtime()
+    local_store.close()
+
+app = FastAPI(title="Luminus", version="1.0.0", lifespan=lifespan)
 
 # Configuração de CORS
 app.add_middleware(
@@ -70,129 +111,226 @@ app.add_middleware(
 # Middleware de verificação de API Key
 @app.middleware("http")
 async def api_key_middleware(request: Request, call_next):
+    background_startup.mark_request()
     try:
         await verify_api_key(request)
     except HTTPException as e:
         return JSONResponse(status_code=e.status_code, content={"detail": e.detail})
+    if request.url.path not in STARTUP_PROBE_PATHS:
+        # Não atender com o fallback em memória enquanto o Firestore ainda inicializa
+        await background_startup.wait("firestore")
     response = await call_next(request)
     return response
 
-# Armazenamento em memória para sessões e mensagens (fallback)
-sessions_db = {}
-messages_db = {}  # {session_id: [messages]}
+# Armazenamento local para sessões e mensagens (fallback): memória do processo
+# ou SQLite compartilhado entre os workers (LOCAL_STORE)
+local_store = create_local_store()
+# Sessões criadas em um turno cuja escrita ainda está na fila write-behind
+pending_sessions = {}
+# Tamanho da página ao ler a subcoleção de mensagens
+MESSAGE_PAGE_SIZE = int(os.getenv("MESSAGE_PAGE_SIZE", "100"))
+MAX_MESSAGE_PAGE_SIZE = 500
+# Tamanho padrão da página em GET /sessions
+SESSION_PAGE_SIZE = int(os.getenv("SESSION_PAGE_SIZE", "100"))
+MAX_SESSION_PAGE_SIZE = 500
+# Cache read-through dos metadados de sessão lidos do Firestore
+session_cache = TTLCache(
+    max_entries=int(os.getenv("SESSION_CACHE_MAX_ENTRIES", "10000")),
+    ttl=float(os.getenv("SESSION_CACHE_TTL", "30")),
+)
+# Cache opcional de respostas (RESPONSE_CACHE_ENABLED) para prompts repetidos
+response_cache = ResponseCache()
+# Limite de execuções simultâneas do agente, com fila justa por usuário
+admission = AdmissionController()
+# Turnos em andamento/recentes: requisições duplicadas acompanham a mesma execução
+inflight = InflightRegistry()
+# Uso de tokens por agente e turnos mais caros (GET /admin/usage)
+usage_ledger = UsageLedger()
+# Contadores das execuções em streaming (cancelled: cliente desconectou no meio da resposta)
+run_stats = {"completed": 0, "cancelled": 0, "failed": 0}
+
+# Gauges calculados na coleta de /metrics
+metrics.AGENT_RUNS_IN_FLIGHT.set_function(lambda: admission.in_flight)
+metrics.FALLBACK_STORE_SIZE.labels("pending_sessions").set_function(lambda: len(pending_sessions))
+
+# Respostas de contingência do agente (nunca entram no cache de respostas)
+AGENT_NO_RESPONSE_MESSAGE = "Desculpe, não consegui processar sua pergunta no momento."
+AGENT_EMPTY_STREAM_MESSAGE = "Desculpe, não recebi conteúdo de resposta do agente."
+AGENT_ERROR_MESSAGE = "Desculpe, ocorreu um erro ao processar sua mensagem. Tente novamente."
+AGENT_FALLBACK_MESSAGES = {AGENT_NO_RESPONSE_MESSAGE, AGENT_EMPTY_STREAM_MESSAGE, AGENT_ERROR_MESSAGE}
+
+# Operações no armazenamento local (memória ou SQLite compartilhado), via
+# local_store.run: no SQLite rodam no pool de threads do store
+async def _save_message_to_memory(session_id: str, message: Dict):
+    await local_store.run(local_store.append_message, session_id, {
+        **message,
+        'messageId': str(uuid.uuid4()),
+        'sessionId': session_id,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'createdAt': datetime.now(timezone.utc).isoformat()
+    })
+
+async def _put_session_in_memory(session_id: str, session_data: Dict):
+    await local_store.run(local_store.put_session, session_id, session_data)
+
+async def _update_session_in_memory(session_id: str, updates: Dict, message_delta: int = 0, usage: Optional[Dict] = None) -> bool:
+    return await local_store.run(local_store.update_session, session_id, updates, message_delta, usage)
+
+async def _delete_session_in_memory(session_id: str) -> bool:
+    return await local_store.run(local_store.delete_session, session_id, datetime.now(timezone.utc).isoformat())
+
+
+# Métricas dos helpers de persistência
+def firestore_operation(operation: str):
+    """Decorator que mede a latência do helper (backend ``firestore`` ou ``memory``)
+    e o registra como span ``firestore.<operation>`` do trace corrente"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            backend = "firestore" if db else "memory"
+            started = time.perf_counter()
+            with tracing.span(f"firestore.{operation}", {"luminus.backend": backend}, kind=tracing.SPAN_KIND_CLIENT):
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    metrics.FIRESTORE_OPERATION_DURATION.labels(operation, backend).observe(time.perf_counter() - started)
+        return wrapper
+    return decorator
+
+def firestore_failed(operation: str, fallback: bool = True):
+    """Conta uma exceção do Firestore e, se ``fallback``, a operação atendida em memória"""
+    metrics.FIRESTORE_ERRORS.labels(operation).inc()
+    if fallback:
+        metrics.FIRESTORE_FALLBACKS.labels(operation).inc()
+    current = tracing.current_span()
+    if current is not None and current.name == f"firestore.{operation}":
+        current.set_error("Falha no Firestore")
+        current.set_attribute("luminus.fallback", fallback)
+
+def _format_message(message_data: Dict) -> Dict:
+    return {
+        'messageId': message_data.get('messageId'),
+        'role': message_data.get('role'),
+        'content': message_data.get('content'),
+        'timestamp': message_data.get('timestamp', message_data.get('createdAt')),
+        'truncated': message_data.get('truncated', False),
+        'usage': message_data.get('usage')
+    }
+
+@firestore_operation("query_messages_page")
+async def _query_messages_page(session_id: str, limit: int, start_after=None, cursor: Optional[str] = None) -> List:
+    """Lê uma página da subcoleção messages a partir de um snapshot ou do id de um documento (cursor).
 
-# Message management functions (Firestore with in-memory fallback)
-async def save_message_to_firestore(session_id: str, message: Dict) -> bool:
-    """Salva uma mensagem individual no Firestore com fallback para memória"""
+    É a única operação medida na leitura de uma página (métrica e span
+    ``firestore.query_messages_page``), inclusive a busca do cursor.
+    """
+    messages_ref = db.collection('sessions').document(session_id).collection('messages')
+    if cursor:
+        start_after = await run_firestore(messages_ref.document(cursor).get)
+        if not start_after.exists:
+            raise ValueError("Cursor inválido")
+    query = messages_ref.order_by('createdAt')
+    if start_after is not None:
+        query = query.start_after(start_after)
+    query = query.limit(limit)
+    return await run_firestore(lambda: list(query.stream()))
+
+async def fetch_messages_page(session_id: str, limit: int = MESSAGE_PAGE_SIZE, cursor: Optional[str] = None):
+    """Retorna ``(mensagens, próximo_cursor)`` de uma sessão.
+
+    No Firestore o cursor é o id do último documento da página anterior; no
+    armazenamento local é a posição da última mensagem (id da linha no SQLite).
+    ``None`` indica o fim.
+    Levanta ``ValueError`` para cursores inválidos.
+    """
     if db:
         try:
-            from google.cloud import firestore
-            # Salvar na subcoleção messages da sessão
-            message_ref = db.collection('sessions').document(session_id).collection('messages').document()
-            message_data = {
-                **message,
-                'messageId': message_ref.id,
-                'sessionId': session_id,
-                'timestamp': firestore.SERVER_TIMESTAMP,
-                'createdAt': firestore.SERVER_TIMESTAMP
-            }
-            message_ref.set(message_data)
-            logger.info(f"Message saved to Firestore for session {session_id}")
-            return True
+            docs = await _query_messages_page(session_id, limit, cursor=cursor)
+            messages = [_format_message({**doc.to_dict(), 'messageId': doc.id}) for doc in docs]
+            next_cursor = docs[-1].id if len(docs) == limit else None
+            return messages, next_cursor
+        except ValueError:
+            raise
         except Exception as e:
-            logger.error(f"Error saving message to Firestore: {e}")
-            # Fallback para armazenamento em memória
-            if session_id not in messages_db:
-                messages_db[session_id] = []
-            message_data = {
-                **message,
-                'messageId': str(uuid.uuid4()),
-                'sessionId': session_id,
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-                'createdAt': datetime.now(timezone.utc).isoformat()
-            }
-            messages_db[session_id].append(message_data)
-            logger.info(f"Message saved to memory for session {session_id}")
-            return True
-    else:
-        # Usar armazenamento em memória diretamente
-        if session_id not in messages_db:
-            messages_db[session_id] = []
-        message_data = {
-            **message,
-            'messageId': str(uuid.uuid4()),
-            'sessionId': session_id,
-            'timestamp': datetime.now(timezone.utc).isoformat(),
-            'createdAt': datetime.now(timezone.utc).isoformat()
-        }
-        messages_db[session_id].append(message_data)
-        logger.info(f"Message saved to memory for session {session_id}")
-        return True
+            logger.error(f"Error getting messages page from Firestore: {e}")
+            firestore_failed("query_messages_page")
+    # Armazenamento em memória (direto ou como fallback)
+    stored, next_cursor = await local_store.run(local_store.messages_page, session_id, limit, cursor)
+    return [_format_message(message_data) for message_data in stored], next_cursor
 
-async def get_messages_from_firestore(session_id: str) -> List[Dict]:
-    """Recupera mensagens de uma sessão do Firestore com fallback para memória"""
+async def iter_session_messages(session_id: str, page_size: int = MESSAGE_PAGE_SIZE):
+    """Itera as mensagens de uma sessão em ordem, buscando uma página por vez.
+
+    Nada é lido até o consumidor pedir a primeira mensagem; cada página custa
+    uma consulta ``order_by('createdAt').start_after(...).limit(page_size)``.
+    """
     if db:
         try:
-            messages_ref = db.collection('sessions').document(session_id).collection('messages')
-            docs = messages_ref.order_by('createdAt').stream()
-            messages = []
-            for doc in docs:
-                message_data = doc.to_dict()
-                messages.append({
-                    'role': message_data.get('role'),
-                    'content': message_data.get('content'),
-                    'timestamp': message_data.get('timestamp', message_data.get('createdAt'))
-                })
-            return messages
+            docs = await _query_messages_page(session_id, page_size)
         except Exception as e:
             logger.error(f"Error getting messages from Firestore: {e}")
-            # Fallback para armazenamento em memória
-            if session_id in messages_db:
-                messages = []
-                for message_data in messages_db[session_id]:
-                    messages.append({
-                        'role': message_data.get('role'),
-                        'content': message_data.get('content'),
-                        'timestamp': message_data.get('timestamp', message_data.get('createdAt'))
-                    })
-                return messages
-            return []
-    else:
-        # Usar armazenamento em memória diretamente
-        if session_id in messages_db:
-            messages = []
-            for message_data in messages_db[session_id]:
-                messages.append({
-                    'role': message_data.get('role'),
-                    'content': message_data.get('content'),
-                    'timestamp': message_data.get('timestamp', message_data.get('createdAt'))
-                })
-            return messages
-        return []
-    return []
+            firestore_failed("iter_session_messages")
+            docs = None
+        if docs is not None:
+            while docs:
+                for doc in docs:
+                    yield _format_message({**doc.to_dict(), 'messageId': doc.id})
+                if len(docs) < page_size:
+                    return
+                try:
+                    docs = await _query_messages_page(session_id, page_size, docs[-1])
+                except Exception as e:
+                    logger.error(f"Error getting messages page from Firestore: {e}")
+                    firestore_failed("iter_session_messages", fallback=False)
+                    return
+            return
+    # Armazenamento em memória (direto ou como fallback)
+    cursor = None
+    while True:
+        messages, cursor = await fetch_messages_page(session_id, page_size, cursor)
+        for message in messages:
+            yield message
+        if cursor is None:
+            return
+
+async def get_messages_from_firestore(session_id: str) -> List[Dict]:
+    """Recupera todas as mensagens de uma sessão do Firestore com fallback para memória"""
+    return [message async for message in iter_session_messages(session_id)]
 
 # Session management functions (Firestore with in-memory fallback)
+@firestore_operation("get_session")
 async def get_session(session_id: str) -> Optional[Dict]:
-    """Recupera uma sessão"""
+    """Recupera os metadados de uma sessão (uma única leitura, sem mensagens).
+
+    Use ``iter_session_messages`` para carregar o histórico sob demanda.
+    """
     if db:
+        cached = session_cache.get(session_id)
+        if cached is not None:
+            return dict(cached)
+        # Uma invalidação durante a leitura (ex.: turno gravado) descarta o documento lido
+        generation = session_cache.generation()
         try:
             doc_ref = db.collection('sessions').document(session_id)
-            doc = doc_ref.get()
+            doc = await run_firestore(doc_ref.get)
             if doc.exists:
                 session_data = doc.to_dict()
-                # Carregar mensagens da subcoleção
-                messages = await get_messages_from_firestore(session_id)
-                session_data['messages'] = messages
-                return session_data
-            return None
+                # Sessões antigas ainda podem ter o array legado de mensagens
+                session_data.pop('messages', None)
+                session_cache.set(session_id, session_data, generation=generation)
+                return dict(session_data)
+            return pending_sessions.get(session_id)
         except Exception as e:
             logger.error(f"Error getting session from Firestore: {e}")
-            return sessions_db.get(session_id)
+            firestore_failed("get_session")
+            return await local_store.run(local_store.get_session, session_id) or pending_sessions.get(session_id)
     else:
-        return sessions_db.get(session_id)
+        return await local_store.run(local_store.get_session, session_id) or pending_sessions.get(session_id)
 
+@firestore_operation("save_session")
 async def save_session(session_id: str, session_data: Dict) -> bool:
     """Salva uma sessão"""
+    session_cache.invalidate(session_id)
     if db:
         try:
             from google.cloud import firestore
@@ -205,24 +343,27 @@ async def save_session(session_id: str, session_data: Dict) -> bool:
             if 'lastActivity' in firestore_data and isinstance(firestore_data['lastActivity'], str):
                 firestore_data['updatedAt'] = firestore.SERVER_TIMESTAMP
             
-            doc_ref.set(firestore_data)
+            await run_firestore(doc_ref.set, firestore_data)
             logger.info(f"Session {session_id} saved to Firestore")
             return True
         except Exception as e:
             logger.error(f"Error saving session to Firestore: {e}")
-            sessions_db[session_id] = session_data
+            firestore_failed("save_session")
+            await _put_session_in_memory(session_id, session_data)
             return True
     else:
-        sessions_db[session_id] = session_data
+        await _put_session_in_memory(session_id, session_data)
         return True
 
+@firestore_operation("update_session")
 async def update_session(session_id: str, updates: Dict) -> bool:
     """Atualiza uma sessão"""
+    session_cache.invalidate(session_id)
     if db:
         try:
             from google.cloud import firestore
             doc_ref = db.collection('sessions').document(session_id)
-            doc = doc_ref.get()
+            doc = await run_firestore(doc_ref.get)
             if doc.exists:
                 # Converter timestamps para Firestore SERVER_TIMESTAMP se necessário
                 firestore_updates = updates.copy()
@@ -232,29 +373,26 @@ async def update_session(session_id: str, updates: Dict) -> bool:
                     if 'lastActivity' in firestore_updates:
                         del firestore_updates['lastActivity']
                 
-                doc_ref.update(firestore_updates)
+                await run_firestore(doc_ref.update, firestore_updates)
                 logger.info(f"Session {session_id} updated in Firestore")
                 return True
             return False
         except Exception as e:
             logger.error(f"Error updating session in Firestore: {e}")
-            if session_id in sessions_db:
-                sessions_db[session_id].update(updates)
-                return True
-            return False
+            firestore_failed("update_session")
+            return await _update_session_in_memory(session_id, updates)
     else:
-        if session_id in sessions_db:
-            sessions_db[session_id].update(updates)
-            return True
-        return False
+        return await _update_session_in_memory(session_id, updates)
 
+@firestore_operation("delete_session")
 async def delete_session(session_id: str) -> bool:
     """Marca uma sessão como deletada (soft delete)"""
+    session_cache.invalidate(session_id)
     if db:
         try:
             from google.cloud.firestore import SERVER_TIMESTAMP
             doc_ref = db.collection('sessions').document(session_id)
-            doc_ref.update({
+            await run_firestore(doc_ref.update, {
                 'deleted': True,
                 'deletedAt': SERVER_TIMESTAMP
             })
@@ -262,50 +400,182 @@ async def delete_session(session_id: str) -> bool:
             return True
         except Exception as e:
             logger.error(f"Error marking session as deleted in Firestore: {e}")
-            if session_id in sessions_db:
-                sessions_db[session_id]['deleted'] = True
-                sessions_db[session_id]['deletedAt'] = datetime.now(timezone.utc).isoformat()
-                return True
-            return False
+            firestore_failed("delete_session")
+            return await _delete_session_in_memory(session_id)
     else:
-        if session_id in sessions_db:
-            sessions_db[session_id]['deleted'] = True
-            sessions_db[session_id]['deletedAt'] = datetime.now(timezone.utc).isoformat()
-            return True
-        return False
-
-async def list_user_sessions(user_id: str, app_name: Optional[str] = None) -> List[Dict]:
-    """Lista sessões de um usuário (excluindo as deletadas)"""
-    user_sessions = []
+        return await _delete_session_in_memory(session_id)
+
+@firestore_operation("list_user_sessions")
+async def list_user_sessions(user_id: str, app_name: Optional[str] = None, limit: int = SESSION_PAGE_SIZE,
+                             cursor: Optional[str] = None):
+    """Lista sessões de um usuário (excluindo as deletadas), mais recentes primeiro.
+
+    Sessões criadas automaticamente pelo ``/run_batch`` ficam de fora.
+    Retorna ``(sessões, próximo_cursor)``. No Firestore o filtro ``deleted``,
+    a ordenação e o limite são feitos no servidor (requer índice composto
+    userId + [appName] + deleted + updatedAt desc); no armazenamento local usa
+    o índice por usuário (memória) ou o da tabela sessions (SQLite). O cursor
+    carrega a chave (``updatedAt``/``lastActivity``, id) da última sessão da
+    página anterior (``encode_cursor``), então a próxima página não depende
+    dela continuar existindo ou no mesmo lugar; cursores de outra listagem
+    (usuário ou filtro de app) levantam ``ValueError``.
+    """
     if db:
         try:
+            from google.cloud import firestore
             sessions_ref = db.collection('sessions')
             query = sessions_ref.where('userId', '==', user_id)
             if app_name:
                 query = query.where('appName', '==', app_name)
-            docs = query.stream()
-            for doc in docs:
-                session_data = doc.to_dict()
-                # Filtrar sessões deletadas
-                if not session_data.get('deleted', False):
+            query = (query.where('deleted', '==', False)
+                     .order_by('updatedAt', direction=firestore.Query.DESCENDING)
+                     .order_by('__name__', direction=firestore.Query.DESCENDING))
+            if cursor:
+                updated_at, session_id = decode_cursor(cursor, user_id, app_name)
+                query = query.start_after({'updatedAt': updated_at, '__name__': session_id})
+            # Sessões de lote não têm um campo consultável em documentos antigos:
+            # são puladas aqui, lendo mais páginas até completar o limite
+            user_sessions = []
+            while True:
+                page_query = query.limit(limit)
+                docs = await run_firestore(lambda: list(page_query.stream()))
+                for doc in docs:
+                    session_data = doc.to_dict()
+                    if not is_listed(session_data):
+                        continue
                     session_data['sessionId'] = doc.id
                     user_sessions.append(session_data)
-            return user_sessions
+                    if len(user_sessions) == limit:
+                        return user_sessions, encode_cursor(user_id, app_name, session_data.get('updatedAt'), doc.id)
+                if len(docs) < limit:
+                    return user_sessions, None
+                query = query.start_after({'updatedAt': docs[-1].to_dict().get('updatedAt'), '__name__': docs[-1].id})
+        except ValueError:
+            raise
         except Exception as e:
             logger.error(f"Error listing sessions from Firestore: {e}")
-            # Fallback to in-memory
-            for session in sessions_db.values():
-                if session["userId"] == user_id and not session.get('deleted', False):
-                    if app_name is None or session.get("appName") == app_name:
-                        user_sessions.append(session)
-            return user_sessions
-    else:
-         for session in sessions_db.values():
-             if session["userId"] == user_id and not session.get('deleted', False):
-                 if app_name is None or session["appName"] == app_name:
-                     user_sessions.append(session)
-         return user_sessions
-    return user_sessions
+            firestore_failed("list_user_sessions")
+    # Armazenamento em memória (direto ou como fallback)
+    return await local_store.run(local_store.list_sessions, user_id, app_name, limit, cursor)
+
+# Escritas de turno (write-behind): um turno vira um único WriteBatch
+def session_write_op(session_id: str, session_data: Dict) -> WriteOp:
+    """Operação de criação de sessão (mesma conversão de timestamps de save_session)"""
+    from google.cloud import firestore
+    firestore_data = session_data.copy()
+    if 'createdAt' in firestore_data and isinstance(firestore_data['createdAt'], str):
+        firestore_data['createdAt'] = firestore.SERVER_TIMESTAMP
+    if 'lastActivity' in firestore_data and isinstance(firestore_data['lastActivity'], str):
+        firestore_data['updatedAt'] = firestore.SERVER_TIMESTAMP
+    return WriteOp(
+        kind="set",
+        path=('sessions', session_id),
+        data=firestore_data,
+        fallback=lambda: _put_session_in_memory(session_id, session_data),
+    )
+
+def message_write_op(session_id: str, message: Dict) -> WriteOp:
+    """Operação de escrita de uma mensagem na subcoleção messages"""
+    from google.cloud import firestore
+    message_id = uuid.uuid4().hex
+    return WriteOp(
+        kind="set",
+        path=('sessions', session_id, 'messages', message_id),
+        data={
+            **message,
+            'messageId': message_id,
+            'sessionId': session_id,
+            'timestamp': firestore.SERVER_TIMESTAMP,
+            # Horário do cliente: mensagens do mesmo lote teriam o mesmo SERVER_TIMESTAMP
+            # e perderiam a ordem em order_by('createdAt')
+            'createdAt': datetime.now(timezone.utc)
+        },
+        fallback=lambda: _save_message_to_memory(session_id, message),
+    )
+
+def session_update_op(session_id: str, updates: Dict, message_delta: int = 0, usage: Optional[Dict] = None) -> WriteOp:
+    """Operação de atualização de metadados da sessão (set com merge para não falhar o lote).
+
+    ``messageCount`` é incrementado atomicamente em ``message_delta`` e o uso de
+    tokens do turno (``usage``, total e por agente) é somado em ``usage``; as
+    mensagens ficam apenas na subcoleção ``messages``, nunca no documento da sessão.
+    """
+    from google.cloud import firestore
+    firestore_updates = updates.copy()
+    if 'lastActivity' in firestore_updates:
+        firestore_updates['updatedAt'] = firestore.SERVER_TIMESTAMP
+        del firestore_updates['lastActivity']
+    if message_delta:
+        firestore_updates['messageCount'] = firestore.Increment(message_delta)
+    if usage:
+        firestore_updates['usage'] = {
+            **{key: firestore.Increment(usage.get(key, 0)) for key in USAGE_FIELDS},
+            'byAgent': {
+                agent: {key: firestore.Increment(agent_usage.get(key, 0)) for key in USAGE_FIELDS}
+                for agent, agent_usage in (usage.get('byAgent') or {}).items()
+            },
+        }
+    # Remover o array legado de mensagens de sessões antigas
+    firestore_updates['messages'] = firestore.DELETE_FIELD
+    return WriteOp(
+        kind="set",
+        path=('sessions', session_id),
+        data=firestore_updates,
+        merge=True,
+        fallback=lambda: _update_session_in_memory(session_id, updates, message_delta, usage),
+    )
+
+@firestore_operation("commit_write_batch")
+async def _commit_write_batch(ops: List[WriteOp]):
+    """Grava um lote de operações como um único WriteBatch do Firestore"""
+    batch = db.batch()
+    for op in ops:
+        ref = db.document(*op.path)
+        if op.kind == "update":
+            batch.update(ref, op.data)
+        else:
+            batch.set(ref, op.data, merge=op.merge)
+    await run_firestore(batch.commit)
+    _clear_pending_sessions(ops)
+    logger.info(f"[write-behind] Lote com {len(ops)} operações gravado no Firestore")
+
+async def _write_batch_fallback(ops: List[WriteOp], error: Exception):
+    """Aplica as operações de um lote que falhou no armazenamento em memória"""
+    firestore_failed("commit_write_batch")
+    for op in ops:
+        if op.fallback is not None:
+            await op.fallback()
+    _clear_pending_sessions(ops)
+    logger.info(f"[write-behind] Lote com {len(ops)} operações salvo em memória")
+
+def _clear_pending_sessions(ops: List[WriteOp]):
+    for op in ops:
+        if len(op.path) == 2 and op.path[0] == 'sessions':
+            pending_sessions.pop(op.path[1], None)
+            # A sessão mudou (ex.: messageCount); próxima leitura vai ao Firestore
+            session_cache.invalidate(op.path[1])
+
+write_queue = WriteBehindQueue(commit=_commit_write_batch, on_error=_write_batch_fallback)
+
+async def submit_turn_writes(session_id: str, ops: List[WriteOp], usage: Optional[Dict] = None):
+    """Enfileira as escritas de um turno; sem Firestore, aplica direto em memória.
+
+    Acrescenta a atualização de metadados da sessão (lastActivity, incremento
+    de messageCount pelo número de mensagens do turno e uso de tokens).
+    """
+    message_delta = sum(1 for op in ops if len(op.path) == 4 and op.path[2] == 'messages')
+    ops = ops + [session_update_op(session_id, {
+        "lastActivity": datetime.now(timezone.utc).isoformat(),
+    }, message_delta=message_delta, usage=usage)]
+    with tracing.span("persist.turn_writes", {"luminus.ops": len(ops), "luminus.write_behind": bool(db)}):
+        if db:
+            session_cache.invalidate(session_id)
+            write_queue.submit(ops)
+        else:
+            for op in ops:
+                if op.fallback is not None:
+                    await op.fallback()
+            _clear_pending_sessions(ops)
 
 class MessagePart(BaseModel):
     text: str
@@ -339,10 +609,13 @@ class SessionInfo(BaseModel):
     createdAt: str
     lastActivity: str
     messageCount: int
+    # Tokens acumulados da sessão (total e por agente), quando o modelo os informa
+    usage: Optional[Dict[str, Any]] = None
 
 class SessionListResponse(BaseModel):
     sessions: List[SessionInfo]
     status: str
+    nextCursor: Optional[str] = None
 
 class SessionDeleteResponse(BaseModel):
     sessionId: str
@@ -350,6 +623,21 @@ class SessionDeleteResponse(BaseModel):
 
 
 
+def _session_info(session: Dict) -> SessionInfo:
+    # No Firestore a atividade fica em updatedAt (timestamp); em memória, em lastActivity (ISO)
+    def as_str(value):
+        return value.isoformat() if hasattr(value, "isoformat") else str(value)
+
+    return SessionInfo(
+        sessionId=session["sessionId"],
+        appName=session["appName"],
+        userId=session["userId"],
+        createdAt=as_str(session["createdAt"]),
+        lastActivity=as_str(session.get("updatedAt") or session["lastActivity"]),
+        messageCount=session["messageCount"],
+        usage=session.get("usage")
+    )
+
 @app.get("/")
 async def root():
     return {"message": "Luminus API", "status": "running"}
@@ -358,6 +646,12 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/ready")
+async def ready():
+    """Prontidão: 200 quando a inicialização em segundo plano terminou, 503 antes disso"""
+    state = background_startup.status()
+    return JSONResponse(status_code=200 if background_startup.ready else 503, content=state)
+
 @app.post("/sessions", response_model=SessionCreateResponse)
 async def create_session(request: SessionCreateRequest):
     """Cria uma nova sessão para o usuário"""
@@ -372,7 +666,7 @@ async def create_session(request: SessionCreateRequest):
             "createdAt": now,
             "lastActivity": now,
             "messageCount": 0,
-            "messages": []
+            "deleted": False
         }
         
         await save_session(session_id, session_data)
@@ -386,27 +680,25 @@ async def create_session(request: SessionCreateRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/sessions", response_model=SessionListResponse)
-async def list_sessions(userId: str, appName: Optional[str] = None):
-    """Lista todas as sessões de um usuário"""
+async def list_sessions(
+    userId: str,
+    appName: Optional[str] = None,
+    limit: int = Query(SESSION_PAGE_SIZE, ge=1, le=MAX_SESSION_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Lista as sessões de um usuário, mais recentes primeiro (use nextCursor para a próxima página)"""
     try:
-        sessions = await list_user_sessions(userId, appName)
-        user_sessions = []
-        
-        for session in sessions:
-            user_sessions.append(SessionInfo(
-                sessionId=session["sessionId"],
-                appName=session["appName"],
-                userId=session["userId"],
-                createdAt=session["createdAt"],
-                lastActivity=session["lastActivity"],
-                messageCount=session["messageCount"]
-            ))
+        sessions, next_cursor = await list_user_sessions(userId, appName, limit, cursor)
+        user_sessions = [_session_info(session) for session in sessions]
         
         return SessionListResponse(
             sessions=user_sessions,
-            status="success"
+            status="success",
+            nextCursor=next_cursor
         )
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -438,14 +730,7 @@ async def get_session_endpoint(session_id: str):
         if not session:
             raise HTTPException(status_code=404, detail="Sessão não encontrada")
         
-        return SessionInfo(
-            sessionId=session["sessionId"],
-            appName=session["appName"],
-            userId=session["userId"],
-            createdAt=session["createdAt"],
-            lastActivity=session["lastActivity"],
-            messageCount=session["messageCount"]
-        )
+        return _session_info(session)
         
     except HTTPException:
         raise
@@ -454,6 +739,41 @@ async def get_session_endpoint(session_id: str):
 
 
 
+def _json_default(value):
+    # Timestamps do Firestore (DatetimeWithNanoseconds) e datetimes em geral
+    if hasattr(value, "isoformat"):
+        return value.isoformat()
+    return str(value)
+
+@app.get("/sessions/{session_id}/messages")
+async def list_session_messages(
+    session_id: str,
+    limit: int = Query(MESSAGE_PAGE_SIZE, ge=1, le=MAX_MESSAGE_PAGE_SIZE),
+    cursor: Optional[str] = None,
+):
+    """Lista as mensagens de uma sessão, uma página por vez (use nextCursor para a próxima)"""
+    try:
+        session = await get_session(session_id)
+        if not session:
+            raise HTTPException(status_code=404, detail="Sessão não encontrada")
+        messages, next_cursor = await fetch_messages_page(session_id, limit, cursor)
+    except HTTPException:
+        raise
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    def body():
+        # Serializa mensagem a mensagem em vez de montar o JSON inteiro em memória
+        yield f'{{"sessionId": {json.dumps(session_id)}, "messages": ['
+        for i, message in enumerate(messages):
+            yield ("," if i else "") + json.dumps(message, ensure_ascii=False, default=_json_default)
+        yield f'], "nextCursor": {json.dumps(next_cursor)}, "status": "success"}}'
+
+    return StreamingResponse(body(), media_type="application/json")
+
+
 #@app.post("/run", response_model=RunResponse)
 #async def run_agent(request: RunRequest):
     try:
@@ -504,166 +824,133 @@ async def get_session_endpoint(session_id: str):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-async def process_message_with_agent(message: str) -> str:
+async def process_message_with_agent(message: str, runtime: Optional[AgentRuntime] = None) -> str:
     """Processa uma mensagem usando o agente ADK real"""
+    response_text, _ = await process_message_with_usage(message, runtime=runtime)
+    return response_text
+
+async def process_message_with_usage(message: str, runtime: Optional[AgentRuntime] = None,
+                                     session_id: Optional[str] = None, user_id: Optional[str] = None,
+                                     agent_mode: Optional[str] = None) -> Tuple[str, List[Dict]]:
+    """Como ``process_message_with_agent``, retornando também as execuções por agente
+    (``AgentProgressTracker.summary()``, com o uso de tokens de cada uma).
+
+    Sem ``session_id``/``user_id`` o agente roda numa sessão descartável do ADK.
+    """
+    tracker = None
     try:
-        from google.adk.sessions import DatabaseSessionService
-        from google.adk.runners import Runner
-        from agent import root_agent
-        from google.genai import types
-        import uuid
-        
-        # Configurações
-        DB_URL = "sqlite:///./multi_agent_data.db"
-        APP_NAME = "Luminus"
-        
-        # Gerar IDs únicos para esta sessão
+        await background_startup.wait("agent_runtime")
+        runtime = runtime or get_agent_runtime()
+        tracker = AgentProgressTracker(runtime.agent_for(agent_mode).name)
+        tracker.start()
+
+        # Gerar IDs únicos para esta sessão quando não informados
         unique_id = str(uuid.uuid4())
-        session_id = unique_id
-        user_id = unique_id
-        
-        # Inicializar o serviço de sessão
-        session_service = DatabaseSessionService(db_url=DB_URL)
-        
-        # Tentar obter sessão existente ou criar nova
-        current_session = None
-        try:
-            current_session = session_service.get_session(
-                app_name=APP_NAME,
-                user_id=user_id,
-                session_id=session_id,
-            )
-        except Exception as e:
-            print(f"Sessão não encontrada, criando nova: {e}")
-        
-        # Se não encontrou sessão, criar nova
-        if current_session is None:
-            current_session = session_service.create_session(
-                app_name=APP_NAME,
-                user_id=user_id,
-                session_id=session_id,
-            )
+        session_id = session_id or unique_id
+        user_id = user_id or unique_id
 
-        artifact_service = InMemoryArtifactService()
-        
-        # Inicializar o Runner do ADK com nosso agente
-        runner = Runner(
-            app_name=APP_NAME,
-            agent=root_agent,
-            session_service=session_service,
-            artifact_service=artifact_service,
-        )
-        
-        # Formatar a mensagem do usuário
-        user_message = types.Content(
-            role="user", parts=[types.Part.from_text(text=message)]
-        )
-        
         # Executar o agente
-        events = runner.run_async(
-            user_id=user_id,
-            session_id=session_id,
-            new_message=user_message,
-        )
+        events = runtime.run(message, user_id=user_id, session_id=session_id, mode=agent_mode)
         
         # Processar eventos para encontrar a resposta final
         final_response = None
         last_event_content = None
         
         async for event in events:
+            tracker.observe(event)
             if event.is_final_response():
                 if event.content and event.content.parts:
                     # Linha que mostra o conteúdo da resposta do agente
                     last_event_content = event.content.parts[0].text
+        tracker.finish()
         
         if last_event_content:
             final_response = last_event_content
         else:
             print("Nenhuma resposta final encontrada do agente.")
-            final_response = "Desculpe, não consegui processar sua pergunta no momento."
+            final_response = AGENT_NO_RESPONSE_MESSAGE
         
-        return final_response
+        return final_response, tracker.summary()
 
     except Exception as e:
         logger.exception(f"Erro ao usar agente ADK: {e}")
-        return "Desculpe, ocorreu um erro ao processar sua mensagem. Tente novamente."
-
-async def process_message_stream(message: str, session_id: Optional[str] = None, user_id: Optional[str] = None):
-    """Gera deltas de texto da resposta do agente em tempo real quando possível.
-
-    Tenta usar o ADK (Runner.run_async) e emitir incrementos conforme os eventos chegam.
-    Caso não seja possível, emite apenas a resposta final (fallback).
+        if tracker is not None:
+            tracker.finish()
+        return AGENT_ERROR_MESSAGE, tracker.summary() if tracker is not None else []
+
+async def stream_agent_events(message: str, session_id: Optional[str] = None, user_id: Optional[str] = None,
+                              runtime: Optional[AgentRuntime] = None, agent_mode: Optional[str] = None):
+    """Executa o agente e gera, em ordem, deltas de texto (``str``) e eventos de
+    status/transferência por agente (``dict``) a partir do ``event.author`` real.
+
+    Com ADK_STREAMING_MODE=sse os eventos parciais viram deltas e o evento final
+    agregado de cada resposta é ignorado; sem streaming, cada resposta completa
+    vira um delta. No modo ``parallel`` os deltas dos ramos do ``ParallelAgent``
+    chegam intercalados como ``AgentDelta`` (autor e ramo).
     """
+    tracker = None
+    events = None
     try:
-        from google.adk.sessions import DatabaseSessionService
-        from google.adk.runners import Runner
-        from agent import root_agent
-        from google.genai import types
-        import uuid as _uuid
-
-        DB_URL = "sqlite:///./multi_agent_data.db"
-        APP_NAME = "Luminus"
+        await background_startup.wait("agent_runtime")
+        runtime = runtime or get_agent_runtime()
+        tracker = AgentProgressTracker(runtime.agent_for(agent_mode).name)
 
         # Usar IDs recebidos do cliente quando disponíveis para manter consistência
         if session_id is None:
-            session_id = str(_uuid.uuid4())
+            session_id = str(uuid.uuid4())
         if user_id is None:
-            user_id = str(_uuid.uuid4())
-
-        session_service = DatabaseSessionService(db_url=DB_URL)
-
-        current_session = None
-        try:
-            current_session = session_service.get_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
-        except Exception:
-            current_session = None
-        if current_session is None:
-            session_service.create_session(app_name=APP_NAME, user_id=user_id, session_id=session_id)
+            user_id = str(uuid.uuid4())
 
-        artifact_service = InMemoryArtifactService()
-
-        runner = Runner(app_name=APP_NAME, agent=root_agent, session_service=session_service, artifact_service=artifact_service)
-
-        user_message = types.Content(role="user", parts=[types.Part.from_text(text=message)])
-        events = runner.run_async(user_id=user_id, session_id=session_id, new_message=user_message)
+        for update in tracker.start():
+            yield update
+        events = runtime.run(message, user_id=user_id, session_id=session_id, run_config=runtime.stream_run_config(), mode=agent_mode)
         logger.info("[stream] ADK runner.run_async iniciado")
 
-        accumulated = ""
-        last_text = ""
+        emitted = False
+        # Autores com parciais já emitidos (ramos paralelos intercalam respostas)
+        streamed_partial = set()
         async for event in events:
-            # Alguns eventos podem conter texto parcial (dependendo do provedor)
-            try:
-                if event.content and event.content.parts:
-                    text = event.content.parts[0].text or ""
-                    # emitir somente o delta novo
-                    if text:
-                        if len(text) > len(accumulated):
-                            delta = text[len(accumulated):]
-                            accumulated = text
-                            logger.info(f"[stream] ADK delta len={len(delta)} preview='{delta[:40]}'")
-                            yield delta
-                        last_text = text
-            except Exception:
-                # ignorar eventos sem texto
-                pass
-
-        # Garante retorno final (pode ser igual ao acumulado)
-        if accumulated:
-            logger.info("[stream] ADK concluiu com deltas acumulados")
-            return
-
-        # Se não houve nada incremental mas houve conteúdo final, emitir uma vez
-        if last_text:
-            logger.info(f"[stream] Emitindo texto final sem deltas; len={len(last_text)}")
-            yield last_text
-            return
-
-        # Sem conteúdo
-        logger.info("[stream] Nenhum conteúdo recebido do ADK")
-        yield "Desculpe, não recebi conteúdo de resposta do agente."
+            for update in tracker.observe(event):
+                yield update
+            if getattr(event, "author", None) == "user" or not (event.content and event.content.parts):
+                continue
+            text = "".join(part.text for part in event.content.parts if getattr(part, "text", None))
+            if getattr(event, "partial", None):
+                streamed_partial.add(event.author)
+            elif event.author in streamed_partial:
+                # Resposta agregada após os parciais: conteúdo já emitido
+                streamed_partial.discard(event.author)
+                continue
+            if text:
+                emitted = True
+                logger.debug(f"[stream] ADK delta author={event.author} len={len(text)}")
+                branch = getattr(event, "branch", None)
+                yield AgentDelta(event.author, branch, text) if branch else text
+
+        for update in tracker.finish():
+            yield update
+        if not emitted:
+            # Sem conteúdo
+            logger.info("[stream] Nenhum conteúdo recebido do ADK")
+            yield AGENT_EMPTY_STREAM_MESSAGE
     except Exception as err:
         logger.exception(f"[stream] Erro durante streaming: {err}")
-        yield "Desculpe, ocorreu um erro ao processar sua mensagem. Tente novamente."
+        if tracker is not None:
+            for update in tracker.finish():
+                yield update
+        yield AGENT_ERROR_MESSAGE
+    finally:
+        # Consumidor cancelado ou fechado (ex.: cliente desconectou): encerrar a execução do ADK
+        if events is not None and hasattr(events, "aclose"):
+            await events.aclose()
+
+async def process_message_stream(message: str, session_id: Optional[str] = None, user_id: Optional[str] = None, runtime: Optional[AgentRuntime] = None):
+    """Gera apenas os deltas de texto da resposta do agente em tempo real quando possível."""
+    async for item in stream_agent_events(message, session_id=session_id, user_id=user_id, runtime=runtime):
+        if isinstance(item, str):
+            yield item
+        elif isinstance(item, AgentDelta):
+            yield item.text
 
 @app.get("/tools")
 async def list_tools():
@@ -693,17 +980,54 @@ async def agent_info():
     """Informações do agente atual (nome, descrição e ferramentas)."""
     try:
         # Importação tardia para evitar queda do servidor quando dependências opcionais do agente não estão instaladas
-        from agent import root_agent  # type: ignore
+        from agent import PARALLEL_SPECIALISTS, root_agent  # type: ignore
         return {
             "name": getattr(root_agent, "name", "practia-agent"),
             "description": getattr(root_agent, "description", "Agente de conhecimento geral com clima e horário"),
             "tools": [
                 getattr(t, "__name__", str(t)) for t in getattr(root_agent, "tools", [])
             ],
+            # Modos aceitos em agentMode e os especialistas executados em paralelo
+            "modes": list(AGENT_MODES),
+            "defaultMode": resolve_agent_mode(None),
+            "parallelSpecialists": list(PARALLEL_SPECIALISTS),
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/metrics")
+async def get_metrics():
+    """Métricas no formato de exposição do Prometheus (protegida pela API key)."""
+    # Totais do armazenamento local: contadores mantidos na escrita, lidos fora do event loop
+    for name, value in (await local_store.run(local_store.counts)).items():
+        metrics.FALLBACK_STORE_SIZE.labels(name).set(value)
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type=metrics.CONTENT_TYPE)
+
+@app.get("/admin/cache-stats")
+async def get_cache_stats():
+    """Contadores dos caches de sessões e de respostas (rota administrativa)."""
+    return {"sessions": session_cache.stats(), "responses": response_cache.stats()}
+
+@app.get("/admin/run-stats")
+async def get_run_stats():
+    """Execuções em streaming concluídas, canceladas por desconexão e com erro (rota administrativa)."""
+    return dict(run_stats)
+
+@app.get("/admin/usage")
+async def get_usage_report(limit: int = Query(10, ge=1, le=100)):
+    """Tokens por agente e turnos mais caros desde o início do processo (rota administrativa)."""
+    return usage_ledger.report(limit)
+
+@app.get("/admin/inflight-stats")
+async def get_inflight_stats():
+    """Turnos em andamento, retidos e requisições duplicadas atendidas por eles (rota administrativa)."""
+    return inflight.stats()
+
+@app.get("/admin/admission-stats")
+async def get_admission_stats():
+    """Execuções em andamento, fila e recusas do controle de admissão (rota administrativa)."""
+    return admission.stats()
+
 @app.get("/admin/users")
 async def get_admin_users():
     """Lista usuários registrados no sistema (rota administrativa)."""
@@ -711,7 +1035,7 @@ async def get_admin_users():
         if db:
             # Buscar usuários no Firestore
             users_ref = db.collection('users')
-            docs = users_ref.stream()
+            docs = await run_firestore(lambda: list(users_ref.stream()))
             
             users = []
             for doc in docs:
@@ -736,213 +1060,828 @@ async def get_admin_users():
             {"username": "user@practia.com", "role": "user"}
         ]
 
-@app.post("/run_sse")
-async def run_sse(request: RunSSERequest):
-    """Processa uma mensagem e responde. Se streaming=true, envia via SSE (text/event-stream)."""
+def response_cache_applies(request: RunSSERequest) -> bool:
+    return response_cache.enabled and not request.bypassCache
+
+def response_cache_key(request: RunSSERequest, message: str) -> Optional[str]:
+    """Chave do cache de respostas, ou ``None`` quando o cache não se aplica.
+
+    A chave usa a impressão digital do grafo do runtime já criado: construí-lo
+    aqui (import do ADK, engine do SQLite) travaria o event loop. Durante o boot
+    os turnos aguardam o runtime antes (``wait_response_cache``); se a criação
+    falhou, o turno segue sem cache.
+    """
+    if not response_cache_applies(request):
+        return None
+    runtime = current_agent_runtime()
+    if runtime is None:
+        logger.warning("[cache] Runtime do agente indisponível; turno sem cache de respostas")
+        return None
     try:
-        # Tenta obter a sessão. Se não existir, cria uma nova.
-        logger.info(f"[/run_sse] sessionId={request.sessionId} userId={request.userId} appName={request.appName} streaming={request.streaming}")
-        session = await get_session(request.sessionId)
-        if not session:
-            now = datetime.now(timezone.utc).isoformat()
-            session = {
-                "sessionId": request.sessionId,
-                "appName": request.appName,
-                "userId": request.userId,
-                "createdAt": now,
-                "lastActivity": now,
-                "messageCount": 0,
-                "messages": []
-            }
-            await save_session(request.sessionId, session)
-        
-        user_message_text = request.newMessage.parts[0].text
-        logger.info(f"[/run_sse] nova mensagem len={len(user_message_text)} preview='{user_message_text[:80]}'")
-        
-        # Registrar mensagem do usuário
-        user_message = {
-            "role": "user",
-            "content": user_message_text,
-            "timestamp": datetime.now(timezone.utc).isoformat()
+        return ResponseCache.key(message, request.appName, runtime.fingerprint_for(request.agentMode))
+    except Exception as e:
+        logger.warning(f"[cache] Não foi possível calcular a chave de resposta: {e}")
+        return None
+
+def store_cached_response(cache_key: Optional[str], text: str, agents: Optional[List[Dict]] = None):
+    """Guarda a resposta no cache, exceto respostas de contingência"""
+    if cache_key and text and text not in AGENT_FALLBACK_MESSAGES:
+        response_cache.set(cache_key, {"text": text, "agents": agents or [], "cachedAt": time.time()})
+
+async def replay_cached_response(cached: Dict):
+    """Reproduz uma resposta do cache no formato de ``stream_agent_events``"""
+    yield {"type": "cache", "state": "hit", "cachedAt": cached["cachedAt"], "timestamp": time.time()}
+    yield cached["text"]
+
+SSE_HEADERS = {
+    "Content-Type": "text/event-stream",
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no",
+}
+
+def response_usage(message: str, response_text: str, usage: Optional[Dict], cached: bool = False) -> Dict:
+    """Uso de tokens informado ao cliente.
+
+    ``source`` indica a origem: ``model`` (usage_metadata das respostas do modelo),
+    ``cache`` (resposta do cache, sem consumo) ou ``estimate`` (contagem de
+    palavras, quando o modelo não informa o uso).
+    """
+    if cached:
+        return {**{key: 0 for key in USAGE_FIELDS}, "byAgent": {}, "source": "cache"}
+    if usage:
+        return {**usage, "source": "model"}
+    prompt_tokens = len(message.split())
+    response_tokens = len(response_text.split())
+    return {
+        "promptTokenCount": prompt_tokens,
+        "candidatesTokenCount": response_tokens,
+        "totalTokenCount": prompt_tokens + response_tokens,
+        "byAgent": {},
+        "source": "estimate",
+    }
+
+def record_turn_usage(request: RunSSERequest, message: str, usage: Optional[Dict]):
+    """Contabiliza o uso reportado pelo modelo (não inclui estimativas nem cache)"""
+    if usage:
+        usage_ledger.record(request.sessionId, request.userId, message, usage)
+
+def build_run_response(response_text: str, invocation_id: str, usage: Dict) -> RunSSEResponse:
+    """Resposta JSON do /run_sse sem streaming"""
+    response_id = str(uuid.uuid4())
+
+    return RunSSEResponse(
+        content=Content(parts=[ContentPart(text=response_text)], role="model"),
+        usageMetadata=UsageMetadata(
+            candidatesTokenCount=usage["candidatesTokenCount"],
+            candidatesTokensDetails=[TokensDetails(modality="TEXT", tokenCount=usage["candidatesTokenCount"])],
+            promptTokenCount=usage["promptTokenCount"],
+            promptTokensDetails=[TokensDetails(modality="TEXT", tokenCount=usage["promptTokenCount"])],
+            totalTokenCount=usage["totalTokenCount"],
+            byAgent=usage.get("byAgent"),
+            source=usage.get("source"),
+        ),
+        invocationId=invocation_id,
+        author="practia-agent",
+        actions=Actions(stateDelta={}, artifactDelta={}, requestedAuthConfigs={}),
+        id=response_id,
+        timestamp=time.time(),
+    )
+
+def result_frames(result: Dict, invocation_id: str) -> List[bytes]:
+    """Frames SSE equivalentes ao resultado de um turno executado sem streaming"""
+    if result.get("error"):
+        return [sse_frame({"error": result["error"], "retryAfter": result.get("retryAfter"), "done": True},
+                          event_id=f"{invocation_id}:1")]
+    return [
+        sse_frame({"type": "delta", "invocationId": invocation_id, "delta": result["text"], "agent": None,
+                   "done": False, "timestamp": time.time(), "author": "practia-agent"}, event_id=f"{invocation_id}:1"),
+        sse_frame({"type": "done", "invocationId": invocation_id, "done": True, "agents": result.get("agents", []),
+                   "usage": result.get("usage"), "timestamp": time.time()}, event_id=f"{invocation_id}:2"),
+    ]
+
+def turn_text(deltas: List[str], branch_deltas: Dict[str, List[str]]) -> str:
+    """Texto da resposta gravado na sessão.
+
+    Deltas dos ramos paralelos são resultados intermediários (a consolidação
+    os combina); sem texto fora dos ramos, ficam os blocos de cada agente.
+    """
+    text = "".join(deltas).strip()
+    if text or not branch_deltas:
+        return text
+    return "\n\n".join("".join(pieces).strip() for pieces in branch_deltas.values()).strip()
+
+def turn_outcome(result: Optional[Dict]) -> str:
+    """Rótulo ``outcome`` das métricas de turno"""
+    if not result or result.get("truncated"):
+        return "cancelled"
+    if result.get("retryAfter"):
+        return "rejected"
+    if result.get("error"):
+        return "failed"
+    return "completed"
+
+def end_turn_span(root_span: tracing.Span, outcome: str, cache_status: Optional[str], result: Optional[Dict]):
+    """Encerra o span raiz do turno (exporta o trace)"""
+    root_span.set_attribute("luminus.outcome", outcome)
+    root_span.set_attribute("luminus.cache", cache_status)
+    if result and result.get("usage"):
+        root_span.set_attribute("gen_ai.usage.total_tokens", result["usage"].get("totalTokenCount"))
+    if outcome == "failed":
+        root_span.set_error(result.get("error") if result else "Turno interrompido")
+    root_span.end()
+
+def finish_turn(turn: InflightTurn, result: Optional[Dict]):
+    """Conclui o turno; turnos com erro ou truncados não ficam retidos para repetição"""
+    turn.finish(result or {"error": "Turno interrompido"})
+    if not result or result.get("error") or result.get("truncated") or result.get("text") in AGENT_FALLBACK_MESSAGES:
+        inflight.discard(turn)
+
+async def follow_turn_stream(turn: InflightTurn, http_request: Request, after: int = 0):
+    """Stream SSE de um cliente que acompanha o turno (quem o iniciou, um duplicado
+    ou uma reconexão com ``Last-Event-ID``, a partir do frame seguinte a ``after``).
+
+    O cliente que desconecta deixa o turno; a execução só é cancelada quando
+    não resta nenhum cliente acompanhando e ninguém reconecta dentro da carência.
+    """
+    watcher = DisconnectWatcher(http_request.receive).start()
+    metrics.SSE_STREAMS_IN_FLIGHT.inc()
+    try:
+        async for frame in turn.follow(after, is_disconnected=watcher.is_disconnected):
+            yield frame
+        if turn.last_seq == 0 and turn.result is not None:
+            # Turno iniciado por uma requisição sem streaming
+            for frame in result_frames(turn.result, turn.invocation_id)[after:]:
+                yield frame
+    except ClientDisconnected:
+        logger.info(f"[/run_sse] cliente desconectou do turno {turn.key[:12]}")
+    finally:
+        metrics.SSE_STREAMS_IN_FLIGHT.dec()
+        watcher.stop()
+        turn.unsubscribe(grace=True)
+
+async def wait_response_cache(request: RunSSERequest):
+    """Aguarda o runtime criado em segundo plano quando o turno consulta o cache de respostas"""
+    if response_cache_applies(request):
+        await background_startup.wait("agent_runtime")
+
+def lookup_cached_response(request: RunSSERequest, message: str) -> Tuple[Optional[str], Optional[Dict], str]:
+    """``(chave, resposta, status)`` do cache: HIT reproduz a resposta guardada, BYPASS quando desativado"""
+    cache_key = response_cache_key(request, message)
+    cached = response_cache.get(cache_key) if cache_key else None
+    return cache_key, cached, "BYPASS" if cache_key is None else ("HIT" if cached else "MISS")
+
+def acquire_admission(user_id: str):
+    """Ticket de execução do agente; fila cheia responde 429 com Retry-After"""
+    try:
+        return admission.acquire(user_id)
+    except AdmissionRejected as rejected:
+        logger.warning(f"[/run_sse] recusado userId={user_id}: {rejected.reason} retryAfter={rejected.retry_after}s")
+        raise HTTPException(status_code=429, detail=rejected.reason, headers={"Retry-After": str(rejected.retry_after)})
+
+async def begin_turn_writes(request: RunSSERequest, message: str,
+                            session_source: Optional[str] = None) -> List[WriteOp]:
+    """Escritas iniciais do turno: a sessão (se ainda não existe) e a mensagem do usuário.
+
+    No streaming são gravadas junto com a resposta (write-behind), ao final da
+    geração; sem streaming, antes de executar o agente. ``session_source``
+    marca a sessão criada aqui (ex.: ``batch``, fora da listagem).
+    """
+    # Tenta obter a sessão. Se não existir, cria uma nova.
+    session = await get_session(request.sessionId)
+    turn_ops: List[WriteOp] = []
+    if not session:
+        now = datetime.now(timezone.utc).isoformat()
+        session = {
+            "sessionId": request.sessionId,
+            "appName": request.appName,
+            "userId": request.userId,
+            "createdAt": now,
+            "lastActivity": now,
+            "messageCount": 0,
+            "deleted": False
         }
-        session["messages"].append(user_message)
-        # Salvar mensagem do usuário no Firestore
-        await save_message_to_firestore(request.sessionId, user_message)
-        
-        if request.streaming:
-            async def event_generator():
-                invocation_id = f"e-{str(uuid.uuid4())}"
-                final_accumulated = []
-                
-                # Helper para dividir deltas grandes em partes menores e preservar palavras/linhas
-                def chunk_delta_text(delta_text: str, max_chars: int = 120):
-                    if not delta_text:
-                        return []
-                    chunks = []
-                    current = []
-                    current_len = 0
-                    for token in delta_text.split(" "):
-                        # manter quebras de linha dentro do token
-                        token_str = (" " if current else "") + token
-                        if current_len + len(token_str) > max_chars or "\n\n" in token_str:
-                            # se tiver parágrafo, quebrar no parágrafo
-                            parts = token_str.split("\n\n")
-                            if current:
-                                chunks.append("".join(current))
-                                current = []
-                                current_len = 0
-                            for i, p in enumerate(parts):
-                                if not p:
-                                    chunks.append("\n\n")
+        if session_source:
+            session["source"] = session_source
+        pending_sessions[request.sessionId] = session
+        turn_ops.append(session_write_op(request.sessionId, session))
+
+    # Registrar mensagem do usuário
+    user_message = {
+        "role": "user",
+        "content": message,
+        "timestamp": datetime.now(timezone.utc).isoformat()
+    }
+    turn_ops.append(message_write_op(request.sessionId, user_message))
+    return turn_ops
+
+async def open_turn_stream(request: RunSSERequest, idempotency_key: Optional[str] = None,
+                           last_event_id: Optional[str] = None, traceparent: Optional[str] = None,
+                           span_name: str = "POST /run_sse") -> Tuple[InflightTurn, int, Dict[str, str]]:
+    """Inicia, acompanha ou retoma um turno em streaming (``/run_sse`` e ``/ws``).
+
+    Retorna ``(turno, seq, headers)``: o cliente já está inscrito no turno e deve
+    acompanhá-lo a partir do frame seguinte a ``seq`` (``turn.follow``) e sair com
+    ``turn.unsubscribe``; ``headers`` são os metadados da resposta (``X-Cache``,
+    ``X-Trace-Id``, ``X-Coalesced``, ``X-Resumed``). Recusas levantam
+    ``HTTPException`` (429 na admissão; 400 para ``Last-Event-ID`` malformado e
+    404 para um stream desconhecido neste processo).
+    """
+    started = time.perf_counter()
+    user_message_text = request.newMessage.parts[0].text
+
+    # Reconexão de um stream: reenviar os frames perdidos e seguir a execução ao vivo
+    if last_event_id:
+        if parse_event_id(last_event_id) is None:
+            raise HTTPException(status_code=400, detail="Last-Event-ID inválido")
+        resumed = inflight.resume(last_event_id, (request.userId, request.sessionId))
+        if resumed is None:
+            # Expirado, de outra sessão ou iniciado em outro worker: nunca executar o turno de novo
+            raise HTTPException(status_code=404, detail="Stream desconhecido neste servidor (expirado ou iniciado em outro worker); recarregue o histórico da sessão")
+        stream_turn, after = resumed
+        logger.info(f"[/run_sse] retomando stream {stream_turn.invocation_id} após o evento {after} (done={stream_turn.done})")
+        return stream_turn, after, {"X-Resumed": "true", "X-Trace-Id": stream_turn.trace_id or ""}
+
+    # Antes da deduplicação: entre ela e o registro do turno não pode haver await
+    await wait_response_cache(request)
+
+    # Requisição duplicada (mesma chave de idempotência, ou mesma sessão e mensagem
+    # dentro da janela): acompanhar o turno existente em vez de executar de novo
+    key, retention = turn_key(request.userId, request.sessionId, user_message_text, idempotency_key)
+    existing = inflight.attach(key)
+    if existing is not None:
+        logger.info(f"[/run_sse] turno duplicado, acompanhando execução existente (done={existing.done})")
+        return existing, 0, {"X-Coalesced": "true", "X-Trace-Id": existing.trace_id or ""}
+
+    # Span raiz do turno: as etapas abaixo e a task de execução viram spans filhos
+    root_span = tracing.start_trace(span_name, traceparent, {
+        "luminus.session_id": request.sessionId,
+        "luminus.user_id": request.userId,
+        "luminus.streaming": True,
+    })
+    trace_token = tracing.attach(root_span)
+    ticket = None
+    turn = None
+    result = None
+    cache_status = None
+    # A partir do retorno a vaga e o turno pertencem à task de execução
+    handed_off = False
+    try:
+        cache_key, cached, cache_status = lookup_cached_response(request, user_message_text)
+        # Controle de admissão antes de qualquer trabalho (respostas do cache não ocupam vaga)
+        if not cached:
+            ticket = acquire_admission(request.userId)
+        # Registrar o turno antes de qualquer await, para que duplicados concorrentes o encontrem
+        invocation_id = f"e-{str(uuid.uuid4())}"
+        turn = inflight.start(key, retention, invocation_id, (request.userId, request.sessionId))
+        turn.trace_id = root_span.trace_id
+        # O prompt é gravado antes da execução: sobrevive a falhas e leva o horário real do envio
+        await submit_turn_writes(request.sessionId, await begin_turn_writes(request, user_message_text))
+        turn_ops: List[WriteOp] = []
+
+        async def produce():
+            """Executa o turno e publica os frames SSE no ``InflightTurn``"""
+            final_accumulated = []
+            # Textos dos ramos paralelos por agente: entram na resposta final só sem consolidação
+            branch_accumulated: Dict[str, List[str]] = {}
+            frames = 0
+            current_agent = None
+            agent_runs = list(cached.get("agents") or []) if cached else []
+            turn_result = None
+            model_usage = None
+            try:
+                # Aguardar vaga informando a posição na fila
+                if ticket is not None and not ticket.granted:
+                    with tracing.span("admission.wait"):
+                        deadline = time.monotonic() + ADMISSION_QUEUE_TIMEOUT
+                        last_position = None
+                        while not ticket.granted:
+                            remaining = deadline - time.monotonic()
+                            if remaining <= 0:
+                                raise AdmissionRejected("Tempo de espera na fila excedido", admission.retry_after())
+                            position = ticket.position()
+                            if position != last_position:
+                                last_position = position
+                                turn.publish(sse_frame({"type": "queue", "invocationId": invocation_id, "position": position, "timestamp": time.time()}))
+                            await ticket.wait(min(ADMISSION_POSITION_INTERVAL, remaining))
+
+                # Status, transferências e deltas vêm da execução real (event.author do ADK);
+                # deltas agrupados por janela de tempo/bytes
+                if cached:
+                    items = replay_cached_response(cached)
+                else:
+                    items = stream_agent_events(user_message_text, session_id=request.sessionId, user_id=request.userId,
+                                                agent_mode=request.agentMode)
+                with tracing.span("agent.run", {"luminus.cached": bool(cached)}):
+                    async for item in coalesce_deltas(items):
+                        if isinstance(item, dict):
+                            if item.get("type") == "status":
+                                if item["state"] == "done":
+                                    agent_runs.append({key: item[key] for key in ("agent", "startedAt", "endedAt", "durationMs", "usage")})
                                 else:
-                                    chunks.append(p)
+                                    current_agent = item["agent"]
+                            turn.publish(sse_frame({**item, "invocationId": invocation_id}))
+                            continue
+                        if isinstance(item, AgentDelta):
+                            branch_accumulated.setdefault(item.agent, []).append(item.text)
+                            delta, agent, branch = item.text, item.agent, item.branch
                         else:
-                            current.append(token_str)
-                            current_len += len(token_str)
-                    if current:
-                        chunks.append("".join(current))
-                    # Se ainda ficaram pedaços enormes (sem espaços), quebrar por tamanho fixo
-                    normalized = []
-                    for c in chunks:
-                        if len(c) <= max_chars:
-                            normalized.append(c)
-                        else:
-                            for i in range(0, len(c), max_chars):
-                                normalized.append(c[i:i+max_chars])
-                    return normalized
-                try:
-                    # Sequência real de subagentes definidos em agent.py (ordem do LoopAgent)
-                    agent_sequence = [
-                        "enrichment_agent",
-                        "search_agent",
-                        "content_creator",
-                        "content_evaluator",
-                        "content_refiner",
-                    ]
-                    current_agent_idx = 0
-                    total_emitted = 0
-                    # tamanho aproximado por agente para progressão de status durante streaming de texto
-                    chars_per_agent = 800
-                    # Emitir início do primeiro agente
-                    first = {"type": "status", "agent": agent_sequence[current_agent_idx], "state": "thinking", "timestamp": time.time()}
-                    yield f"data: {json.dumps(first, ensure_ascii=False)}\n\n"
-                    await asyncio.sleep(0)
-                    first_exec = {"type": "status", "agent": agent_sequence[current_agent_idx], "state": "executing", "timestamp": time.time()}
-                    yield f"data: {json.dumps(first_exec, ensure_ascii=False)}\n\n"
-                    await asyncio.sleep(0)
-
-                    # Tenta streaming real via ADK com os IDs do cliente
-                    async for delta in process_message_stream(user_message_text, session_id=request.sessionId, user_id=request.userId):
-                        if delta:
-                            final_accumulated.append(delta)
-                            for piece in chunk_delta_text(delta):
-                                payload = {
-                                    "type": "delta",
-                                    "invocationId": invocation_id,
-                                    "delta": piece,
-                                    "agent": agent_sequence[current_agent_idx],
-                                    "done": False,
-                                    "timestamp": time.time(),
-                                    "author": "practia-agent",
-                                }
-                                logger.info(f"[/run_sse] emitindo delta len={len(piece)} preview='{piece[:40]}'")
-                                yield f"data: {json.dumps(payload, ensure_ascii=False)}\n\n"
-                                await asyncio.sleep(0)
-                                # Atualizar progressão por agente
-                                total_emitted += len(piece)
-                                while current_agent_idx < len(agent_sequence) - 1 and total_emitted >= (current_agent_idx + 1) * chars_per_agent:
-                                    # concluir agente atual
-                                    done_evt = {"type": "status", "agent": agent_sequence[current_agent_idx], "state": "done", "timestamp": time.time()}
-                                    yield f"data: {json.dumps(done_evt, ensure_ascii=False)}\n\n"
-                                    await asyncio.sleep(0)
-                                    # iniciar próximo
-                                    current_agent_idx += 1
-                                    next_think = {"type": "status", "agent": agent_sequence[current_agent_idx], "state": "thinking", "timestamp": time.time()}
-                                    yield f"data: {json.dumps(next_think, ensure_ascii=False)}\n\n"
-                                    await asyncio.sleep(0)
-                                    next_exec = {"type": "status", "agent": agent_sequence[current_agent_idx], "state": "executing", "timestamp": time.time()}
-                                    yield f"data: {json.dumps(next_exec, ensure_ascii=False)}\n\n"
-                                    await asyncio.sleep(0)
-
-                    final_text = ("".join(final_accumulated)).strip()
-                    if final_text:
-                        logger.info(f"[/run_sse] final_text len={len(final_text)}")
-                        assistant_message = {
-                            "role": "assistant",
-                            "content": final_text,
-                            "timestamp": datetime.now(timezone.utc).isoformat(),
+                            final_accumulated.append(item)
+                            delta, agent, branch = item, current_agent, None
+                        payload = {
+                            "type": "delta",
+                            "invocationId": invocation_id,
+                            "delta": delta,
+                            "agent": agent,
+                            "done": False,
+                            "timestamp": time.time(),
+                            "author": "practia-agent",
                         }
-                        session["messages"].append(assistant_message)
-                        # Salvar mensagem do assistente no Firestore
-                        await save_message_to_firestore(request.sessionId, assistant_message)
-                        await update_session(request.sessionId, {
-                            "lastActivity": datetime.now(timezone.utc).isoformat(),
-                            "messages": session["messages"],
-                            "messageCount": len(session["messages"]),
-                        })
-                        # Garantir que todos os agentes restantes recebam 'done'
-                        while current_agent_idx < len(agent_sequence):
-                            fin = {"type": "status", "agent": agent_sequence[current_agent_idx], "state": "done", "timestamp": time.time()}
-                            yield f"data: {json.dumps(fin, ensure_ascii=False)}\n\n"
-                            await asyncio.sleep(0)
-                            current_agent_idx += 1
-
-                    done_evt = {"type": "done", "invocationId": invocation_id, "done": True, "timestamp": time.time()}
-                    logger.info(f"[/run_sse] done event: {done_evt}")
-                    yield f"data: {json.dumps(done_evt, ensure_ascii=False)}\n\n"
-                except Exception as stream_err:
-                    err_payload = {"error": str(stream_err), "done": True}
-                    logger.exception(f"[/run_sse] erro no streaming: {stream_err}")
-                    yield f"data: {json.dumps(err_payload, ensure_ascii=False)}\n\n"
-
-            headers = {
-                "Content-Type": "text/event-stream",
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-                "X-Accel-Buffering": "no",
-            }
-            return StreamingResponse(event_generator(), headers=headers, media_type="text/event-stream")
+                        if branch:
+                            payload["branch"] = branch
+                        frames += 1
+                        if frames == 1:
+                            metrics.SSE_TIME_TO_FIRST_DELTA.observe(time.perf_counter() - started)
+                        logger.debug(f"[/run_sse] emitindo delta agent={agent} len={len(delta)}")
+                        turn.publish(sse_frame(payload))
+
+                final_text = turn_text(final_accumulated, branch_accumulated)
+                # Uso real de tokens do turno (registrado pelos modelos dos agentes), total e por agente
+                model_usage = None if cached else turn_usage(agent_runs)
+                usage = response_usage(user_message_text, final_text, model_usage, cached=bool(cached))
+                if final_text:
+                    logger.info(f"[/run_sse] final_text len={len(final_text)} frames={frames}")
+                    assistant_message = {
+                        "role": "assistant",
+                        "content": final_text,
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                        "usage": usage,
+                    }
+                    turn_ops.append(message_write_op(request.sessionId, assistant_message))
+                    if not cached:
+                        store_cached_response(cache_key, final_text, agent_runs)
+                record_turn_usage(request, user_message_text, model_usage)
+
+                done_evt = {"type": "done", "invocationId": invocation_id, "done": True, "agents": agent_runs, "usage": usage, "cache": cache_status, "traceId": root_span.trace_id, "timestamp": time.time()}
+                logger.info(f"[/run_sse] done invocationId={invocation_id} agents={[(run['agent'], run['durationMs']) for run in agent_runs]}")
+                run_stats["completed"] += 1
+                turn_result = {"text": final_text, "agents": agent_runs, "usage": usage, "invocationId": invocation_id}
+                turn.publish(sse_frame(done_evt))
+            except AdmissionRejected as rejected:
+                logger.warning(f"[/run_sse] fila expirada userId={request.userId}")
+                turn_result = {"error": rejected.reason, "retryAfter": rejected.retry_after}
+                turn.publish(sse_frame({"error": rejected.reason, "retryAfter": rejected.retry_after, "done": True}))
+            except asyncio.CancelledError:
+                # Todos os clientes saíram no meio da resposta: gravar o parcial
+                run_stats["cancelled"] += 1
+                partial_text = turn_text(final_accumulated, branch_accumulated)
+                logger.info(f"[/run_sse] execução cancelada invocationId={invocation_id} partial_len={len(partial_text)}")
+                # Tokens das execuções já concluídas foram consumidos mesmo assim
+                model_usage = None if cached else turn_usage(agent_runs)
+                record_turn_usage(request, user_message_text, model_usage)
+                if partial_text:
+                    turn_ops.append(message_write_op(request.sessionId, {
+                        "role": "assistant",
+                        "content": partial_text,
+                        "timestamp": datetime.now(timezone.utc).isoformat(),
+                        "truncated": True,
+                        "usage": response_usage(user_message_text, partial_text, model_usage),
+                    }))
+                turn_result = {"text": partial_text, "truncated": True, "error": "Execução cancelada", "invocationId": invocation_id}
+                # Frame final para quem retomar o stream depois do cancelamento
+                turn.publish(sse_frame({"error": turn_result["error"], "invocationId": invocation_id, "done": True}))
+                raise
+            except Exception as stream_err:
+                run_stats["failed"] += 1
+                err_payload = {"error": str(stream_err), "done": True}
+                logger.exception(f"[/run_sse] erro no streaming: {stream_err}")
+                turn_result = {"error": str(stream_err)}
+                turn.publish(sse_frame(err_payload))
+            finally:
+                if ticket is not None:
+                    ticket.release()
+                outcome = turn_outcome(turn_result)
+                metrics.TURN_DURATION.labels("stream", outcome).observe(time.perf_counter() - started)
+                metrics.SSE_DELTAS_PER_RESPONSE.observe(frames)
+                metrics.SSE_BYTES_PER_RESPONSE.observe(turn.bytes_published)
+                try:
+                    # Enfileirar a resposta (completa ou parcial) e a atualização da sessão
+                    await submit_turn_writes(request.sessionId, turn_ops, usage=model_usage)
+                finally:
+                    finish_turn(turn, turn_result)
+                    end_turn_span(root_span, outcome, cache_status, turn_result)
+
+        # A execução não depende da conexão: cada cliente acompanha o turno
+        turn.task = asyncio.ensure_future(produce())
+        handed_off = True
+        return turn, 0, {"X-Cache": cache_status, "X-Trace-Id": root_span.trace_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        result = {"error": str(e)}
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if not handed_off:
+            if ticket is not None:
+                ticket.release()
+            if turn is not None:
+                metrics.TURN_DURATION.labels("stream", turn_outcome(result)).observe(time.perf_counter() - started)
+                finish_turn(turn, result)
+                turn.unsubscribe()
+            end_turn_span(root_span, turn_outcome(result), cache_status, result)
+        tracing.detach(trace_token)
+
+async def execute_turn(request: RunSSERequest, idempotency_key: Optional[str] = None,
+                       traceparent: Optional[str] = None, span_name: str = "POST /run_sse",
+                       mode: str = "json", adk_session: bool = False,
+                       session_source: Optional[str] = None) -> Tuple[Dict, Dict[str, str]]:
+    """Executa um turno sem streaming (``/run_sse`` com ``streaming=false`` e ``/run_batch``).
+
+    Retorna ``(resultado, headers)``, com ``text``, ``agents``, ``usage`` e
+    ``invocationId`` no resultado. ``adk_session`` executa o agente na sessão
+    ``sessionId`` do ADK (mantém o contexto da conversa) em vez de uma sessão
+    descartável; ``session_source`` marca a sessão se ela for criada neste
+    turno. Recusas e falhas levantam ``HTTPException``.
+    """
+    user_message_text = request.newMessage.parts[0].text
+    started = time.perf_counter()
+    ticket = None
+    turn = None
+    result = None
+    root_span = None
+    trace_token = None
+    cache_status = None
+    try:
+        # Antes da deduplicação: entre ela e o registro do turno não pode haver await
+        await wait_response_cache(request)
+
+        # Requisição duplicada: aguardar o resultado do turno existente
+        key, retention = turn_key(request.userId, request.sessionId, user_message_text, idempotency_key)
+        existing = inflight.attach(key)
+        if existing is not None:
+            logger.info(f"[/run_sse] turno duplicado, acompanhando execução existente (done={existing.done})")
+            try:
+                shared = await existing.wait_result()
+            finally:
+                existing.unsubscribe()
+            if shared.get("retryAfter"):
+                raise HTTPException(status_code=429, detail=shared["error"], headers={"Retry-After": str(shared["retryAfter"])})
+            if shared.get("error"):
+                raise HTTPException(status_code=500, detail=shared["error"])
+            return shared, {"X-Coalesced": "true", "X-Trace-Id": existing.trace_id or ""}
+
+        # Span raiz do turno: as etapas abaixo viram spans filhos
+        root_span = tracing.start_trace(span_name, traceparent, {
+            "luminus.session_id": request.sessionId,
+            "luminus.user_id": request.userId,
+            "luminus.streaming": False,
+        })
+        trace_token = tracing.attach(root_span)
 
-        # Não-streaming (comportamento anterior)
-        response_text = await process_message_with_agent(user_message_text)
+        cache_key, cached, cache_status = lookup_cached_response(request, user_message_text)
+        # Controle de admissão antes de qualquer trabalho (respostas do cache não ocupam vaga)
+        if not cached:
+            ticket = acquire_admission(request.userId)
+        # Registrar o turno antes de qualquer await, para que duplicados concorrentes o encontrem
+        invocation_id = f"e-{str(uuid.uuid4())}"
+        turn = inflight.start(key, retention, invocation_id, (request.userId, request.sessionId))
+        turn.trace_id = root_span.trace_id
+
+        # Sem streaming não há como informar a posição: aguarda na fila aqui
+        if ticket is not None and not ticket.granted:
+            with tracing.span("admission.wait"):
+                granted = await ticket.wait(ADMISSION_QUEUE_TIMEOUT)
+            if not granted:
+                result = {"error": "Tempo de espera na fila excedido", "retryAfter": admission.retry_after()}
+                raise HTTPException(status_code=429, detail=result["error"], headers={"Retry-After": str(result["retryAfter"])})
+
+        # A mensagem do usuário é enfileirada antes da execução: um timeout
+        # (ex.: itemTimeout do /run_batch) cancela o turno antes da resposta
+        await submit_turn_writes(request.sessionId, await begin_turn_writes(request, user_message_text, session_source))
+
+        # Execução sem streaming
+        agent_runs = []
+        if cached:
+            response_text = cached["text"]
+            # Atribuição por agente da execução que gerou a resposta guardada
+            agent_runs = list(cached.get("agents") or [])
+        else:
+            with tracing.span("agent.run", {"luminus.cached": False}):
+                if adk_session:
+                    response_text, agent_runs = await process_message_with_usage(
+                        user_message_text, session_id=request.sessionId, user_id=request.userId,
+                        agent_mode=request.agentMode)
+                else:
+                    response_text, agent_runs = await process_message_with_usage(user_message_text, agent_mode=request.agentMode)
+            store_cached_response(cache_key, response_text, agent_runs)
+        model_usage = None if cached else turn_usage(agent_runs)
+        usage = response_usage(user_message_text, response_text, model_usage, cached=bool(cached))
         assistant_message = {
             "role": "assistant",
             "content": response_text,
-            "timestamp": datetime.now(timezone.utc).isoformat()
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "usage": usage,
         }
-        session["messages"].append(assistant_message)
-        # Salvar mensagem do assistente no Firestore
-        await save_message_to_firestore(request.sessionId, assistant_message)
-        await update_session(request.sessionId, {
-            "lastActivity": datetime.now(timezone.utc).isoformat(),
-            "messages": session["messages"],
-            "messageCount": len(session["messages"])
-        })
-        
-        invocation_id = f"e-{str(uuid.uuid4())}"
-        response_id = str(uuid.uuid4())
-        prompt_tokens = len(user_message_text.split())
-        response_tokens = len(response_text.split())
-        total_tokens = prompt_tokens + response_tokens
-        
-        return RunSSEResponse(
-            content=Content(parts=[ContentPart(text=response_text)], role="model"),
-            usageMetadata=UsageMetadata(
-                candidatesTokenCount=response_tokens,
-                candidatesTokensDetails=[TokensDetails(modality="TEXT", tokenCount=response_tokens)],
-                promptTokenCount=prompt_tokens,
-                promptTokensDetails=[TokensDetails(modality="TEXT", tokenCount=prompt_tokens)],
-                totalTokenCount=total_tokens,
-            ),
-            invocationId=invocation_id,
-            author="practia-agent",
-            actions=Actions(stateDelta={}, artifactDelta={}, requestedAuthConfigs={}),
-            id=response_id,
-            timestamp=time.time(),
-        )
+        await submit_turn_writes(request.sessionId, [message_write_op(request.sessionId, assistant_message)], usage=model_usage)
+        record_turn_usage(request, user_message_text, model_usage)
+        result = {"text": response_text, "agents": agent_runs, "usage": usage, "invocationId": invocation_id}
+        return result, {"X-Cache": cache_status, "X-Trace-Id": root_span.trace_id}
 
+    except HTTPException:
+        raise
     except Exception as e:
+        result = {"error": str(e)}
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if ticket is not None:
+            ticket.release()
+        if turn is not None:
+            metrics.TURN_DURATION.labels(mode, turn_outcome(result)).observe(time.perf_counter() - started)
+            finish_turn(turn, result)
+            turn.unsubscribe()
+        if root_span is not None:
+            end_turn_span(root_span, turn_outcome(result), cache_status, result)
+        if trace_token is not None:
+            tracing.detach(trace_token)
+
+
+@app.post("/run_sse")
+async def run_sse(request: RunSSERequest, response: Response, http_request: Request):
+    """Processa uma mensagem e responde. Se streaming=true, envia via SSE (text/event-stream)."""
+    logger.info(f"[/run_sse] sessionId={request.sessionId} userId={request.userId} appName={request.appName} streaming={request.streaming}")
+    user_message_text = request.newMessage.parts[0].text
+    logger.info(f"[/run_sse] nova mensagem len={len(user_message_text)} preview='{user_message_text[:80]}'")
+    idempotency_key = request.idempotencyKey or http_request.headers.get("Idempotency-Key")
+    if http_request.headers.get("Last-Event-ID") and not request.streaming:
+        # Retomada só existe em streaming; executar aqui repetiria o turno
+        raise HTTPException(status_code=400, detail="Last-Event-ID exige streaming=true")
+    if request.streaming:
+        turn, after, headers = await open_turn_stream(
+            request, idempotency_key,
+            last_event_id=http_request.headers.get("Last-Event-ID"),
+            traceparent=http_request.headers.get("traceparent"),
+        )
+        return StreamingResponse(follow_turn_stream(turn, http_request, after),
+                                 headers={**SSE_HEADERS, **headers}, media_type="text/event-stream")
+
+    result, headers = await execute_turn(request, idempotency_key, traceparent=http_request.headers.get("traceparent"))
+    response.headers.update(headers)
+    return build_run_response(result["text"], result["invocationId"], result["usage"])
+
+@app.post("/run_batch")
+async def run_batch(request: RunBatchRequest, http_request: Request):
+    """Executa uma lista de prompts com paralelismo limitado e responde em NDJSON:
+    uma linha por item assim que ele termina (ordem de conclusão) e um resumo no final.
+
+    Cada item é um turno sem streaming (``execute_turn``): passa pelo cache, pela
+    admissão e é gravado na sessão. Itens da mesma sessão rodam em sequência.
+    """
+    if not request.items:
+        raise HTTPException(status_code=400, detail="Lote sem itens")
+    if len(request.items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Máximo de {BATCH_MAX_ITEMS} itens por lote")
+    concurrency, item_timeout = batch_limits(request.concurrency, request.itemTimeout)
+    batch_id = f"b-{str(uuid.uuid4())}"
+    traceparent = http_request.headers.get("traceparent")
+    # Itens sem sessão ganham uma própria, devolvida no resultado e fora do GET /sessions
+    session_ids = [item.sessionId or f"{batch_id}-{index}" for index, item in enumerate(request.items)]
+    logger.info(f"[/run_batch] {batch_id} userId={request.userId} itens={len(request.items)} concurrency={concurrency} itemTimeout={item_timeout}s")
+
+    async def run_item(index: int, item: BatchItem):
+        turn_request = RunSSERequest(
+            appName=request.appName,
+            userId=request.userId,
+            sessionId=session_ids[index],
+            newMessage={"role": "user", "parts": [{"text": item.prompt}]},
+            streaming=False,
+            bypassCache=request.bypassCache,
+            agentMode=request.agentMode,
+        )
+        while True:
+            try:
+                return await execute_turn(turn_request, traceparent=traceparent, span_name="POST /run_batch",
+                                          mode="batch", adk_session=True,
+                                          session_source=None if item.sessionId else BATCH_SESSION_SOURCE)
+            except HTTPException as e:
+                retry_after = (e.headers or {}).get("Retry-After")
+                if e.status_code != 429 or retry_after is None:
+                    raise
+                # Fila de admissão cheia: tentar de novo dentro do tempo do item
+                await asyncio.sleep(float(retry_after))
+
+    def item_line(index: int, outcome, latency: float) -> Dict:
+        line = {
+            "type": "item",
+            "index": index,
+            "id": request.items[index].id,
+            "sessionId": session_ids[index],
+            "latencyMs": round(latency * 1000, 1),
+        }
+        if isinstance(outcome, asyncio.TimeoutError):
+            line.update(status="timeout", error=f"Tempo limite do item excedido ({item_timeout}s)")
+        elif isinstance(outcome, HTTPException):
+            line.update(status="failed", error=outcome.detail)
+        elif isinstance(outcome, Exception):
+            line.update(status="failed", error=str(outcome))
+        else:
+            result, headers = outcome
+            # Respostas de contingência indicam falha do agente
+            failed = result["text"] in AGENT_FALLBACK_MESSAGES
+            line.update(
+                status="failed" if failed else "completed",
+                text=result["text"],
+                usage=result["usage"],
+                invocationId=result["invocationId"],
+                cache=headers.get("X-Cache"),
+                coalesced=headers.get("X-Coalesced") == "true",
+                traceId=headers.get("X-Trace-Id"),
+            )
+            if failed:
+                line["error"] = result["text"]
+        return line
+
+    async def results():
+        started = time.perf_counter()
+        counts = {"completed": 0, "failed": 0, "timeout": 0}
+        totals = {field: 0 for field in USAGE_FIELDS}
+        async for index, outcome, latency in run_bounded(request.items, run_item, concurrency, item_timeout,
+                                                         serial_key=lambda item: item.sessionId):
+            line = item_line(index, outcome, latency)
+            counts[line["status"]] += 1
+            metrics.BATCH_ITEMS.labels(line["status"]).inc()
+            for field in USAGE_FIELDS:
+                totals[field] += (line.get("usage") or {}).get(field, 0)
+            yield encode_json(line) + b"\n"
+        duration_ms = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"[/run_batch] {batch_id} concluído em {duration_ms}ms {counts}")
+        yield encode_json({
+            "type": "summary",
+            "batchId": batch_id,
+            "items": len(request.items),
+            **counts,
+            "durationMs": duration_ms,
+            "concurrency": concurrency,
+            "itemTimeout": item_timeout,
+            "usage": totals,
+        }) + b"\n"
+
+    return StreamingResponse(
+        results(),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", "X-Batch-Id": batch_id},
+    )
+
+
+async def receive_websocket_auth(websocket: WebSocket) -> Optional[bool]:
+    """Primeira mensagem ``{"type": "auth", "apiKey": ...}`` (navegadores não enviam headers no WebSocket).
+
+    ``None`` se o cliente desconectou antes de se autenticar.
+    """
+    try:
+        raw = await asyncio.wait_for(websocket.receive(), WS_AUTH_TIMEOUT)
+    except asyncio.TimeoutError:
+        return False
+    if raw["type"] == "websocket.disconnect":
+        return None
+    try:
+        message = parse_client_message(raw)
+    except (UnsupportedFrame, ValueError):
+        return False
+    if not isinstance(message, dict) or message.get("type") != "auth" or message.get("apiKey") != API_KEY:
+        return False
+    await websocket.send_text(encode_json(control_message("authenticated")).decode("utf-8"))
+    return True
+
+@app.websocket("/ws")
+async def websocket_streams(websocket: WebSocket):
+    """Vários turnos, de quaisquer sessões, multiplexados numa conexão (protocolo em ``ws_mux.py``).
+
+    Cada stream usa a mesma execução e persistência do ``/run_sse`` (``open_turn_stream``).
+    """
+    # O middleware HTTP não cobre WebSocket: API key no header ou na primeira
+    # mensagem (nunca na URL, que vai para logs de proxies e do histórico)
+    header_key = websocket.headers.get("X-API-Key")
+    if API_KEY and header_key is not None and header_key != API_KEY:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    background_startup.mark_request()
+    await background_startup.wait("firestore")
+    await websocket.accept()
+    if API_KEY and header_key is None:
+        authenticated = await receive_websocket_auth(websocket)
+        if not authenticated:
+            if authenticated is not None:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+    metrics.WS_CONNECTIONS.inc()
+    streams: Dict[str, asyncio.Future] = {}
+    credits: Dict[str, StreamCredit] = {}
+    cancelled = set()
+    send_lock = asyncio.Lock()
+
+    async def send(text: str):
+        async with send_lock:
+            await websocket.send_text(text)
+
+    async def send_control(kind: str, stream_id: Optional[str] = None, **fields):
+        await send(encode_json(control_message(kind, stream_id, **fields)).decode("utf-8"))
+
+    async def pump(stream_id: str, request: RunSSERequest, last_event_id: Optional[str], credit: StreamCredit):
+        """Acompanha o turno do stream e envia os frames conforme os créditos"""
+        turn = None
+        try:
+            try:
+                turn, after, headers = await open_turn_stream(
+                    request, request.idempotencyKey, last_event_id=last_event_id,
+                    traceparent=websocket.headers.get("traceparent"), span_name="WS /ws",
+                )
+            except HTTPException as e:
+                await send_control("error", stream_id, status=e.status_code, detail=e.detail,
+                                   retryAfter=(e.headers or {}).get("Retry-After"))
+                return
+            await send_control("started", stream_id, headers=headers)
+            metrics.WS_STREAMS_IN_FLIGHT.inc()
+            try:
+                async for frame in turn.follow(after):
+                    await credit.acquire()
+                    await send(event_message(stream_id, frame))
+                if turn.last_seq == 0 and turn.result is not None:
+                    # Turno iniciado por uma requisição sem streaming
+                    for frame in result_frames(turn.result, turn.invocation_id)[after:]:
+                        await credit.acquire()
+                        await send(event_message(stream_id, frame))
+            finally:
+                metrics.WS_STREAMS_IN_FLIGHT.dec()
+            await send_control("end", stream_id, reason="done")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            # Conexão encerrada no meio do envio
+            logger.info(f"[/ws] stream {stream_id} interrompido: {e}")
+        finally:
+            streams.pop(stream_id, None)
+            credits.pop(stream_id, None)
+            if turn is not None:
+                # Queda da conexão espera uma retomada; cancelamento explícito não
+                turn.unsubscribe(grace=stream_id not in cancelled)
+            cancelled.discard(stream_id)
+
+    try:
+        while True:
+            try:
+                raw = await websocket.receive()
+                if raw["type"] == "websocket.disconnect":
+                    break
+                message = parse_client_message(raw)
+            except UnsupportedFrame:
+                await websocket.close(code=status.WS_1003_UNSUPPORTED_DATA)
+                break
+            except ValueError:
+                await send_control("error", status=400, detail="Mensagem JSON inválida")
+                continue
+            kind = message.get("type") if isinstance(message, dict) else None
+            stream_id = message.get("streamId") if isinstance(message, dict) else None
+            if kind == "ping":
+                await send_control("pong")
+            elif kind == "run":
+                if not isinstance(stream_id, str) or not stream_id or stream_id in streams:
+                    await send_control("error", stream_id, status=400, detail="streamId ausente ou já em uso")
+                    continue
+                if len(streams) >= WS_MAX_STREAMS:
+                    await send_control("error", stream_id, status=429, detail=f"Máximo de {WS_MAX_STREAMS} streams por conexão")
+                    continue
+                try:
+                    request = RunSSERequest(**{**(message.get("request") or {}), "streaming": True})
+                    window = int(message.get("window") or WS_STREAM_WINDOW)
+                except (ValidationError, TypeError, ValueError) as e:
+                    await send_control("error", stream_id, status=422, detail=str(e))
+                    continue
+                logger.info(f"[/ws] stream {stream_id} sessionId={request.sessionId} userId={request.userId}")
+                credits[stream_id] = credit = StreamCredit(window)
+                streams[stream_id] = asyncio.ensure_future(pump(stream_id, request, message.get("lastEventId"), credit))
+            elif kind == "credit":
+                credit = credits.get(stream_id)
+                if credit is not None:
+                    try:
+                        credit.grant(int(message.get("frames") or 0))
+                    except (TypeError, ValueError):
+                        await send_control("error", stream_id, status=400, detail="frames inválido")
+            elif kind == "cancel":
+                task = streams.get(stream_id)
+                if task is not None:
+                    cancelled.add(stream_id)
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    await send_control("end", stream_id, reason="cancelled")
+            else:
+                await send_control("error", stream_id, status=400, detail=f"Tipo de mensagem desconhecido: {kind}")
+    finally:
+        tasks = list(streams.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        metrics.WS_CONNECTIONS.dec()
+
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,127 @@
+"""Índice secundário em memória das sessões por usuário.
+
+Mantém, para cada ``(userId, appName)`` e para cada ``userId``, a lista das
+sessões ordenada por ``lastActivity``. Uma página da listagem custa
+O(log n + limit), sem varrer ``sessions_db`` inteiro.
+
+O cursor da listagem (``encode_cursor``) carrega a chave ``(lastActivity,
+sessionId)`` da última sessão da página: a página seguinte continua dessa
+posição mesmo que a sessão tenha sido deletada ou recebido mensagens depois.
+"""
+import base64
+import bisect
+import json
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+_Key = Tuple[str, str]  # (lastActivity, sessionId)
+
+# Origem das sessões criadas automaticamente pelo /run_batch (fora da listagem)
+BATCH_SESSION_SOURCE = "batch"
+
+
+def is_listed(session: Dict) -> bool:
+    """Sessão exibida em ``GET /sessions``: não deletada nem criada automaticamente por um lote"""
+    return not session.get("deleted", False) and session.get("source") != BATCH_SESSION_SOURCE
+
+
+def encode_cursor(user_id: str, app_name: Optional[str], last_activity: Any, session_id: str) -> str:
+    """Cursor opaco com a chave da última sessão da página, ligado ao usuário e ao filtro de app.
+
+    ``last_activity`` é o valor ordenado pelo backend (texto no armazenamento
+    local, ``updatedAt`` do Firestore).
+    """
+    if isinstance(last_activity, datetime):
+        last_activity = {"ts": last_activity.isoformat()}
+    raw = json.dumps([user_id, app_name or None, last_activity, session_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, user_id: str, app_name: Optional[str]) -> Tuple[Any, str]:
+    """``(lastActivity, sessionId)`` do cursor; levanta ``ValueError`` se é inválido ou de outra listagem"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_user, cursor_app, last_activity, session_id = json.loads(raw)
+        if isinstance(last_activity, dict):
+            last_activity = datetime.fromisoformat(last_activity["ts"])
+    except (ValueError, TypeError, KeyError):
+        raise ValueError("Cursor inválido")
+    if cursor_user != user_id or cursor_app != (app_name or None) or not isinstance(session_id, str):
+        raise ValueError("Cursor inválido")
+    return last_activity, session_id
+
+
+def _list_keys(user_id: str, app_name: Optional[str]):
+    if app_name is None:
+        return ((user_id, None),)
+    return ((user_id, None), (user_id, app_name))
+
+
+class UserSessionIndex:
+    """Índice ordenado (mais recentes primeiro) das sessões listáveis (``is_listed``)."""
+
+    def __init__(self):
+        self._lists: Dict[Tuple[str, Optional[str]], List[_Key]] = {}
+        self._entries: Dict[str, Tuple[str, Optional[str], _Key]] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def upsert(self, session: Dict):
+        """Insere ou reposiciona uma sessão; sessões deletadas ou de lote saem do índice"""
+        session_id = session.get("sessionId")
+        if not session_id:
+            return
+        if not is_listed(session):
+            self.remove(session_id)
+            return
+        key = (str(session.get("lastActivity") or ""), session_id)
+        user_id = session.get("userId")
+        app_name = session.get("appName")
+        with self._lock:
+            current = self._entries.get(session_id)
+            if current == (user_id, app_name, key):
+                return
+            if current is not None:
+                self._discard(*current)
+            for list_key in _list_keys(user_id, app_name):
+                bisect.insort(self._lists.setdefault(list_key, []), key)
+            self._entries[session_id] = (user_id, app_name, key)
+
+    def remove(self, session_id: str):
+        with self._lock:
+            current = self._entries.pop(session_id, None)
+            if current is not None:
+                self._discard(*current)
+
+    def page(self, user_id: str, app_name: Optional[str] = None, limit: int = 100,
+             cursor: Optional[str] = None) -> Tuple[List[str], Optional[str]]:
+        """Retorna ``(ids, próximo_cursor)`` em ordem decrescente de lastActivity.
+
+        O cursor (``encode_cursor``) precisa ser da mesma listagem (usuário e
+        filtro de app); caso contrário levanta ``ValueError``.
+        """
+        with self._lock:
+            keys = self._lists.get((user_id, app_name), [])
+            end = len(keys)
+            if cursor:
+                last_activity, session_id = decode_cursor(cursor, user_id, app_name)
+                end = bisect.bisect_left(keys, (str(last_activity), session_id))
+            start = max(0, end - limit)
+            page = keys[start:end]
+        session_ids = [session_id for _, session_id in reversed(page)]
+        next_cursor = encode_cursor(user_id, app_name, *page[0]) if start > 0 and page else None
+        return session_ids, next_cursor
+
+    def _discard(self, user_id: str, app_name: Optional[str], key: _Key):
+        for list_key in _list_keys(user_id, app_name):
+            keys = self._lists.get(list_key)
+            if not keys:
+                continue
+            i = bisect.bisect_left(keys, key)
+            if i < len(keys) and keys[i] == key:
+                del keys[i]
+            if not keys:
+                del self._lists[list_key]
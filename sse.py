@@ -0,0 +1,184 @@
+"""Codificação de eventos SSE para o /run_sse.
+
+Os frames são montados já em bytes (``data: <json>\\n\\n``) e os deltas de texto
+do agente são agrupados numa janela de tempo ou até um limite de bytes, em vez
+de um frame por pedaço recebido do modelo.
+"""
+import asyncio
+import json
+import os
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, NamedTuple, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # está no requirements.txt; json da stdlib só como rede de segurança
+    orjson = None
+
+# Janela de agrupamento de deltas (segundos) e tamanho máximo do buffer (bytes)
+SSE_FLUSH_INTERVAL = float(os.getenv("SSE_FLUSH_INTERVAL", "0.05"))
+SSE_FLUSH_BYTES = int(os.getenv("SSE_FLUSH_BYTES", "2048"))
+# Intervalo de verificação de desconexão do cliente (segundos)
+SSE_DISCONNECT_POLL_INTERVAL = float(os.getenv("SSE_DISCONNECT_POLL_INTERVAL", "0.5"))
+
+
+class AgentDelta(NamedTuple):
+    """Delta de texto de um ramo paralelo (``ParallelAgent``), marcado com o autor"""
+    agent: str
+    branch: Optional[str]
+    text: str
+
+
+class ClientDisconnected(Exception):
+    """O cliente SSE fechou a conexão antes do fim da geração"""
+
+
+class DisconnectWatcher:
+    """Acompanha o canal ``receive`` do ASGI e registra a desconexão do cliente.
+
+    ``Request.is_disconnected`` só enxerga mensagens já disponíveis e, atrás de
+    um ``BaseHTTPMiddleware``, nunca as vê; aqui uma task fica bloqueada em
+    ``receive`` até chegar ``http.disconnect``.
+    """
+
+    def __init__(self, receive: Callable[[], Awaitable[Dict[str, Any]]]):
+        self._receive = receive
+        self._task: Optional[asyncio.Future] = None
+        self.disconnected = False
+
+    def start(self) -> "DisconnectWatcher":
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._watch())
+        return self
+
+    def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    def is_disconnected(self) -> bool:
+        return self.disconnected
+
+    async def _watch(self):
+        try:
+            while True:
+                message = await self._receive()
+                if message.get("type") == "http.disconnect":
+                    self.disconnected = True
+                    return
+        except Exception:
+            # Canal encerrado pelo servidor: nada mais a observar
+            return
+
+
+def encode_json(payload: Dict[str, Any]) -> bytes:
+    """Serializa em JSON UTF-8 com orjson (``json`` da stdlib se ele não estiver instalado)"""
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def sse_frame(payload: Dict[str, Any], event_id: Optional[str] = None) -> bytes:
+    """Monta um frame SSE completo em bytes (com a linha ``id:`` se ``event_id``)"""
+    frame = b"data: " + encode_json(payload) + b"\n\n"
+    if event_id is not None:
+        return b"id: " + event_id.encode("utf-8") + b"\n" + frame
+    return frame
+
+
+def _joined_deltas(pending: Dict[Any, List[str]]) -> Iterator[Union[str, AgentDelta]]:
+    """Um texto por autor, na ordem em que apareceram na janela"""
+    for key, pieces in pending.items():
+        text = "".join(pieces)
+        yield text if key is None else AgentDelta(key[0], key[1], text)
+
+
+async def coalesce_deltas(
+    source: AsyncIterator[Union[str, AgentDelta, Dict[str, Any]]],
+    flush_interval: float = SSE_FLUSH_INTERVAL,
+    max_bytes: int = SSE_FLUSH_BYTES,
+) -> AsyncIterator[Union[str, AgentDelta, Dict[str, Any]]]:
+    """Agrupa os deltas de ``source`` e emite um texto por janela.
+
+    O primeiro delta sai imediatamente (tempo até o primeiro byte); os demais
+    são acumulados até ``flush_interval`` segundos ou até ``max_bytes``, o que
+    ocorrer primeiro. A fonte é consumida por uma task separada, para que o
+    custo por delta seja apenas anexar ao buffer.
+
+    Itens que não são texto (ex.: eventos de status) esvaziam o buffer e são
+    repassados na mesma posição, preservando a ordem. ``AgentDelta`` de ramos
+    paralelos são agrupados por autor na mesma janela, sem misturar os textos.
+    """
+    buffer = []
+    size = 0
+    finished = False
+    error = None
+    has_data = asyncio.Event()
+    flush_now = asyncio.Event()
+
+    async def pump():
+        nonlocal size, finished, error
+        try:
+            async for item in source:
+                if not isinstance(item, (str, AgentDelta)):
+                    buffer.append(item)
+                    has_data.set()
+                    flush_now.set()
+                    continue
+                text = item if isinstance(item, str) else item.text
+                if not text:
+                    continue
+                buffer.append(item)
+                size += len(text.encode("utf-8"))
+                has_data.set()
+                if size >= max_bytes:
+                    flush_now.set()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            has_data.set()
+            flush_now.set()
+
+    task = asyncio.ensure_future(pump())
+    text_sent = False
+    try:
+        while True:
+            await has_data.wait()
+            if text_sent and not finished:
+                try:
+                    await asyncio.wait_for(flush_now.wait(), timeout=flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+            items = buffer[:]
+            buffer.clear()
+            size = 0
+            # Limpar antes de emitir: o que chegar durante os yields sinaliza de novo
+            flush_now.clear()
+            has_data.clear()
+            # Texto pendente por autor (None = deltas sem autor)
+            pending: Dict[Any, List[str]] = {}
+            for item in items:
+                if isinstance(item, str):
+                    pending.setdefault(None, []).append(item)
+                    continue
+                if isinstance(item, AgentDelta):
+                    pending.setdefault((item.agent, item.branch), []).append(item.text)
+                    continue
+                for delta in _joined_deltas(pending):
+                    text_sent = True
+                    yield delta
+                pending = {}
+                yield item
+            for delta in _joined_deltas(pending):
+                text_sent = True
+                yield delta
+            if finished and not buffer:
+                break
+        if error is not None:
+            raise error
+    finally:
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
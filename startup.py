@@ -0,0 +1,165 @@
+"""Inicialização em segundo plano dos componentes lentos do servidor.
+
+O Firebase e o runtime do ADK (imports pesados, credenciais, rede) são
+inicializados numa task criada no lifespan, fora do caminho de boot: o uvicorn
+passa a aceitar conexões imediatamente, ``/health`` responde desde o primeiro
+instante e ``/ready`` informa quando cada componente terminou.
+Os componentes rodam em sequência, numa thread por vez (imports do pacote
+``google`` em threads paralelas podem se bloquear mutuamente).
+
+Quem depende de um componente aguarda com ``await startup.wait(nome)``; se a
+inicialização não foi iniciada (ex.: app usado sem lifespan), não há espera.
+A espera é limitada pelos timeouts dos componentes até ele (rodam em
+sequência). ``stop`` interrompe a inicialização e o próximo ``start`` (novo
+lifespan no mesmo processo) refaz os componentes que não ficaram prontos.
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger("practia.startup")
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+TIMEOUT = "timeout"
+
+
+class StartupComponent:
+    def __init__(self, name: str, init: Callable[[], Any], timeout: float,
+                 on_result: Optional[Callable[[Any], None]] = None):
+        self.name = name
+        self.init = init
+        self.timeout = timeout
+        self.on_result = on_result
+        self.status = PENDING
+        self.error: Optional[str] = None
+        self.duration: Optional[float] = None
+        self.done = asyncio.Event()
+
+
+class BackgroundStartup:
+    """Componentes inicializados em segundo plano, com tempos de boot."""
+
+    def __init__(self):
+        # Referência dos tempos: import do módulo (início do boot do servidor)
+        self.created_at = time.monotonic()
+        self.components: Dict[str, StartupComponent] = {}
+        self.ready_at: Optional[float] = None
+        self.first_request_at: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, init: Callable[[], Any], timeout: float,
+            on_result: Optional[Callable[[Any], None]] = None):
+        """Registra um componente; ``init`` é síncrono e roda numa thread.
+
+        ``on_result`` recebe o retorno de ``init`` (``None`` em caso de falha ou timeout).
+        """
+        self.components[name] = StartupComponent(name, init, timeout, on_result)
+
+    def start(self):
+        if self._task is not None:
+            return
+        # Componentes já prontos ficam como estão; os demais são refeitos
+        for component in self.components.values():
+            if component.status != READY:
+                component.status = PENDING
+                component.error = None
+                component.duration = None
+                component.done = asyncio.Event()
+        self.ready_at = None
+        self._task = asyncio.ensure_future(self._run())
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None and not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        for component in self.components.values():
+            if component.status == PENDING:
+                component.status = FAILED
+                component.error = "inicialização interrompida"
+            component.done.set()
+
+    async def wait(self, name: str):
+        """Aguarda o componente (retorna logo se a inicialização não foi iniciada).
+
+        Espera no máximo a soma dos timeouts até ele: uma inicialização travada
+        não prende as requisições para sempre.
+        """
+        component = self.components.get(name)
+        if component is None or self._task is None:
+            return
+        limit = 0.0
+        for other in self.components.values():
+            limit += other.timeout
+            if other is component:
+                break
+        try:
+            await asyncio.wait_for(component.done.wait(), limit)
+        except asyncio.TimeoutError:
+            logger.warning(f"[startup] {name}: espera excedeu {limit:.0f}s; seguindo sem o componente")
+
+    def mark_request(self):
+        if self.first_request_at is None:
+            self.first_request_at = time.monotonic() - self.created_at
+            metrics.STARTUP_DURATION.labels("first_request").set(self.first_request_at)
+
+    @property
+    def ready(self) -> bool:
+        return self.ready_at is not None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "status": "ready" if self.ready else "starting",
+            "degraded": any(c.status != READY for c in self.components.values()) if self.ready else None,
+            "components": {
+                c.name: {
+                    "status": c.status,
+                    "durationMs": round(c.duration * 1000, 1) if c.duration is not None else None,
+                    **({"error": c.error} if c.error else {}),
+                }
+                for c in self.components.values()
+            },
+            "timeToReadyMs": round(self.ready_at * 1000, 1) if self.ready_at is not None else None,
+            "timeToFirstRequestMs": round(self.first_request_at * 1000, 1) if self.first_request_at is not None else None,
+        }
+
+    async def _run(self):
+        pending: List[StartupComponent] = [c for c in self.components.values() if c.status != READY]
+        try:
+            for component in pending:
+                await self._init_component(component)
+        finally:
+            for component in pending:
+                component.done.set()
+        self.ready_at = time.monotonic() - self.created_at
+        metrics.STARTUP_DURATION.labels("ready").set(self.ready_at)
+        logger.info(f"[startup] pronto em {self.ready_at:.2f}s "
+                    f"({', '.join(f'{c.name}={c.status}' for c in pending)})")
+
+    async def _init_component(self, component: StartupComponent):
+        started = time.monotonic()
+        result = None
+        try:
+            result = await asyncio.wait_for(asyncio.to_thread(component.init), component.timeout)
+            component.status = READY if result is not None else FAILED
+        except asyncio.TimeoutError:
+            component.status = TIMEOUT
+            component.error = f"sem resposta em {component.timeout:.0f}s"
+            logger.warning(f"[startup] {component.name}: inicialização excedeu {component.timeout:.0f}s")
+        except Exception as e:
+            component.status = FAILED
+            component.error = str(e)
+            logger.exception(f"[startup] {component.name}: falha na inicialização: {e}")
+        component.duration = time.monotonic() - started
+        metrics.STARTUP_DURATION.labels(component.name).set(component.duration)
+        if component.on_result is not None:
+            component.on_result(result)
+        component.done.set()
@@ -0,0 +1,8 @@
+"""Configuração comum dos testes: módulos do projeto e dos benchmarks no path."""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Firestore falso em memória (benchmarks/fake_firestore.py)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
@@ -0,0 +1,104 @@
+"""Controle de admissão: vagas, fila justa por usuário e Retry-After."""
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def run(scenario):
+    # Os tickets precisam de um event loop em execução
+    return asyncio.run(scenario())
+
+
+def test_admits_immediately_until_the_limit():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=2, max_queue=4, max_queue_per_user=4)
+        first, second, third = (controller.acquire("alice") for _ in range(3))
+        assert first.granted and second.granted and not third.granted
+        assert (controller.in_flight, controller.queued) == (2, 1)
+        first.release()
+        assert third.granted
+        assert (controller.in_flight, controller.queued) == (2, 0)
+        first.release()  # liberar duas vezes não devolve outra vaga
+        assert controller.in_flight == 2
+
+    run(scenario)
+
+
+def test_queue_is_round_robin_between_users_and_fifo_within_a_user():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_per_user=5)
+        running = controller.acquire("admin")
+        tickets = [(user, controller.acquire(user)) for user in ("alice", "alice", "alice", "bob", "carol")]
+        labels = {id(ticket): f"{user}{i}" for i, (user, ticket) in enumerate(tickets)}
+        assert [ticket.position() for _, ticket in tickets] == [1, 4, 5, 2, 3]
+
+        order = []
+        current = running
+        for _ in tickets:
+            current.release()
+            current = next(ticket for _, ticket in tickets if ticket.granted and not ticket.released)
+            order.append(labels[id(current)])
+        assert order == ["alice0", "bob3", "carol4", "alice1", "alice2"]
+        assert current.position() == 0
+
+    run(scenario)
+
+
+def test_full_queue_is_rejected_with_retry_after():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=2, max_queue=3, max_queue_per_user=3)
+        controller.acquire("a"), controller.acquire("b")
+        for user in ("c", "d", "e"):
+            controller.acquire(user)
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.acquire("f")
+        # Três na fila, duas vagas, execuções estimadas em 10s: (3 + 1) / 2 rodadas
+        assert rejected.value.reason == "Servidor sobrecarregado"
+        assert rejected.value.retry_after == 20
+        assert controller.stats()["rejected"] == 1
+
+    run(scenario)
+
+
+def test_per_user_queue_limit_does_not_block_other_users():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_per_user=2)
+        controller.acquire("alice")
+        controller.acquire("alice"), controller.acquire("alice")
+        with pytest.raises(AdmissionRejected) as rejected:
+            controller.acquire("alice")
+        assert rejected.value.reason == "Muitas requisições em espera para este usuário"
+        assert rejected.value.retry_after >= 1
+        assert not controller.acquire("bob").granted
+
+    run(scenario)
+
+
+def test_abandoned_ticket_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_per_user=5)
+        running = controller.acquire("alice")
+        abandoned = controller.acquire("bob")
+        waiting = controller.acquire("carol")
+        assert not await abandoned.wait(timeout=0.01)
+        abandoned.release()
+        assert waiting.position() == 1
+        running.release()
+        assert waiting.granted and not abandoned.granted
+        stats = controller.stats()
+        assert (stats["abandoned"], stats["queued"], stats["inFlight"]) == (1, 0, 1)
+
+    run(scenario)
+
+
+def test_wait_returns_when_the_ticket_is_granted():
+    async def scenario():
+        controller = AdmissionController(max_concurrent=1, max_queue=10, max_queue_per_user=5)
+        running = controller.acquire("alice")
+        queued = controller.acquire("bob")
+        asyncio.get_running_loop().call_later(0.01, running.release)
+        assert await queued.wait(timeout=1)
+
+    run(scenario)
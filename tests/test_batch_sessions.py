@@ -0,0 +1,125 @@
+"""Sessões do /run_batch: prompt gravado antes da execução e sessões automáticas fora da listagem."""
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+import server
+from fake_firestore import FakeFirestore
+from inflight import InflightRegistry
+from local_store import MemoryLocalStore, SQLiteLocalStore
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def memory_server(monkeypatch):
+    monkeypatch.setattr(server, "db", None)
+    monkeypatch.setattr(server, "local_store", MemoryLocalStore())
+    monkeypatch.setattr(server, "inflight", InflightRegistry())
+    monkeypatch.setattr(server, "response_cache", ResponseCache(enabled=False))
+
+
+def _request(session_id, text="O que é WAL?", streaming=False):
+    return server.RunSSERequest(appName="app", userId="u1", sessionId=session_id, streaming=streaming,
+                                newMessage={"role": "user", "parts": [{"text": text}]})
+
+
+def test_user_message_survives_turn_timeout(memory_server, monkeypatch):
+    async def slow_process(*args, **kwargs):
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(server, "process_message_with_usage", slow_process)
+
+    async def scenario():
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(server.execute_turn(_request("s-timeout")), 0.1)
+        return await server.fetch_messages_page("s-timeout", 10)
+
+    messages, _ = asyncio.run(scenario())
+    assert [(m["role"], m["content"]) for m in messages] == [("user", "O que é WAL?")]
+
+
+def test_streamed_prompt_is_saved_before_the_run(memory_server, monkeypatch):
+    async def slow_events(*args, **kwargs):
+        await asyncio.sleep(10)
+        yield "nunca"
+
+    monkeypatch.setattr(server, "stream_agent_events", slow_events)
+
+    async def scenario():
+        turn, _, _ = await server.open_turn_stream(_request("s-stream", streaming=True))
+        await asyncio.sleep(0.05)
+        during, _ = await server.fetch_messages_page("s-stream", 10)
+        turn.task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await turn.task
+        after, _ = await server.fetch_messages_page("s-stream", 10)
+        return during, after
+
+    during, after = asyncio.run(scenario())
+    assert [(m["role"], m["content"]) for m in during] == [("user", "O que é WAL?")]
+    # O fim do turno só acrescenta a resposta (aqui nenhuma): o prompt não é gravado de novo
+    assert [(m["role"], m["content"]) for m in after] == [("user", "O que é WAL?")]
+
+
+def test_batch_sessions_are_not_listed(memory_server, monkeypatch):
+    async def fake_process(message, **kwargs):
+        return f"resposta: {message}", []
+
+    monkeypatch.setattr(server, "process_message_with_usage", fake_process)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            batch = await client.post("/run_batch", json={
+                "appName": "app", "userId": "u1",
+                "items": [{"prompt": "a"}, {"prompt": "b", "sessionId": "s-explicita"}],
+            })
+            listed = await client.get("/sessions", params={"userId": "u1"})
+            return batch, listed
+
+    batch, listed = asyncio.run(scenario())
+    items = [json.loads(line) for line in batch.text.splitlines() if json.loads(line)["type"] == "item"]
+    auto_session = next(item["sessionId"] for item in items if item["sessionId"] != "s-explicita")
+    assert [session["sessionId"] for session in listed.json()["sessions"]] == ["s-explicita"]
+    # A sessão automática continua acessível pelo id
+    assert server.local_store.get_session(auto_session)["source"] == "batch"
+
+
+def test_sqlite_listing_skips_batch_sessions(tmp_path):
+    store = SQLiteLocalStore(str(tmp_path / "local.db"))
+    try:
+        for i, source in enumerate([None, "batch", None]):
+            session = {"sessionId": f"s{i}", "userId": "u1", "lastActivity": str(i), "deleted": False}
+            if source:
+                session["source"] = source
+            store.put_session(f"s{i}", session)
+        first, cursor = store.list_sessions("u1", None, 1)
+        second, _ = store.list_sessions("u1", None, 1, cursor)
+        assert [s["sessionId"] for s in first + second] == ["s2", "s0"]
+    finally:
+        store.close()
+
+
+def test_firestore_listing_fills_pages_past_batch_sessions(monkeypatch):
+    client = FakeFirestore()
+    monkeypatch.setattr(server, "db", client)
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    # Mais recentes primeiro: s5 (lote), s4, s3 (lote), s2 (lote), s1, s0
+    for i in range(6):
+        data = {"userId": "u1", "appName": "app", "deleted": False, "updatedAt": base + timedelta(seconds=i)}
+        if i in (2, 3, 5):
+            data["source"] = "batch"
+        client.document("sessions", f"s{i}").set(data)
+
+    async def scenario():
+        first, cursor = await server.list_user_sessions("u1", limit=2)
+        second, last = await server.list_user_sessions("u1", limit=2, cursor=cursor)
+        return first, second, last
+
+    first, second, last = asyncio.run(scenario())
+    assert [s["sessionId"] for s in first] == ["s4", "s1"]
+    assert [s["sessionId"] for s in second] == ["s0"]
+    assert last is None
@@ -0,0 +1,73 @@
+"""Chamadas lentas do Firestore não podem travar o event loop (``run_firestore``)."""
+import asyncio
+import time
+
+import httpx
+import pytest
+
+import server
+from fake_firestore import FakeFirestore
+from firebase_config import run_firestore
+
+FIRESTORE_LATENCY = 0.5
+
+
+@pytest.fixture
+def slow_db(monkeypatch):
+    client = FakeFirestore(latency=FIRESTORE_LATENCY)
+    monkeypatch.setattr(server, "db", client)
+    server.session_cache.clear()
+    yield client
+    server.session_cache.clear()
+
+
+async def _timed(coro):
+    started = time.perf_counter()
+    response = await coro
+    return response, time.perf_counter() - started
+
+
+def test_run_firestore_keeps_event_loop_responsive():
+    async def scenario():
+        lags = []
+
+        async def ticker():
+            while True:
+                before = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - before - 0.01)
+
+        task = asyncio.ensure_future(ticker())
+        started = time.perf_counter()
+        await asyncio.gather(*(run_firestore(time.sleep, FIRESTORE_LATENCY) for _ in range(4)))
+        elapsed = time.perf_counter() - started
+        task.cancel()
+        return elapsed, lags
+
+    elapsed, lags = asyncio.run(scenario())
+    # As quatro chamadas rodam em paralelo no pool, e o loop segue atendendo
+    assert elapsed < 2 * FIRESTORE_LATENCY
+    assert lags and max(lags) < 0.1
+
+
+def test_slow_firestore_does_not_stall_concurrent_requests(slow_db):
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = [asyncio.ensure_future(_timed(client.get(f"/sessions/s-{i}"))) for i in range(4)]
+            # Deixa as leituras de sessão chegarem ao pool antes de medir /health
+            await asyncio.sleep(0.05)
+            health, health_latency = await _timed(client.get("/health"))
+            stream, stream_latency = await _timed(client.get("/sessions/s-x/messages"))
+            return health, health_latency, stream, stream_latency, await asyncio.gather(*slow)
+
+    health, health_latency, stream, stream_latency, slow = asyncio.run(scenario())
+    assert health.status_code == 200
+    assert health_latency < 0.2
+    # Uma leitura própria (get_session) e nenhuma espera pelas outras quatro
+    assert stream.status_code == 404
+    assert stream_latency < 2 * FIRESTORE_LATENCY
+    for response, latency in slow:
+        assert response.status_code == 404
+        assert latency >= FIRESTORE_LATENCY
+        assert latency < 2 * FIRESTORE_LATENCY
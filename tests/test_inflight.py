@@ -0,0 +1,242 @@
+"""Turnos compartilhados entre requisições duplicadas (``inflight.py``)."""
+import asyncio
+import json
+
+import httpx
+
+import server
+from inflight import InflightRegistry, InflightTurn, turn_key
+from sse import sse_frame
+
+
+def run(scenario):
+    return asyncio.run(scenario())
+
+
+def _payloads(frames):
+    return [json.loads(frame.split(b"data: ", 1)[1]) for frame in frames]
+
+
+async def _collect(turn, after=0):
+    return [frame async for frame in turn.follow(after)]
+
+
+def test_turn_key_depends_on_idempotency_key_or_message():
+    same_message, retention = turn_key("u1", "s1", "oi")
+    assert same_message == turn_key("u1", "s1", "oi")[0]
+    assert same_message != turn_key("u1", "s2", "oi")[0]
+    assert same_message != turn_key("u2", "s1", "oi")[0]
+    keyed, keyed_retention = turn_key("u1", "s1", "oi", "k-1")
+    # Com chave explícita a mensagem não entra na chave e a retenção é maior
+    assert keyed == turn_key("u1", "s1", "outra mensagem", "k-1")[0]
+    assert keyed != same_message
+    assert keyed_retention > retention
+
+
+def test_duplicate_attaches_to_the_running_turn():
+    async def scenario():
+        registry = InflightRegistry()
+        turn = registry.start("k", 10, "e-1", ("u1", "s1"))
+        assert registry.attach("outra") is None
+        duplicate = registry.attach("k")
+        assert duplicate is turn and turn.subscribers == 2
+
+        followers = [asyncio.ensure_future(_collect(turn)) for _ in range(2)]
+        for i in range(3):
+            turn.publish(sse_frame({"type": "delta", "delta": str(i)}))
+            await asyncio.sleep(0)
+        turn.finish({"text": "012"})
+        first, second = await asyncio.gather(*followers)
+        assert first == second
+        assert [payload["delta"] for payload in _payloads(first)] == ["0", "1", "2"]
+        assert first[0].startswith(b"id: e-1:1\n")
+        assert await turn.wait_result() == {"text": "012"}
+        assert registry.stats()["coalesced"] == 1
+
+    run(scenario)
+
+
+def test_finished_turn_is_replayed_until_retention_expires():
+    async def scenario():
+        registry = InflightRegistry()
+        turn = registry.start("k", 0.05, "e-1")
+        turn.publish(sse_frame({"type": "done"}))
+        turn.finish({"text": "pronto"})
+        turn.unsubscribe()
+
+        replay = registry.attach("k")
+        assert replay is turn
+        assert len(await _collect(replay)) == 1
+        replay.unsubscribe()
+        assert registry.stats()["replayed"] == 1
+
+        await asyncio.sleep(0.06)
+        assert registry.attach("k") is None
+
+    run(scenario)
+
+
+def test_discarded_turn_is_not_reused():
+    async def scenario():
+        registry = InflightRegistry()
+        turn = registry.start("k", 10, "e-1")
+        turn.finish({"error": "falhou"})
+        registry.discard(turn)
+        assert registry.attach("k") is None
+
+    run(scenario)
+
+
+def test_execution_is_cancelled_only_when_the_last_client_leaves():
+    async def scenario():
+        registry = InflightRegistry()
+        turn = registry.start("k", 10, "e-1")
+        turn.task = asyncio.ensure_future(asyncio.sleep(10))
+        registry.attach("k")
+
+        turn.unsubscribe()
+        await asyncio.sleep(0)
+        assert not turn.task.done()
+        turn.unsubscribe()
+        await asyncio.sleep(0)
+        assert turn.task.cancelled()
+
+    run(scenario)
+
+
+def test_finished_turn_ignores_later_results():
+    turn = InflightTurn("k", 10)
+    turn.finish({"text": "primeiro"})
+    turn.finish({"text": "segundo"})
+    assert turn.result == {"text": "primeiro"}
+
+
+def _publish(turn, count):
+    for i in range(count):
+        turn.publish(sse_frame({"type": "delta", "delta": str(i)}))
+
+
+def test_resume_replays_frames_after_last_event_id():
+    async def scenario():
+        registry = InflightRegistry()
+        turn = registry.start("k", 10, "e-1", ("u1", "s1"))
+        _publish(turn, 4)
+        resumed, after = registry.resume("e-1:2", ("u1", "s1"))
+        assert resumed is turn and after == 2 and turn.subscribers == 2
+
+        follower = asyncio.ensure_future(_collect(turn, after))
+        await asyncio.sleep(0)
+        # Frames publicados depois da reconexão chegam ao vivo
+        turn.publish(sse_frame({"type": "delta", "delta": "4"}))
+        turn.finish({"text": "01234"})
+        frames = await follower
+        assert [payload["delta"] for payload in _payloads(frames)] == ["2", "3", "4"]
+        assert frames[0].startswith(b"id: e-1:3\n")
+        assert registry.stats()["resumed"] == 1
+
+    run(scenario)
+
+
+def test_resume_rejects_unknown_invalid_or_foreign_ids():
+    registry = InflightRegistry()
+    turn = registry.start("k", 10, "e-1", ("u1", "s1"))
+    _publish(turn, 1)
+    assert registry.resume("e-2:1", ("u1", "s1")) is None
+    assert registry.resume("sem-seq", ("u1", "s1")) is None
+    assert registry.resume("e-1:1", ("u2", "s1")) is None
+    assert registry.resume("e-1:1", ("u1", "s2")) is None
+    assert turn.subscribers == 1
+
+
+def test_resume_reports_gap_when_ring_buffer_was_pruned():
+    async def scenario():
+        turn = InflightTurn("k", 10, "e-1", max_frames=4)
+        _publish(turn, 10)
+        turn.finish({"text": "pronto"})
+        assert turn.first_seq > 2
+        frames = await _collect(turn, after=1)
+        gap, *rest = _payloads(frames)
+        assert gap == {"type": "gap", "invocationId": "e-1", "missedEvents": turn.first_seq - 2}
+        # Continua do frame mais antigo retido até o último
+        assert [payload["delta"] for payload in rest] == [str(seq - 1) for seq in range(turn.first_seq, 11)]
+
+    run(scenario)
+
+
+def test_finished_stream_is_resumable_until_replay_ttl():
+    async def scenario():
+        registry = InflightRegistry(replay_ttl=0.05)
+        turn = registry.start("k", 0, "e-1", ("u1", "s1"))
+        _publish(turn, 2)
+        turn.finish({"text": "01"})
+        turn.unsubscribe()
+        # Fora da janela de deduplicação, mas ainda retomável
+        assert registry.attach("k") is None
+        resumed, after = registry.resume("e-1:1", ("u1", "s1"))
+        assert [payload["delta"] for payload in _payloads(await _collect(resumed, after))] == ["1"]
+        resumed.unsubscribe()
+
+        await asyncio.sleep(0.06)
+        assert registry.resume("e-1:1", ("u1", "s1")) is None
+
+    run(scenario)
+
+
+def test_abandoned_stream_is_cancelled_after_resume_grace():
+    async def scenario():
+        turn = InflightTurn("k", 10, "e-1", resume_grace=0.05)
+        turn.task = asyncio.ensure_future(asyncio.sleep(10))
+        turn.subscribe()
+        turn.unsubscribe(grace=True)
+        await asyncio.sleep(0.02)
+        assert not turn.task.done()
+        await asyncio.sleep(0.05)
+        assert turn.task.cancelled()
+
+    run(scenario)
+
+
+def test_reconnect_within_grace_keeps_the_execution_running():
+    async def scenario():
+        registry = InflightRegistry()
+        turn = registry.start("k", 10, "e-1", ("u1", "s1"))
+        turn.resume_grace = 0.05
+        turn.task = asyncio.ensure_future(asyncio.sleep(10))
+        _publish(turn, 1)
+        turn.unsubscribe(grace=True)
+        await asyncio.sleep(0.02)
+        registry.resume("e-1:1", ("u1", "s1"))
+        await asyncio.sleep(0.06)
+        assert not turn.task.done()
+        turn.task.cancel()
+
+    run(scenario)
+
+
+def _stream_request(**overrides):
+    return {"appName": "app", "userId": "u1", "sessionId": "s-resume", "streaming": True,
+            "newMessage": {"role": "user", "parts": [{"text": "oi"}]}, **overrides}
+
+
+def test_unknown_last_event_id_never_starts_a_new_turn(monkeypatch):
+    async def no_turn(*args, **kwargs):
+        raise AssertionError("turno executado numa retomada")
+
+    monkeypatch.setattr(server, "process_message_with_usage", no_turn)
+    monkeypatch.setattr(server, "inflight", InflightRegistry())
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # Turno executado por outro worker: o id não existe neste processo
+            unknown = await client.post("/run_sse", json=_stream_request(), headers={"Last-Event-ID": "e-outro:3"})
+            invalid = await client.post("/run_sse", json=_stream_request(), headers={"Last-Event-ID": "abc"})
+            blocking = await client.post("/run_sse", json=_stream_request(streaming=False),
+                                         headers={"Last-Event-ID": "e-outro:3"})
+            return unknown, invalid, blocking
+
+    unknown, invalid, blocking = run(scenario)
+    assert unknown.status_code == 404
+    assert "outro worker" in unknown.json()["detail"]
+    assert invalid.status_code == 400
+    assert blocking.status_code == 400
@@ -0,0 +1,132 @@
+"""Armazenamento local: paginação por cursor, contadores e SQLite fora do event loop."""
+import asyncio
+import threading
+import time
+
+import httpx
+import pytest
+from starlette.testclient import TestClient
+
+import server
+from local_store import MemoryLocalStore, SQLiteLocalStore
+from startup import BackgroundStartup
+
+
+@pytest.fixture
+def sqlite_store(tmp_path):
+    store = SQLiteLocalStore(str(tmp_path / "local.db"))
+    yield store
+    store.close()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryLocalStore()
+        return
+    store = SQLiteLocalStore(str(tmp_path / "local.db"))
+    yield store
+    store.close()
+
+
+def _pages(store, session_id, limit):
+    pages, cursor = [], None
+    while True:
+        page, cursor = store.messages_page(session_id, limit, cursor)
+        pages.append([message["i"] for message in page])
+        if cursor is None:
+            return pages
+
+
+def test_messages_page_follows_cursor(store):
+    for i in range(5):
+        store.append_message("s1", {"i": i})
+        store.append_message("s2", {"i": 100 + i})
+    assert _pages(store, "s1", 2) == [[0, 1], [2, 3], [4]]
+    assert _pages(store, "s2", 5) == [[100, 101, 102, 103, 104]]
+    assert store.messages_page("vazia", 2) == ([], None)
+
+
+@pytest.mark.parametrize("cursor", ["abc", "-1"])
+def test_messages_page_rejects_invalid_cursor(store, cursor):
+    with pytest.raises(ValueError):
+        store.messages_page("s1", 2, cursor)
+
+
+def test_counts_follow_writes(store):
+    store.put_session("s1", {"userId": "u1", "lastActivity": "1"})
+    # Regravar a sessão não conta de novo
+    store.put_session("s1", {"userId": "u1", "lastActivity": "2"})
+    store.put_session("s2", {"userId": "u1", "lastActivity": "3"})
+    for i in range(3):
+        store.append_message("s1", {"i": i})
+    assert store.counts() == {"sessions": 2, "messages": 3}
+
+
+def test_sqlite_counts_without_count_scan(sqlite_store, tmp_path):
+    sqlite_store.put_session("s1", {"userId": "u1"})
+    sqlite_store.append_message("s1", {"i": 0})
+    statements = []
+    sqlite_store._conn().set_trace_callback(statements.append)
+    assert sqlite_store.counts() == {"sessions": 1, "messages": 1}
+    assert not any("COUNT(" in statement.upper() for statement in statements)
+
+    # Outro processo (outra conexão ao mesmo arquivo) enxerga os mesmos totais
+    other = SQLiteLocalStore(str(tmp_path / "local.db"))
+    try:
+        other.append_message("s1", {"i": 1})
+        assert sqlite_store.counts() == {"sessions": 1, "messages": 2}
+    finally:
+        other.close()
+
+
+def test_sqlite_operations_run_off_the_event_loop(sqlite_store):
+    async def scenario():
+        return await sqlite_store.run(lambda: threading.current_thread())
+
+    assert asyncio.run(scenario()) is not threading.main_thread()
+
+
+def test_slow_sqlite_does_not_stall_concurrent_requests(sqlite_store, monkeypatch):
+    messages_page = sqlite_store.messages_page
+
+    def slow_messages_page(*args, **kwargs):
+        time.sleep(0.5)
+        return messages_page(*args, **kwargs)
+
+    monkeypatch.setattr(sqlite_store, "messages_page", slow_messages_page)
+    monkeypatch.setattr(server, "local_store", sqlite_store)
+    monkeypatch.setattr(server, "db", None)
+    sqlite_store.put_session("s1", {"sessionId": "s1", "userId": "u1", "lastActivity": "1", "deleted": False})
+    sqlite_store.append_message("s1", {"role": "user", "content": "oi"})
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            slow = asyncio.ensure_future(client.get("/sessions/s1/messages"))
+            await asyncio.sleep(0.05)
+            started = time.perf_counter()
+            health = await client.get("/health")
+            health_latency = time.perf_counter() - started
+            return health, health_latency, await slow
+
+    health, health_latency, page = asyncio.run(scenario())
+    assert health.status_code == 200
+    assert health_latency < 0.2
+    assert page.status_code == 200
+    assert [m["content"] for m in page.json()["messages"]] == ["oi"]
+
+
+def test_sqlite_store_survives_consecutive_lifespans(sqlite_store, monkeypatch):
+    monkeypatch.setattr(server, "local_store", sqlite_store)
+    monkeypatch.setattr(server, "db", None)
+    # Sem Firebase nem ADK: só o ciclo de vida do store importa aqui
+    monkeypatch.setattr(server, "background_startup", BackgroundStartup())
+    sqlite_store.put_session("s1", {"sessionId": "s1", "userId": "u1", "appName": "app", "createdAt": "1",
+                                    "lastActivity": "1", "messageCount": 0, "deleted": False})
+
+    for _ in range(2):
+        with TestClient(server.app) as client:
+            response = client.get("/sessions", params={"userId": "u1"})
+            assert response.status_code == 200
+            assert [s["sessionId"] for s in response.json()["sessions"]] == ["s1"]
@@ -0,0 +1,100 @@
+"""Cache de respostas: uma resposta repetida mantém a atribuição por agente."""
+import asyncio
+import time
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+import agent_runtime
+import server
+from models import RunSSERequest
+from response_cache import ResponseCache
+from startup import BackgroundStartup
+
+AGENT_RUNS = [
+    {"agent": "intelligent_coordinator", "startedAt": 1.0, "endedAt": 1.5, "durationMs": 500.0, "usage": None},
+    {"agent": "technical_expert", "startedAt": 1.5, "endedAt": 2.0, "durationMs": 500.0,
+     "usage": {"promptTokenCount": 7, "candidatesTokenCount": 3, "totalTokenCount": 10}},
+]
+
+
+@pytest.fixture
+def cached_server(monkeypatch):
+    calls = []
+
+    async def fake_process(message, runtime=None, session_id=None, user_id=None, agent_mode=None):
+        calls.append(message)
+        return "Resposta do especialista", [dict(run) for run in AGENT_RUNS]
+
+    runtime = SimpleNamespace(fingerprint_for=lambda mode=None: "teste")
+    monkeypatch.setattr(server, "response_cache", ResponseCache(enabled=True))
+    monkeypatch.setattr(server, "current_agent_runtime", lambda: runtime)
+    monkeypatch.setattr(server, "process_message_with_usage", fake_process)
+    monkeypatch.setattr(server, "db", None)
+    return calls
+
+
+def _request(session_id):
+    return RunSSERequest(appName="app", userId="u1", sessionId=session_id, streaming=False,
+                         newMessage={"role": "user", "parts": [{"text": "O que é WAL?"}]})
+
+
+def test_cache_hit_returns_agent_attribution(cached_server):
+    async def scenario():
+        first, first_headers = await server.execute_turn(_request("s1"))
+        second, second_headers = await server.execute_turn(_request("s2"))
+        return first, first_headers, second, second_headers
+
+    first, first_headers, second, second_headers = asyncio.run(scenario())
+    assert cached_server == ["O que é WAL?"]
+    assert (first_headers["X-Cache"], second_headers["X-Cache"]) == ("MISS", "HIT")
+    assert second["text"] == first["text"]
+    assert [run["agent"] for run in second["agents"]] == ["intelligent_coordinator", "technical_expert"]
+    assert second["usage"]["source"] == "cache"
+
+
+def test_cache_key_waits_for_runtime_off_the_event_loop(cached_server, monkeypatch):
+    """Durante o boot o turno aguarda o runtime criado na thread, sem travar o /health"""
+    runtime = SimpleNamespace(fingerprint_for=lambda mode=None: "teste")
+
+    def slow_runtime():
+        time.sleep(0.5)
+        agent_runtime._runtime = runtime
+        return runtime
+
+    def blocking_runtime():
+        time.sleep(0.5)
+        return runtime
+
+    monkeypatch.setattr(agent_runtime, "_runtime", None)
+    monkeypatch.setattr(server, "current_agent_runtime", agent_runtime.current_agent_runtime)
+    monkeypatch.setattr(server, "get_agent_runtime", blocking_runtime)
+    startup = BackgroundStartup()
+    startup.add("agent_runtime", slow_runtime, 5)
+    monkeypatch.setattr(server, "background_startup", startup)
+
+    async def scenario():
+        startup.start()
+        turn = asyncio.ensure_future(server.execute_turn(_request("boot")))
+        await asyncio.sleep(0.05)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            started = time.perf_counter()
+            response = await client.get("/health")
+            health_time = time.perf_counter() - started
+        _, headers = await turn
+        await startup.stop()
+        return response.status_code, health_time, headers
+
+    status, health_time, headers = asyncio.run(scenario())
+    assert status == 200
+    assert health_time < 0.2
+    assert headers["X-Cache"] == "MISS"
+
+
+def test_cache_skipped_without_runtime(cached_server, monkeypatch):
+    monkeypatch.setattr(server, "current_agent_runtime", lambda: None)
+    monkeypatch.setattr(server, "get_agent_runtime", lambda: pytest.fail("runtime criado no event loop"))
+
+    assert server.response_cache_key(_request("s1"), "O que é WAL?") is None
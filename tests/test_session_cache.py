@@ -0,0 +1,70 @@
+"""Cache de sessões: leitura concorrente com invalidação não guarda documento velho."""
+import asyncio
+import time
+
+import pytest
+
+import server
+from fake_firestore import FakeFirestore
+from ttl_cache import TTLCache
+
+FIRESTORE_LATENCY = 0.2
+
+
+def test_set_after_invalidation_is_discarded():
+    cache = TTLCache(max_entries=2)
+    generation = cache.generation()
+    cache.invalidate("s1")
+    cache.set("s1", "velho", generation=generation)
+    assert cache.get("s1") is None
+    cache.set("s1", "novo", generation=cache.generation())
+    assert cache.get("s1") == "novo"
+    # Outras chaves não são afetadas
+    cache.set("s2", "ok", generation=generation)
+    assert cache.get("s2") == "ok"
+    assert cache.stats()["staleSets"] == 1
+
+
+def test_forgotten_invalidations_still_discard_older_reads():
+    cache = TTLCache(max_entries=2)
+    generation = cache.generation()
+    for key in ("s1", "s2", "s3"):
+        cache.invalidate(key)
+    # s1 saiu do registro de invalidações, mas a leitura é anterior a ela
+    cache.set("s1", "velho", generation=generation)
+    assert cache.get("s1") is None
+
+
+class SnapshotThenLatencyFirestore(FakeFirestore):
+    """Lê o documento e só então espera a rede: a resposta chega já desatualizada."""
+
+    def _get(self, path):
+        data = super()._get(path)
+        time.sleep(FIRESTORE_LATENCY)
+        return data
+
+
+@pytest.fixture
+def slow_db(monkeypatch):
+    client = SnapshotThenLatencyFirestore()
+    monkeypatch.setattr(server, "db", client)
+    server.session_cache.clear()
+    yield client
+    server.session_cache.clear()
+
+
+def test_read_interleaved_with_invalidation_is_not_cached(slow_db):
+    slow_db.document("sessions", "s1").set({"sessionId": "s1", "messageCount": 1})
+
+    async def scenario():
+        read = asyncio.ensure_future(server.get_session("s1"))
+        await asyncio.sleep(FIRESTORE_LATENCY / 2)
+        # Turno gravado durante a leitura (ex.: _clear_pending_sessions)
+        slow_db.document("sessions", "s1").update({"messageCount": 2})
+        server.session_cache.invalidate("s1")
+        stale = await read
+        return stale, await server.get_session("s1")
+
+    stale, fresh = asyncio.run(scenario())
+    assert stale["messageCount"] == 1
+    assert fresh["messageCount"] == 2
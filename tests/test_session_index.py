@@ -0,0 +1,123 @@
+"""Paginação de GET /sessions pelo índice por usuário e validação do cursor."""
+import asyncio
+
+import httpx
+import pytest
+
+import server
+from fake_firestore import FakeFirestore
+from local_store import SQLiteLocalStore
+from session_index import UserSessionIndex, encode_cursor
+
+
+def _session(session_id, user_id, last_activity, app_name="app", deleted=False):
+    return {"sessionId": session_id, "userId": user_id, "appName": app_name,
+            "lastActivity": last_activity, "deleted": deleted}
+
+
+@pytest.fixture
+def index():
+    index = UserSessionIndex()
+    for i in range(5):
+        index.upsert(_session(f"a{i}", "alice", f"2026-01-01T00:00:0{i}"))
+    index.upsert(_session("b0", "bob", "2026-01-01T00:00:09"))
+    return index
+
+
+def test_page_walks_sessions_newest_first(index):
+    first, cursor = index.page("alice", limit=2)
+    second, cursor = index.page("alice", limit=2, cursor=cursor)
+    third, cursor = index.page("alice", limit=2, cursor=cursor)
+    assert first + second + third == ["a4", "a3", "a2", "a1", "a0"]
+    assert cursor is None
+
+
+def test_page_rejects_cursor_from_another_listing(index):
+    _, cursor = index.page("alice", limit=2)
+    with pytest.raises(ValueError):
+        index.page("bob", limit=2, cursor=cursor)
+    with pytest.raises(ValueError):
+        index.page("alice", "app", limit=2, cursor=cursor)
+    with pytest.raises(ValueError):
+        index.page("alice", limit=2, cursor="a3")
+    with pytest.raises(ValueError):
+        index.page("alice", limit=2, cursor=encode_cursor("bob", None, "2026-01-01T00:00:09", "b0"))
+
+
+def test_cursor_survives_deleting_the_last_session(index):
+    first, cursor = index.page("alice", limit=2)
+    index.upsert(_session("a3", "alice", "2026-01-01T00:00:03", deleted=True))
+    assert first == ["a4", "a3"]
+    assert index.page("alice", limit=2, cursor=cursor)[0] == ["a2", "a1"]
+
+
+def test_cursor_ignores_sessions_that_moved(index):
+    first, cursor = index.page("alice", limit=2)
+    # a4 recebe uma mensagem e vai para o topo: a próxima página não a repete
+    index.upsert(_session("a4", "alice", "2026-01-01T00:00:09"))
+    assert first == ["a4", "a3"]
+    assert index.page("alice", limit=2, cursor=cursor)[0] == ["a2", "a1"]
+
+
+def test_deleted_sessions_leave_the_index(index):
+    index.upsert(_session("a4", "alice", "2026-01-01T00:00:04", deleted=True))
+    assert index.page("alice", limit=10)[0] == ["a3", "a2", "a1", "a0"]
+
+
+def _list(params):
+    async def scenario():
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.get("/sessions", params=params)
+    return asyncio.run(scenario())
+
+
+def _firestore_sessions(monkeypatch):
+    client = FakeFirestore()
+    monkeypatch.setattr(server, "db", client)
+    for session_id, user_id, updated in (("a0", "alice", 1), ("a1", "alice", 2), ("a2", "alice", 3), ("b0", "bob", 4)):
+        client.document("sessions", session_id).set({
+            "sessionId": session_id, "userId": user_id, "appName": "app", "deleted": False,
+            "createdAt": "2026-01-01", "lastActivity": "2026-01-01", "updatedAt": updated, "messageCount": 0,
+        })
+    return client
+
+
+def _ids(response):
+    return [session["sessionId"] for session in response.json()["sessions"]]
+
+
+def test_foreign_cursor_returns_400_on_firestore(monkeypatch):
+    _firestore_sessions(monkeypatch)
+    response = _list({"userId": "alice", "limit": 1})
+    assert response.status_code == 200
+    cursor = response.json()["nextCursor"]
+    assert _ids(_list({"userId": "alice", "limit": 1, "cursor": cursor})) == ["a1"]
+    assert _list({"userId": "bob", "limit": 1, "cursor": cursor}).status_code == 400
+    assert _list({"userId": "alice", "limit": 1, "cursor": "b0"}).status_code == 400
+
+
+def test_firestore_cursor_survives_deleted_and_moved_sessions(monkeypatch):
+    client = _firestore_sessions(monkeypatch)
+    first = _list({"userId": "alice", "limit": 2})
+    assert _ids(first) == ["a2", "a1"]
+    cursor = first.json()["nextCursor"]
+    client.document("sessions", "a1").update({"deleted": True})
+    client.document("sessions", "a2").update({"updatedAt": 9})
+    assert _ids(_list({"userId": "alice", "limit": 2, "cursor": cursor})) == ["a0"]
+
+
+def test_sqlite_cursor_survives_deleted_and_moved_sessions(tmp_path):
+    store = SQLiteLocalStore(str(tmp_path / "local.db"))
+    try:
+        for i in range(5):
+            store.put_session(f"a{i}", _session(f"a{i}", "alice", f"2026-01-01T00:00:0{i}"))
+        first, cursor = store.list_sessions("alice", None, 2)
+        store.delete_session("a3", "2026-01-02")
+        store.update_session("a4", {"lastActivity": "2026-01-01T00:00:09"})
+        second, _ = store.list_sessions("alice", None, 2, cursor)
+        assert [s["sessionId"] for s in first + second] == ["a4", "a3", "a2", "a1"]
+        with pytest.raises(ValueError):
+            store.list_sessions("bob", None, 2, cursor)
+    finally:
+        store.close()
@@ -0,0 +1,67 @@
+"""Leitura do histórico de mensagens de uma sessão no Firestore."""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import metrics
+import server
+from fake_firestore import FakeFirestore
+
+
+@pytest.fixture
+def firestore_db(monkeypatch):
+    client = FakeFirestore()
+    monkeypatch.setattr(server, "db", client)
+    return client
+
+
+def _add_messages(client, session_id, count):
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    for i in range(count):
+        # Documentos antigos não têm o campo messageId: o id vem do documento
+        client.document("sessions", session_id, "messages", f"m{i:02d}").set({
+            "role": "user" if i % 2 == 0 else "assistant",
+            "content": f"mensagem {i}",
+            "createdAt": base + timedelta(seconds=i),
+        })
+
+
+async def _collect(session_id, page_size):
+    return [message async for message in server.iter_session_messages(session_id, page_size)]
+
+
+def test_iter_session_messages_includes_document_ids(firestore_db):
+    _add_messages(firestore_db, "s1", 5)
+    messages = asyncio.run(_collect("s1", page_size=2))
+    assert [m["messageId"] for m in messages] == [f"m{i:02d}" for i in range(5)]
+    assert [m["content"] for m in messages] == [f"mensagem {i}" for i in range(5)]
+
+
+def test_iter_session_messages_matches_paged_endpoint_ids(firestore_db):
+    _add_messages(firestore_db, "s1", 3)
+    iterated = asyncio.run(_collect("s1", page_size=10))
+    paged, next_cursor = asyncio.run(server.fetch_messages_page("s1", 10))
+    assert next_cursor is None
+    assert [m["messageId"] for m in iterated] == [m["messageId"] for m in paged]
+
+
+def _observations(operation):
+    child = metrics.FIRESTORE_OPERATION_DURATION._children.get((operation, "firestore"))
+    return sum(child.counts) if child is not None else 0
+
+
+def test_page_read_is_measured_once(firestore_db):
+    _add_messages(firestore_db, "s1", 4)
+    before = {op: _observations(op) for op in ("query_messages_page", "fetch_messages_page")}
+    first, cursor = asyncio.run(server.fetch_messages_page("s1", 2))
+    second, _ = asyncio.run(server.fetch_messages_page("s1", 2, cursor))
+    assert [m["messageId"] for m in first + second] == ["m00", "m01", "m02", "m03"]
+    assert _observations("query_messages_page") - before["query_messages_page"] == 2
+    assert _observations("fetch_messages_page") == before["fetch_messages_page"]
+
+
+def test_unknown_page_cursor_is_rejected(firestore_db):
+    _add_messages(firestore_db, "s1", 2)
+    with pytest.raises(ValueError):
+        asyncio.run(server.fetch_messages_page("s1", 2, "nao-existe"))
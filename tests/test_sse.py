@@ -0,0 +1,132 @@
+"""Agrupamento de deltas e serialização dos frames SSE (``sse.py``)."""
+import asyncio
+import json
+import time
+
+import pytest
+
+import sse
+from sse import AgentDelta, coalesce_deltas, encode_json, sse_frame
+
+
+async def _source(*steps):
+    """Gera os itens de ``steps``; números são pausas (segundos) entre eles"""
+    for step in steps:
+        if isinstance(step, (int, float)):
+            await asyncio.sleep(step)
+        else:
+            yield step
+
+
+def _coalesce(*steps, flush_interval=1.0, max_bytes=2048):
+    async def scenario():
+        started = time.perf_counter()
+        items = [item async for item in coalesce_deltas(_source(*steps), flush_interval, max_bytes)]
+        return items, time.perf_counter() - started
+    return asyncio.run(scenario())
+
+
+def test_first_delta_is_immediate_and_the_rest_share_a_window():
+    items, elapsed = _coalesce("a", 0.01, "b", "c", "d")
+    assert items == ["a", "bcd"]
+    # O fim da fonte esvazia o buffer sem esperar a janela inteira
+    assert elapsed < 0.5
+
+
+def test_window_expiry_flushes_pending_text():
+    items, _ = _coalesce("a", 0.01, "b", 0.2, "c", flush_interval=0.05)
+    assert items == ["a", "b", "c"]
+
+
+def test_max_bytes_flushes_before_the_window():
+    async def scenario():
+        seen = []
+
+        async def source():
+            yield "a"
+            await asyncio.sleep(0.01)
+            yield "éé"  # 4 bytes em UTF-8
+            await asyncio.sleep(0.3)
+            yield "z"
+
+        started = time.perf_counter()
+        async for item in coalesce_deltas(source(), flush_interval=10, max_bytes=4):
+            seen.append((item, time.perf_counter() - started))
+        return seen
+
+    seen = asyncio.run(scenario())
+    assert [item for item, _ in seen] == ["a", "éé", "z"]
+    assert seen[1][1] < 0.2
+
+
+def test_non_text_items_keep_their_position():
+    status = {"type": "status", "state": "start"}
+    items, _ = _coalesce("a", 0.01, "b", "c", status, "d")
+    assert items == ["a", "bc", status, "d"]
+
+
+def test_empty_deltas_are_dropped():
+    items, _ = _coalesce("", "a", 0.01, "", "b")
+    assert items == ["a", "b"]
+
+
+def test_parallel_deltas_are_grouped_per_author():
+    items, _ = _coalesce(
+        "início", 0.01,
+        AgentDelta("research", "p.research", "1"),
+        AgentDelta("tech", "p.tech", "2"),
+        AgentDelta("research", "p.research", "3"),
+    )
+    assert items == ["início", AgentDelta("research", "p.research", "13"), AgentDelta("tech", "p.tech", "2")]
+
+
+def test_source_error_is_raised_after_pending_text():
+    async def failing():
+        yield "a"
+        await asyncio.sleep(0.01)
+        yield "b"
+        raise RuntimeError("falha no agente")
+
+    async def scenario():
+        seen = []
+        with pytest.raises(RuntimeError, match="falha no agente"):
+            async for item in coalesce_deltas(failing(), flush_interval=1.0):
+                seen.append(item)
+        return seen
+
+    assert asyncio.run(scenario()) == ["a", "b"]
+
+
+def test_closing_the_consumer_stops_the_source():
+    async def scenario():
+        closed = asyncio.Event()
+
+        async def endless():
+            try:
+                while True:
+                    yield "x"
+                    await asyncio.sleep(0.001)
+            finally:
+                closed.set()
+
+        stream = coalesce_deltas(endless(), flush_interval=0.01)
+        assert await stream.__anext__() == "x"
+        await stream.aclose()
+        await asyncio.wait_for(closed.wait(), 1)
+
+    asyncio.run(scenario())
+
+
+def test_sse_frame_layout_and_encoding():
+    payload = {"type": "delta", "delta": "ação"}
+    assert sse_frame(payload) == b"data: " + encode_json(payload) + b"\n\n"
+    assert sse_frame(payload, event_id="e-1:3").startswith(b"id: e-1:3\ndata: ")
+    assert json.loads(encode_json(payload)) == payload
+    assert "ação".encode("utf-8") in encode_json(payload)
+
+
+def test_stdlib_fallback_matches_orjson(monkeypatch):
+    payload = {"delta": "ação", "n": 1, "items": [None, True]}
+    expected = encode_json(payload)
+    monkeypatch.setattr(sse, "orjson", None)
+    assert encode_json(payload) == expected
@@ -0,0 +1,70 @@
+"""Inicialização em segundo plano: reinício entre lifespans e espera limitada."""
+import asyncio
+import time
+
+from startup import FAILED, PENDING, READY, BackgroundStartup
+
+
+def test_restart_after_stop_mid_init():
+    calls = []
+
+    def init():
+        calls.append(time.monotonic())
+        # Só a primeira inicialização é lenta (interrompida pelo stop)
+        time.sleep(0.3 if len(calls) == 1 else 0)
+        return "cliente"
+
+    startup = BackgroundStartup()
+    startup.add("firestore", init, 5)
+
+    async def first_lifespan():
+        startup.start()
+        await asyncio.sleep(0.05)
+        await startup.stop()
+        # Quem esperava o componente é liberado
+        await asyncio.wait_for(startup.wait("firestore"), 0.1)
+
+    async def second_lifespan():
+        startup.start()
+        assert startup.components["firestore"].status == PENDING
+        await asyncio.wait_for(startup.wait("firestore"), 1)
+        await startup.stop()
+
+    asyncio.run(first_lifespan())
+    assert startup.components["firestore"].status == FAILED
+    asyncio.run(second_lifespan())
+    assert startup.components["firestore"].status == READY
+    assert len(calls) == 2
+    assert startup.ready
+
+
+def test_ready_components_are_not_initialized_again():
+    calls = []
+    startup = BackgroundStartup()
+    startup.add("firestore", lambda: calls.append(1) or "cliente", 5)
+
+    async def lifespan():
+        startup.start()
+        await startup.wait("firestore")
+        await startup.stop()
+
+    asyncio.run(lifespan())
+    asyncio.run(lifespan())
+    assert calls == [1]
+
+
+def test_wait_is_bounded_by_component_timeouts():
+    startup = BackgroundStartup()
+    startup.add("firestore", lambda: "cliente", 0.05)
+    startup.add("agent_runtime", lambda: "runtime", 0.05)
+
+    async def scenario():
+        # Inicialização travada: a task nunca chega aos componentes
+        startup._task = asyncio.ensure_future(asyncio.sleep(10))
+        started = time.perf_counter()
+        await startup.wait("agent_runtime")
+        elapsed = time.perf_counter() - started
+        startup._task.cancel()
+        return elapsed
+
+    assert asyncio.run(scenario()) < 0.5
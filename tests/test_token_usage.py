@@ -0,0 +1,120 @@
+"""Uso real de tokens: do ``usage_metadata`` da API até o resumo por agente do turno."""
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from google.adk.agents import LlmAgent, ParallelAgent
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.genai import types
+
+import fake_llm
+import server
+from agent_runtime import AgentProgressTracker, AgentRuntime, turn_usage
+from fake_llm import FakeLlm
+from gemini_llm import UsageGemini, usage_client
+
+
+def _response(text, prompt, candidates, finish=True):
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            finish_reason=types.FinishReason.STOP if finish else None,
+        )],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt, candidates_token_count=candidates,
+            total_token_count=prompt + candidates),
+    )
+
+
+class FakeModels:
+    """``client.aio.models`` do google-genai com respostas fixas"""
+
+    async def generate_content(self, model, contents, config=None):
+        return _response("Olá!", 7, 3)
+
+    async def generate_content_stream(self, model, contents, config=None):
+        async def chunks():
+            # Cada pedaço traz o uso acumulado; o último tem o total da chamada
+            yield _response("Ol", 7, 1, finish=False)
+            yield _response("á!", 7, 3)
+        return chunks()
+
+
+def _gemini(agent_name):
+    llm = UsageGemini(model="gemini-2.5-flash", agent_name=agent_name)
+    llm.__dict__["api_client"] = usage_client(SimpleNamespace(aio=SimpleNamespace(models=FakeModels()), vertexai=False), agent_name)
+    return llm
+
+
+@pytest.fixture
+def runtime_for(tmp_path):
+    def build(agent):
+        return AgentRuntime(db_url=f"sqlite:///{tmp_path / 'adk.db'}", app_name="teste", agent=agent)
+    return build
+
+
+async def _run(runtime, run_config=None):
+    tracker = AgentProgressTracker(runtime.agent.name)
+    tracker.start()
+    async for event in runtime.run("Oi", user_id="u1", session_id="s1", run_config=run_config):
+        tracker.observe(event)
+    tracker.finish()
+    return tracker.summary()
+
+
+def test_gemini_usage_reaches_the_agent_run(runtime_for):
+    runtime = runtime_for(LlmAgent(name="solo", model=_gemini("solo"), instruction="Responda."))
+    runs = asyncio.run(_run(runtime))
+    assert turn_usage(runs) == {
+        "promptTokenCount": 7, "candidatesTokenCount": 3, "totalTokenCount": 10,
+        "byAgent": {"solo": {"promptTokenCount": 7, "candidatesTokenCount": 3, "totalTokenCount": 10}},
+    }
+
+
+def test_streaming_counts_the_last_chunk_once(runtime_for):
+    runtime = runtime_for(LlmAgent(name="solo", model=_gemini("solo"), instruction="Responda."))
+    runs = asyncio.run(_run(runtime, RunConfig(streaming_mode=StreamingMode.SSE)))
+    assert turn_usage(runs)["byAgent"] == {"solo": {"promptTokenCount": 7, "candidatesTokenCount": 3, "totalTokenCount": 10}}
+
+
+def test_parallel_branches_report_their_own_usage(runtime_for, monkeypatch):
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_FIRST_TOKEN_LATENCY", 0)
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_TOKENS_PER_SECOND", 0)
+    monkeypatch.setattr(fake_llm, "FAKE_LLM_RESPONSE_TOKENS", 5)
+    branches = [LlmAgent(name=name, model=FakeLlm(model="fake-llm", agent_name=name), instruction="Responda.")
+                for name in ("research", "tech")]
+    runtime = runtime_for(ParallelAgent(name="fanout", sub_agents=branches))
+    usage = turn_usage(asyncio.run(_run(runtime)))
+    assert set(usage["byAgent"]) == {"research", "tech"}
+    for agent_usage in usage["byAgent"].values():
+        # "[agente] " + 5 palavras + "." -> 6 palavras; prompt "Oi" -> 1
+        assert agent_usage == {"promptTokenCount": 1, "candidatesTokenCount": 6, "totalTokenCount": 7}
+    assert usage["totalTokenCount"] == 14
+
+
+def test_usage_outside_a_turn_is_ignored(runtime_for):
+    runtime = runtime_for(LlmAgent(name="solo", model=_gemini("solo"), instruction="Responda."))
+
+    async def scenario():
+        async for _ in runtime.run("Oi", user_id="u1", session_id="s1"):
+            pass
+        # Um turno seguinte não herda o uso de chamadas sem tracker
+        return await _run(runtime)
+
+    assert turn_usage(asyncio.run(scenario()))["totalTokenCount"] == 10
+
+
+def test_json_turn_reports_model_usage_and_records_it(runtime_for, monkeypatch):
+    runtime = runtime_for(LlmAgent(name="solo", model=_gemini("solo"), instruction="Responda."))
+    ledger = server.UsageLedger()
+    monkeypatch.setattr(server, "usage_ledger", ledger)
+    monkeypatch.setattr(server, "get_agent_runtime", lambda: runtime)
+    monkeypatch.setattr(server, "db", None)
+    request = server.RunSSERequest(appName="app", userId="u1", sessionId="usage-1", streaming=False,
+                                   bypassCache=True, newMessage={"role": "user", "parts": [{"text": "Oi"}]})
+
+    result, _ = asyncio.run(server.execute_turn(request))
+    assert result["usage"]["source"] == "model"
+    assert result["usage"]["totalTokenCount"] == 10
+    assert ledger.report(5)["totals"]["totalTokenCount"] == 10
+    assert server.local_store.get_session("usage-1")["usage"]["totalTokenCount"] == 10
@@ -0,0 +1,133 @@
+"""Fila write-behind: agrupamento em lotes, flush e fallback em falhas."""
+import asyncio
+
+from write_behind import WriteBehindQueue, WriteOp
+
+
+def _group(session_id, count):
+    return [WriteOp(kind="set", path=("sessions", session_id, "messages", str(i)), data={"i": i})
+            for i in range(count)]
+
+
+class Recorder:
+    def __init__(self, fail_times=0):
+        self.batches = []
+        self.failed = []
+        self.fail_times = fail_times
+
+    async def commit(self, ops):
+        if self.fail_times:
+            self.fail_times -= 1
+            raise RuntimeError("Firestore indisponível")
+        self.batches.append([op.path[1] for op in ops])
+
+    async def on_error(self, ops, error):
+        self.failed.append(([op.path[1] for op in ops], str(error)))
+
+
+def test_groups_from_several_sessions_share_a_batch_on_the_interval():
+    async def scenario():
+        recorder = Recorder()
+        queue = WriteBehindQueue(recorder.commit, recorder.on_error, max_batch_ops=100, flush_interval=0.05)
+        queue.submit(_group("s1", 2))
+        queue.submit(_group("s2", 3))
+        assert queue.pending_ops == 5
+        await asyncio.sleep(0.15)
+        await queue.stop()
+        return recorder, queue
+
+    recorder, queue = asyncio.run(scenario())
+    assert recorder.batches == [["s1", "s1", "s2", "s2", "s2"]]
+    assert queue.pending_ops == 0
+    assert queue.stats["committed_ops"] == 5
+
+
+def test_reaching_max_batch_ops_flushes_before_the_interval():
+    async def scenario():
+        recorder = Recorder()
+        queue = WriteBehindQueue(recorder.commit, max_batch_ops=4, flush_interval=10)
+        queue.submit(_group("s1", 2))
+        await asyncio.sleep(0.02)
+        assert recorder.batches == []
+        queue.submit(_group("s2", 2))
+        await asyncio.sleep(0.02)
+        batches = list(recorder.batches)
+        await queue.stop()
+        return batches
+
+    assert asyncio.run(scenario()) == [["s1", "s1", "s2", "s2"]]
+
+
+def test_a_turn_group_is_never_split_between_batches():
+    async def scenario():
+        recorder = Recorder()
+        queue = WriteBehindQueue(recorder.commit, max_batch_ops=4, flush_interval=10)
+        queue.submit(_group("s1", 3))
+        queue.submit(_group("s2", 3))
+        queue.submit(_group("big", 6))
+        await queue.flush()
+        await queue.stop()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    # Um grupo maior que o limite vai sozinho em vez de ser dividido
+    assert recorder.batches == [["s1"] * 3, ["s2"] * 3, ["big"] * 6]
+
+
+def test_stop_flushes_pending_writes():
+    async def scenario():
+        recorder = Recorder()
+        queue = WriteBehindQueue(recorder.commit, max_batch_ops=100, flush_interval=10)
+        queue.submit(_group("s1", 2))
+        await queue.stop()
+        return recorder
+
+    assert asyncio.run(scenario()).batches == [["s1", "s1"]]
+
+
+def test_failed_batch_goes_to_the_fallback_and_the_queue_keeps_going():
+    async def scenario():
+        recorder = Recorder(fail_times=1)
+        queue = WriteBehindQueue(recorder.commit, recorder.on_error, max_batch_ops=100, flush_interval=0.02)
+        queue.submit(_group("s1", 2))
+        await asyncio.sleep(0.08)
+        queue.submit(_group("s2", 1))
+        await asyncio.sleep(0.08)
+        await queue.stop()
+        return recorder, queue
+
+    recorder, queue = asyncio.run(scenario())
+    assert recorder.failed == [(["s1", "s1"], "Firestore indisponível")]
+    assert recorder.batches == [["s2"]]
+    assert queue.stats["failed_batches"] == 1
+    assert queue.stats["committed_batches"] == 1
+
+
+def test_fallback_errors_do_not_stop_the_flusher():
+    async def scenario():
+        recorder = Recorder(fail_times=1)
+
+        async def broken_fallback(ops, error):
+            raise RuntimeError("fallback quebrado")
+
+        queue = WriteBehindQueue(recorder.commit, broken_fallback, max_batch_ops=100, flush_interval=0.02)
+        queue.submit(_group("s1", 1))
+        await asyncio.sleep(0.08)
+        queue.submit(_group("s2", 1))
+        await asyncio.sleep(0.08)
+        await queue.stop()
+        return recorder
+
+    assert asyncio.run(scenario()).batches == [["s2"]]
+
+
+def test_empty_submit_is_ignored():
+    async def scenario():
+        recorder = Recorder()
+        queue = WriteBehindQueue(recorder.commit, flush_interval=10)
+        queue.submit([])
+        await queue.stop()
+        return recorder, queue
+
+    recorder, queue = asyncio.run(scenario())
+    assert recorder.batches == [] and queue.stats["submitted_groups"] == 0
@@ -0,0 +1,61 @@
+"""WebSocket ``/ws``: autenticação e frames fora do protocolo."""
+import pytest
+from starlette.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+import server
+
+API_KEY = "chave-teste"
+
+
+@pytest.fixture
+def client():
+    return TestClient(server.app)
+
+
+@pytest.fixture
+def api_key(monkeypatch):
+    monkeypatch.setattr(server, "API_KEY", API_KEY)
+
+
+def test_binary_frame_closes_with_unsupported_data(client):
+    with client.websocket_connect("/ws") as ws:
+        ws.send_bytes(b"\x00\x01")
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1003
+
+
+def test_invalid_json_keeps_the_connection_open(client):
+    with client.websocket_connect("/ws") as ws:
+        ws.send_text("{nao é json")
+        assert ws.receive_json() == {"type": "error", "status": 400, "detail": "Mensagem JSON inválida"}
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+
+def test_header_api_key(client, api_key):
+    with client.websocket_connect("/ws", headers={"X-API-Key": API_KEY}) as ws:
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+    with pytest.raises(WebSocketDisconnect) as closed:
+        with client.websocket_connect("/ws", headers={"X-API-Key": "errada"}):
+            pass
+    assert closed.value.code == 1008
+
+
+def test_auth_message(client, api_key):
+    with client.websocket_connect("/ws") as ws:
+        ws.send_json({"type": "auth", "apiKey": API_KEY})
+        assert ws.receive_json() == {"type": "authenticated"}
+        ws.send_json({"type": "ping"})
+        assert ws.receive_json() == {"type": "pong"}
+
+
+def test_query_param_api_key_is_not_accepted(client, api_key):
+    with client.websocket_connect(f"/ws?apiKey={API_KEY}") as ws:
+        ws.send_json({"type": "ping"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            ws.receive_json()
+    assert closed.value.code == 1008
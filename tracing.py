@@ -0,0 +1,229 @@
+"""Spans por requisição, exportados no formato OTLP/JSON do OpenTelemetry.
+
+Cada turno do ``/run_sse`` abre um span raiz (``start_trace``); as etapas do
+pipeline (leituras do Firestore, sessão do ADK, execução de cada agente,
+persistência) viram spans filhos do span corrente, propagado por
+``contextvars`` para as tasks e geradores assíncronos criados dentro dele.
+Ao terminar o span raiz o trace inteiro é exportado como uma linha
+``ExportTraceServiceRequest`` (formato do file exporter do OTel Collector)
+para ``stdout`` ou para um arquivo.
+
+Com ``TRACE_EXPORTER=none`` (padrão) apenas os ids são gerados, para o header
+``X-Trace-Id`` e o evento ``done``; nenhum span filho é registrado.
+"""
+import contextvars
+import json
+import logging
+import os
+import re
+import secrets
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("practia.tracing")
+
+# Configurações
+# "none", "stdout" ou "file"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "none").lower()
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "traces.jsonl")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "luminus-backend")
+# Máximo de spans guardados por trace (o excedente é descartado)
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "500"))
+
+SPAN_KIND_INTERNAL = 1
+SPAN_KIND_SERVER = 2
+SPAN_KIND_CLIENT = 3
+
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}$")
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+def _attribute_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+class _Trace:
+    def __init__(self, trace_id: str, recording: bool):
+        self.trace_id = trace_id
+        self.recording = recording
+        self.spans: List["Span"] = []
+        self.root: Optional["Span"] = None
+        self.exported = False
+
+
+class Span:
+    """Um span; use ``end()`` ou os context managers ``span``/``use_span``."""
+
+    def __init__(self, trace: _Trace, name: str, parent_span_id: Optional[str] = None,
+                 kind: int = SPAN_KIND_INTERNAL, attributes: Optional[Dict[str, Any]] = None,
+                 start_time: Optional[float] = None):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_span_id = parent_span_id
+        self.name = name
+        self.kind = kind
+        self.attributes: Dict[str, Any] = {key: value for key, value in (attributes or {}).items() if value is not None}
+        self.start_time = start_time if start_time is not None else time.time()
+        self.end_time: Optional[float] = None
+        self.status_code = 0
+        self.status_message = ""
+
+    @property
+    def trace_id(self) -> str:
+        return self.trace.trace_id
+
+    @property
+    def traceparent(self) -> str:
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def set_attribute(self, key: str, value: Any):
+        if value is not None:
+            self.attributes[key] = value
+
+    def set_error(self, error: Any):
+        self.status_code = STATUS_ERROR
+        self.status_message = str(error)
+
+    def end(self, end_time: Optional[float] = None):
+        if self.end_time is not None:
+            return
+        self.end_time = end_time if end_time is not None else time.time()
+        trace = self.trace
+        if not trace.recording:
+            return
+        if trace.exported:
+            # Span que terminou depois do raiz: exportado sozinho
+            _export([self])
+        elif len(trace.spans) < TRACE_MAX_SPANS:
+            trace.spans.append(self)
+        if self is trace.root:
+            trace.exported = True
+            _export(trace.spans)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        data = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": self.kind,
+            "startTimeUnixNano": str(int(self.start_time * 1e9)),
+            "endTimeUnixNano": str(int((self.end_time or time.time()) * 1e9)),
+            "attributes": [{"key": key, "value": _attribute_value(value)} for key, value in self.attributes.items()],
+            "status": {"code": self.status_code, **({"message": self.status_message} if self.status_message else {})},
+        }
+        if self.parent_span_id:
+            data["parentSpanId"] = self.parent_span_id
+        return data
+
+
+def start_trace(name: str, traceparent: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None) -> Span:
+    """Cria o span raiz de uma requisição.
+
+    Com um header W3C ``traceparent`` válido o trace continua o do chamador.
+    O span não vira o corrente: use ``use_span`` no trecho que ele cobre.
+    """
+    parent_span_id = None
+    match = _TRACEPARENT.match((traceparent or "").strip().lower())
+    if match:
+        trace_id, parent_span_id = match.groups()
+    else:
+        trace_id = secrets.token_hex(16)
+    trace = _Trace(trace_id, recording=TRACE_EXPORTER in ("stdout", "file"))
+    root = Span(trace, name, parent_span_id, kind=SPAN_KIND_SERVER, attributes=attributes)
+    trace.root = root
+    return root
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def attach(span: Optional[Span]) -> contextvars.Token:
+    """Torna ``span`` o corrente até ``detach`` (como ``context.attach`` do OTel)"""
+    return _current_span.set(span)
+
+
+def detach(token: contextvars.Token):
+    _current_span.reset(token)
+
+
+@contextmanager
+def use_span(span: Optional[Span]):
+    """Torna ``span`` o corrente no bloco, sem encerrá-lo"""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+def start_span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL,
+               start_time: Optional[float] = None) -> Optional[Span]:
+    """Span filho do corrente; ``None`` fora de um trace ou sem exportador configurado"""
+    parent = _current_span.get()
+    if parent is None or not parent.trace.recording:
+        return None
+    return Span(parent.trace, name, parent.span_id, kind=kind, attributes=attributes, start_time=start_time)
+
+
+@contextmanager
+def span(name: str, attributes: Optional[Dict[str, Any]] = None, kind: int = SPAN_KIND_INTERNAL):
+    """Span filho do corrente cobrindo o bloco (registra exceções como erro)"""
+    child = start_span(name, attributes, kind)
+    if child is None:
+        yield None
+        return
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.set_error(e.__class__.__name__ if not str(e) else e)
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end()
+
+
+def record_span(name: str, start_time: float, end_time: float, attributes: Optional[Dict[str, Any]] = None):
+    """Registra um span já concluído (ex.: execução de um agente medida pelos eventos)"""
+    child = start_span(name, attributes, start_time=start_time)
+    if child is not None:
+        child.end(end_time)
+
+
+_export_lock = threading.Lock()
+
+
+def _export(spans: List[Span]):
+    if not spans:
+        return
+    payload = {
+        "resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": TRACE_SERVICE_NAME}}]},
+            "scopeSpans": [{"scope": {"name": "luminus"}, "spans": [s.to_otlp() for s in spans]}],
+        }]
+    }
+    line = json.dumps(payload, ensure_ascii=False, separators=(",", ":")) + "\n"
+    try:
+        with _export_lock:
+            if TRACE_EXPORTER == "file":
+                with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+                    f.write(line)
+            else:
+                sys.stdout.write(line)
+                sys.stdout.flush()
+    except Exception as e:
+        logger.warning(f"[tracing] Falha ao exportar trace {spans[0].trace_id}: {e}")
@@ -0,0 +1,68 @@
+"""Consolidação em memória do uso de tokens reportado pelo modelo.
+
+Acumula, por processo, o total por agente (especialista) e guarda os turnos
+mais caros, para responder "quais especialistas e prompts consomem mais".
+O histórico persistente fica nos documentos do Firestore (``usage`` da sessão
+e de cada mensagem do assistente).
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from agent_runtime import USAGE_FIELDS, add_usage
+
+# Quantidade de turnos mais caros mantidos e tamanho do trecho do prompt guardado
+USAGE_TOP_TURNS = int(os.getenv("USAGE_TOP_TURNS", "100"))
+USAGE_PROMPT_PREVIEW = 200
+
+
+class UsageLedger:
+    """Totais de tokens por agente e os turnos mais caros."""
+
+    def __init__(self, top_turns: int = USAGE_TOP_TURNS):
+        self.top_turns = top_turns
+        self.turns = 0
+        self.totals: Optional[Dict[str, int]] = None
+        self._agents: Dict[str, Dict[str, Any]] = {}
+        # min-heap por totalTokenCount: a raiz é o turno mais barato entre os mantidos
+        self._top: List[tuple] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def record(self, session_id: str, user_id: str, prompt: str, usage: Dict[str, Any]):
+        """Registra o uso de um turno (``usage`` no formato de ``turn_usage``)"""
+        entry = {
+            "sessionId": session_id,
+            "userId": user_id,
+            "prompt": prompt[:USAGE_PROMPT_PREVIEW],
+            "usage": usage,
+            "timestamp": time.time(),
+        }
+        with self._lock:
+            self.turns += 1
+            self.totals = add_usage(self.totals, usage)
+            for agent, agent_usage in (usage.get("byAgent") or {}).items():
+                stats = self._agents.setdefault(agent, {"agent": agent, "runs": 0, **{key: 0 for key in USAGE_FIELDS}})
+                stats["runs"] += 1
+                for key in USAGE_FIELDS:
+                    stats[key] += agent_usage.get(key, 0)
+            item = (usage.get("totalTokenCount", 0), next(self._seq), entry)
+            if len(self._top) < self.top_turns:
+                heapq.heappush(self._top, item)
+            elif item[0] > self._top[0][0]:
+                heapq.heapreplace(self._top, item)
+
+    def report(self, limit: int = 10) -> Dict[str, Any]:
+        """Agentes e turnos ordenados do mais caro para o mais barato"""
+        with self._lock:
+            agents = sorted(self._agents.values(), key=lambda stats: stats["totalTokenCount"], reverse=True)
+            top = heapq.nlargest(limit, self._top)
+            return {
+                "turns": self.turns,
+                "totals": self.totals or {key: 0 for key in USAGE_FIELDS},
+                "byAgent": [dict(stats) for stats in agents[:limit]],
+                "topTurns": [entry for _, _, entry in top],
+            }
@@ -0,0 +1,42 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from firebase_config import initialize_firebase
+
+
+def backfill_deleted_flag(batch_size: int = 400):
+    """
+    Sets `deleted: false` on session documents that predate the field.
+
+    GET /sessions filters with `where('deleted', '==', False)` on the server, and
+    Firestore never matches documents where the field is missing.
+    """
+    db = initialize_firebase()
+    if not db:
+        print("Error: Firestore is not available.")
+        return
+
+    updated = 0
+    batch = db.batch()
+    pending = 0
+    for doc in db.collection('sessions').stream():
+        data = doc.to_dict() or {}
+        if 'deleted' in data:
+            continue
+        batch.update(doc.reference, {'deleted': False})
+        pending += 1
+        if pending >= batch_size:
+            batch.commit()
+            updated += pending
+            batch = db.batch()
+            pending = 0
+    if pending:
+        batch.commit()
+        updated += pending
+    print(f"Sessions updated: {updated}")
+
+
+if __name__ == "__main__":
+    backfill_deleted_flag()
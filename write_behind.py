@@ -0,0 +1,127 @@
+"""Fila write-behind para persistência em lote.
+
+As escritas de um turno de chat são enfileiradas como um grupo e gravadas em
+segundo plano. Um flusher agrupa os grupos de várias sessões em um único
+``WriteBatch`` até ``max_batch_ops`` operações ou ``flush_interval`` segundos,
+o que ocorrer primeiro. Um grupo nunca é dividido entre dois lotes.
+"""
+import asyncio
+import logging
+import os
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger("practia.write_behind")
+
+# Limite do Firestore é 500 operações por WriteBatch
+WRITE_BEHIND_MAX_BATCH_OPS = int(os.getenv("WRITE_BEHIND_MAX_BATCH_OPS", "450"))
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.25"))
+
+
+@dataclass
+class WriteOp:
+    """Uma escrita de documento: ``set`` (opcionalmente com merge) ou ``update``."""
+    kind: str
+    path: Tuple[str, ...]
+    data: Dict[str, Any]
+    merge: bool = False
+    # Aplicado (await) quando o lote não pôde ser gravado (fallback no armazenamento local)
+    fallback: Optional[Callable[[], Awaitable[Any]]] = field(default=None, repr=False)
+
+
+class WriteBehindQueue:
+    """Fila de grupos de escrita com flush por tamanho, por tempo e no shutdown."""
+
+    def __init__(
+        self,
+        commit: Callable[[List[WriteOp]], Awaitable[None]],
+        on_error: Optional[Callable[[List[WriteOp], Exception], Awaitable[None]]] = None,
+        max_batch_ops: int = WRITE_BEHIND_MAX_BATCH_OPS,
+        flush_interval: float = WRITE_BEHIND_FLUSH_INTERVAL,
+    ):
+        self._commit = commit
+        self._on_error = on_error
+        self.max_batch_ops = max_batch_ops
+        self.flush_interval = flush_interval
+        self._groups: List[List[WriteOp]] = []
+        self._pending_ops = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self.stats = {"submitted_groups": 0, "committed_batches": 0, "committed_ops": 0, "failed_batches": 0}
+
+    @property
+    def pending_ops(self) -> int:
+        return self._pending_ops
+
+    def submit(self, ops: List[WriteOp]):
+        """Enfileira as escritas de um turno (não bloqueia)"""
+        if not ops:
+            return
+        self._ensure_started()
+        self._groups.append(list(ops))
+        self._pending_ops += len(ops)
+        self.stats["submitted_groups"] += 1
+        if self._pending_ops >= self.max_batch_ops:
+            self._wakeup.set()
+
+    async def start(self):
+        self._ensure_started()
+
+    async def stop(self):
+        """Interrompe o flusher e grava tudo que estiver pendente"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        """Grava imediatamente todos os grupos pendentes"""
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            while self._groups:
+                batch: List[WriteOp] = []
+                while self._groups and (not batch or len(batch) + len(self._groups[0]) <= self.max_batch_ops):
+                    group = self._groups.pop(0)
+                    batch.extend(group)
+                self._pending_ops -= len(batch)
+                await self._commit_batch(batch)
+
+    async def _commit_batch(self, batch: List[WriteOp]):
+        try:
+            await self._commit(batch)
+            self.stats["committed_batches"] += 1
+            self.stats["committed_ops"] += len(batch)
+        except Exception as e:
+            self.stats["failed_batches"] += 1
+            logger.error(f"[write-behind] Falha ao gravar lote com {len(batch)} operações: {e}")
+            if self._on_error is not None:
+                try:
+                    await self._on_error(batch, e)
+                except Exception as fallback_error:
+                    logger.error(f"[write-behind] Falha no fallback do lote: {fallback_error}")
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self._task = loop.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if self._groups:
+                await self.flush()
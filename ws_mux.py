@@ -0,0 +1,112 @@
+"""Multiplexação de turnos do chat sobre uma conexão WebSocket (``/ws``).
+
+Um cliente abre uma única conexão e inicia nela vários streams, cada um com
+um ``streamId`` escolhido por ele e uma requisição no formato do ``/run_sse``
+(qualquer ``sessionId``). Os turnos são os mesmos do ``/run_sse``
+(``InflightTurn``): a conexão só acompanha os frames publicados pela task de
+execução, então deduplicação, retomada com ``lastEventId``, admissão e
+persistência são compartilhadas.
+
+Autenticação (com ``LUMINUS_API_KEY``): header ``X-API-Key`` no handshake ou,
+em navegadores (que não enviam headers no WebSocket), uma primeira mensagem
+``{"type": "auth", "apiKey": "..."}`` em até ``WS_AUTH_TIMEOUT`` segundos,
+respondida com ``{"type": "authenticated"}``. Chave inválida fecha com 1008.
+
+Mensagens do cliente (JSON em frames de texto; frames binários fecham a conexão com 1003):
+
+- ``{"type": "run", "streamId": "...", "request": {...}, "lastEventId": "...", "window": 32}``
+- ``{"type": "credit", "streamId": "...", "frames": N}``: libera mais N eventos
+- ``{"type": "cancel", "streamId": "..."}``: encerra o stream; sem outros clientes no turno, cancela a execução
+- ``{"type": "ping"}``
+
+Mensagens do servidor:
+
+- ``{"type": "started", "streamId": "...", "headers": {...}}``
+- ``{"type": "event", "streamId": "...", "id": "<invocationId>:<seq>", "data": {...}}`` (o payload do frame SSE)
+- ``{"type": "end", "streamId": "...", "reason": "done" | "cancelled"}``
+- ``{"type": "error", "streamId": "...", "status": 4xx/5xx, "detail": "...", "retryAfter": N}``
+- ``{"type": "pong"}``
+
+Controle de fluxo por stream: cada stream começa com ``window`` créditos
+(``WS_STREAM_WINDOW``) e cada evento enviado consome um. Sem créditos o envio
+daquele stream pausa (os demais seguem) enquanto a execução continua
+publicando no buffer do turno; se o cliente ficar para trás além do buffer,
+recebe um evento ``gap``.
+"""
+import asyncio
+import json
+import os
+from typing import Any, Dict, Optional, Tuple
+
+from sse import encode_json
+
+# Configurações
+# Créditos iniciais (eventos) de cada stream e máximo que o cliente pode acumular
+WS_STREAM_WINDOW = int(os.getenv("WS_STREAM_WINDOW", "64"))
+WS_MAX_CREDIT = int(os.getenv("WS_MAX_CREDIT", "4096"))
+# Streams simultâneos por conexão
+WS_MAX_STREAMS = int(os.getenv("WS_MAX_STREAMS", "16"))
+# Segundos para a mensagem de autenticação quando a API key não veio no header
+WS_AUTH_TIMEOUT = float(os.getenv("WS_AUTH_TIMEOUT", "10"))
+
+
+class StreamCredit:
+    """Créditos de envio de um stream (controle de fluxo do lado do cliente)."""
+
+    def __init__(self, window: int = WS_STREAM_WINDOW):
+        self.available = max(1, min(window, WS_MAX_CREDIT))
+        self._granted = asyncio.Event()
+
+    def grant(self, frames: int):
+        if frames <= 0:
+            return
+        self.available = min(self.available + frames, WS_MAX_CREDIT)
+        self._granted.set()
+
+    async def acquire(self):
+        while self.available <= 0:
+            self._granted.clear()
+            await self._granted.wait()
+        self.available -= 1
+
+
+def split_frame(frame: bytes) -> Tuple[Optional[bytes], bytes]:
+    """``(id, data)`` de um frame SSE ``[id: ...\\n]data: ...\\n\\n`` (sem decodificar o JSON)"""
+    event_id = None
+    if frame.startswith(b"id: "):
+        line_end = frame.index(b"\n")
+        event_id = frame[4:line_end]
+        frame = frame[line_end + 1:]
+    return event_id, frame[len(b"data: "):].rstrip(b"\n")
+
+
+def event_message(stream_id: str, frame: bytes) -> str:
+    """Mensagem ``event`` de um frame SSE, montada sem reserializar o payload"""
+    event_id, data = split_frame(frame)
+    message = b'{"type":"event","streamId":' + encode_json(stream_id)
+    if event_id is not None:
+        message += b',"id":' + encode_json(event_id.decode("utf-8"))
+    return (message + b',"data":' + data + b"}").decode("utf-8")
+
+
+class UnsupportedFrame(Exception):
+    """Frame binário: o protocolo só usa JSON em frames de texto"""
+
+
+def parse_client_message(message: Dict[str, Any]) -> Any:
+    """JSON de uma mensagem ``websocket.receive`` do ASGI.
+
+    Levanta ``UnsupportedFrame`` para frames binários e ``ValueError`` para JSON inválido.
+    """
+    text = message.get("text")
+    if text is None:
+        raise UnsupportedFrame()
+    return json.loads(text)
+
+
+def control_message(kind: str, stream_id: Optional[str] = None, **fields: Any) -> Dict[str, Any]:
+    message: Dict[str, Any] = {"type": kind}
+    if stream_id is not None:
+        message["streamId"] = stream_id
+    message.update({key: value for key, value in fields.items() if value is not None})
+    return message